@@ -9,6 +9,8 @@ from sqlalchemy import pool
 
 from alembic import context
 
+from app.db.models import Base
+
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
@@ -18,25 +20,23 @@ config = context.config
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
-# add your model's MetaData object here
-# for 'autogenerate' support
-# from myapp import mymodel
-# target_metadata = mymodel.Base.metadata
-target_metadata = None
+# the models, for 'autogenerate' support
+target_metadata = Base.metadata
 
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
 # ... etc.
 
-# Read from environment variable
+# Read from environment variable, unless a connection is passed in (see run_migrations_online)
 DATABASE_URL = os.environ.get("DATABASE_URL")
 
-if DATABASE_URL is None:
+if DATABASE_URL is None and "connection" not in config.attributes:
     raise RuntimeError("DATABASE_URL environment variable not set")
 
 # Set the url in Alembic config
-config.set_main_option("sqlalchemy.url", DATABASE_URL)
+if DATABASE_URL is not None:
+    config.set_main_option("sqlalchemy.url", DATABASE_URL)
 
 
 def run_migrations_offline() -> None:
@@ -68,8 +68,17 @@ def run_migrations_online() -> None:
 
     In this scenario we need to create an Engine
     and associate a connection with the context.
+    A connection can also be given through
+    config.attributes["connection"], as the tests do.
 
     """
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        context.configure(connection=connection, target_metadata=target_metadata)
+        with context.begin_transaction():
+            context.run_migrations()
+        return
+
     connectable = engine_from_config(
         config.get_section(config.config_ini_section, {}),
         prefix="sqlalchemy.",
@@ -10,7 +10,7 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db_session: Session = Depends(db.get_db)
+    db_session: Session = Depends(db.get_db, scope="function")
 ):
     """
     Get user by token
@@ -23,7 +23,7 @@ router = APIRouter()
 # ==================== POST ====================
 
 @router.post("/register")
-def register_user(rf: RegisterForm, db: Session = Depends(database.get_db)):
+def register_user(rf: RegisterForm, db: Session = Depends(database.get_db, scope="function")):
     """Register a user"""
     hashed_password = bcrypt.hashpw(rf.password.encode("utf-8"), bcrypt.gensalt())
 
@@ -38,7 +38,7 @@ def register_user(rf: RegisterForm, db: Session = Depends(database.get_db)):
 
 
 @router.post("/login")
-def login_user(lf: LoginForm, response: Response, db: Session = Depends(database.get_db)):
+def login_user(lf: LoginForm, response: Response, db: Session = Depends(database.get_db, scope="function")):
     user = database.get_user_by_username(db=db, username=lf.username)
     if not user or not utils.check_password(hashed_password=user.hashed_password, password=lf.password):
         raise HTTPException(status_code=400, detail="Incorrect username or password")
@@ -60,7 +60,7 @@ def login_user(lf: LoginForm, response: Response, db: Session = Depends(database
 
 @router.post("/refresh", response_model=Token)
 def refresh_access_token(
-    db: Session = Depends(database.get_db),
+    db: Session = Depends(database.get_db, scope="function"),
     refresh_token: str | None = Cookie(default=None)
 ):
     if not refresh_token:
@@ -90,7 +90,7 @@ def refresh_access_token(
 @router.post("/logout")
 def logout_user(
     response: Response,
-    db: Session = Depends(database.get_db),
+    db: Session = Depends(database.get_db, scope="function"),
     refresh_token: str | None = Cookie(default=None),
 ):
     if not refresh_token:
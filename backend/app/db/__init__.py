@@ -1,3 +1,4 @@
 from .crud import *
-from .database import get_db, init_db as init
+from . import async_crud
+from .database import close_async_db, get_async_db, get_db, init_db as init
 from .models import *
\ No newline at end of file
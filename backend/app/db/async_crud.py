@@ -0,0 +1,361 @@
+"""
+Awaitable equivalents of the functions in crud.py, on an AsyncSession. Like those
+they only stage changes, the caller commits (see get_async_db).
+
+For the async routes: a query awaits the database instead of blocking the event
+loop, and with it every WebSocket of the worker. The batch writes (of the live
+sessions and of whole quizzes) and the score increments share their implementation
+with crud.py through AsyncSession.run_sync.
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, desc, select
+from typing import Optional
+from datetime import datetime, UTC
+
+from app.db import crud
+from app.db.crud import generate_session_code, grade_answer
+from app.db.models import (
+    User, Quiz, Question, Session as SessionModel,
+    Participant, Answer, SessionStatus, QuestionType, RefreshToken
+)
+
+
+# ==================== USER CRUD ====================
+
+async def create_user(db: AsyncSession, username: str, email: str, hashed_password: str) -> User:
+    user = User(username=username, email=email, hashed_password=hashed_password)
+    db.add(user)
+    await db.flush()
+    return user
+
+
+async def get_user_by_id(db: AsyncSession, user_id: int) -> Optional[User]:
+    stmt = select(User).where(User.id == user_id)
+    return (await db.scalars(stmt)).first()
+
+
+async def get_user_by_username(db: AsyncSession, username: str) -> Optional[User]:
+    stmt = select(User).where(User.username == username)
+    return (await db.scalars(stmt)).first()
+
+
+async def get_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
+    stmt = select(User).where(User.email == email)
+    return (await db.scalars(stmt)).first()
+
+# ==================== TOKEN CRUD ====================
+
+async def add_refresh_token(db: AsyncSession, user_id: int, token: str, expires_at: datetime) -> Optional[RefreshToken]:
+    token = RefreshToken(user_id=user_id, token=token, expires_at=expires_at)
+    db.add(token)
+    await db.flush()
+    return token
+
+async def get_refresh_token_by_token(db: AsyncSession, token: str) -> Optional[RefreshToken]:
+    stmt = select(RefreshToken).where(RefreshToken.token == token)
+    return (await db.scalars(stmt)).first()
+
+async def revoke_refresh_token(db: AsyncSession, token: str) -> Optional[RefreshToken]:
+    rt = await get_refresh_token_by_token(db, token)
+    if not rt:
+        return None
+
+    rt.revoked = True
+    await db.flush()
+    return rt
+
+
+# ==================== QUIZ CRUD ====================
+
+async def create_quiz(db: AsyncSession, title: str, description: str, creator_id: int) -> Quiz:
+    quiz = Quiz(title=title, description=description, creator_id=creator_id)
+    db.add(quiz)
+    await db.flush()
+    return quiz
+
+
+async def get_quiz_by_id(db: AsyncSession, quiz_id: int) -> Optional[Quiz]:
+    stmt = select(Quiz).where(Quiz.id == quiz_id)
+    return (await db.scalars(stmt)).first()
+
+
+async def get_quizzes_by_user(db: AsyncSession, user_id: int) -> list[Quiz]:
+    stmt = select(Quiz).where(Quiz.creator_id == user_id).order_by(desc(Quiz.created_at))
+    return (await db.scalars(stmt)).all()
+
+
+async def update_quiz(db: AsyncSession, quiz_id: int, title: str = None, description: str = None, is_published: bool = None) -> Optional[Quiz]:
+    quiz = await get_quiz_by_id(db, quiz_id)
+    if not quiz:
+        return None
+
+    if title is not None:
+        quiz.title = title
+    if description is not None:
+        quiz.description = description
+    if is_published is not None:
+        quiz.is_published = is_published
+
+    await db.flush()
+    return quiz
+
+
+async def delete_quiz(db: AsyncSession, quiz_id: int) -> bool:
+    quiz = await get_quiz_by_id(db, quiz_id)
+    if not quiz:
+        return False
+
+    await db.delete(quiz)
+    await db.flush()
+    return True
+
+
+# ==================== QUESTION CRUD ====================
+
+async def create_question(
+    db: AsyncSession,
+    quiz_id: int,
+    content: str,
+    question_type: QuestionType,
+    order: int,
+    options: str = None,
+    correct_answer: str = None,
+    media_url: str = None,
+    media_type: str = None,
+    points: int = 10,
+    time_limit: int = 30
+) -> Question:
+    question = Question(
+        quiz_id=quiz_id,
+        order=order,
+        type=question_type,
+        content=content,
+        options=options,
+        correct_answer=correct_answer,
+        media_url=media_url,
+        media_type=media_type,
+        points=points,
+        time_limit=time_limit
+    )
+    db.add(question)
+    await db.flush()
+    return question
+
+
+async def create_quiz_with_questions(
+    db: AsyncSession,
+    title: str,
+    description: str,
+    creator_id: int,
+    questions: list[dict]
+) -> tuple[Quiz, list[Question]]:
+    """Create a quiz and all its questions, see crud.create_quiz_with_questions"""
+    return await db.run_sync(crud.create_quiz_with_questions, title, description, creator_id, questions)
+
+
+async def replace_questions(db: AsyncSession, quiz_id: int, questions: list[dict]) -> Optional[list[Question]]:
+    """Make the questions of a quiz the given list, see crud.replace_questions"""
+    return await db.run_sync(crud.replace_questions, quiz_id, questions)
+
+
+async def get_question_by_id(db: AsyncSession, question_id: int) -> Optional[Question]:
+    stmt = select(Question).where(Question.id == question_id)
+    return (await db.scalars(stmt)).first()
+
+
+async def get_questions_by_quiz(db: AsyncSession, quiz_id: int) -> list[Question]:
+    stmt = select(Question).where(Question.quiz_id == quiz_id).order_by(Question.order)
+    return (await db.scalars(stmt)).all()
+
+
+async def update_question(db: AsyncSession, question_id: int, **kwargs) -> Optional[Question]:
+    question = await get_question_by_id(db, question_id)
+    if not question:
+        return None
+
+    for key, value in kwargs.items():
+        if value is not None and hasattr(question, key):
+            setattr(question, key, value)
+
+    await db.flush()
+    return question
+
+
+async def delete_question(db: AsyncSession, question_id: int) -> bool:
+    question = await get_question_by_id(db, question_id)
+    if not question:
+        return False
+
+    await db.delete(question)
+    await db.flush()
+    return True
+
+
+# ==================== SESSION CRUD ====================
+
+async def create_session(db: AsyncSession, quiz_id: int, host_id: int) -> SessionModel:
+    code = generate_session_code()
+    while (await db.scalars(select(SessionModel).where(SessionModel.code == code))).first():
+        code = generate_session_code()
+
+    session = SessionModel(
+        quiz_id=quiz_id,
+        host_id=host_id,
+        code=code,
+        status=SessionStatus.WAITING
+    )
+    db.add(session)
+    await db.flush()
+    return session
+
+
+async def get_session_by_code(db: AsyncSession, code: str) -> Optional[SessionModel]:
+    stmt = select(SessionModel).where(SessionModel.code == code)
+    return (await db.scalars(stmt)).first()
+
+
+async def get_session_by_id(db: AsyncSession, session_id: int) -> Optional[SessionModel]:
+    stmt = select(SessionModel).where(SessionModel.id == session_id)
+    return (await db.scalars(stmt)).first()
+
+
+async def start_session(db: AsyncSession, session_id: int) -> Optional[SessionModel]:
+    session = await get_session_by_id(db, session_id)
+    if not session:
+        return None
+
+    session.status = SessionStatus.ACTIVE
+    session.started_at = datetime.now(UTC)
+    await db.flush()
+    return session
+
+
+async def end_session(db: AsyncSession, session_id: int) -> Optional[SessionModel]:
+    session = await get_session_by_id(db, session_id)
+    if not session:
+        return None
+
+    session.status = SessionStatus.ENDED
+    session.ended_at = datetime.now(UTC)
+    await db.flush()
+    return session
+
+
+async def update_session_question(db: AsyncSession, session_id: int, question_index: int) -> Optional[SessionModel]:
+    session = await get_session_by_id(db, session_id)
+    if not session:
+        return None
+
+    session.current_question_index = question_index
+    await db.flush()
+    return session
+
+
+# ==================== PARTICIPANT CRUD ====================
+
+async def create_participant(db: AsyncSession, session_id: int, name: str) -> Participant:
+    participant = Participant(session_id=session_id, name=name)
+    db.add(participant)
+    await db.flush()
+    return participant
+
+
+async def get_participant_by_id(db: AsyncSession, participant_id: int) -> Optional[Participant]:
+    stmt = select(Participant).where(Participant.id == participant_id)
+    return (await db.scalars(stmt)).first()
+
+
+async def get_participants_by_session(db: AsyncSession, session_id: int) -> list[Participant]:
+    stmt = select(Participant).where(Participant.session_id == session_id).order_by(Participant.joined_at)
+    return (await db.scalars(stmt)).all()
+
+
+async def update_participant_score(db: AsyncSession, participant_id: int, points_to_add: int) -> Optional[Participant]:
+    """Add points to the score of a participant in one UPDATE, see crud.update_participant_score"""
+    return await db.run_sync(crud.update_participant_score, participant_id, points_to_add)
+
+
+async def add_participant_scores(db: AsyncSession, score_deltas: dict[int, int], session_id: int = None) -> None:
+    """Add points to the scores of many participants in one UPDATE, see crud.add_participant_scores"""
+    await db.run_sync(crud.add_participant_scores, score_deltas, session_id)
+
+
+async def get_session_leaderboard(db: AsyncSession, session_id: int) -> list[Participant]:
+    stmt = select(Participant).where(Participant.session_id == session_id).order_by(desc(Participant.total_score))
+    return (await db.scalars(stmt)).all()
+
+
+# ==================== ANSWER CRUD ====================
+
+async def submit_answer(
+    db: AsyncSession,
+    session_id: int,
+    participant_id: int,
+    question_id: int,
+    answer_text: str,
+    time_taken: float = None
+) -> Answer:
+    question = await get_question_by_id(db, question_id)
+
+    is_correct, score = grade_answer(question, answer_text)
+    if is_correct:
+        await add_participant_scores(db, {participant_id: score}, session_id)
+
+    answer = Answer(
+        session_id=session_id,
+        participant_id=participant_id,
+        question_id=question_id,
+        answer_text=answer_text,
+        is_correct=is_correct,
+        score=score,
+        time_taken=time_taken
+    )
+    db.add(answer)
+    await db.flush()
+    return answer
+
+
+async def save_live_changes(db: AsyncSession, changes: list[dict]) -> None:
+    """Stage the changes of in-memory live sessions, see crud.save_live_changes"""
+    await db.run_sync(crud.save_live_changes, changes)
+
+
+async def get_answer(db: AsyncSession, session_id: int, participant_id: int, question_id: int) -> Optional[Answer]:
+    stmt = select(Answer).where(
+        and_(
+            Answer.session_id == session_id,
+            Answer.participant_id == participant_id,
+            Answer.question_id == question_id
+        )
+    )
+    return (await db.scalars(stmt)).first()
+
+
+async def get_answers_for_session(db: AsyncSession, session_id: int) -> list[Answer]:
+    stmt = select(Answer).where(Answer.session_id == session_id)
+    return (await db.scalars(stmt)).all()
+
+
+async def get_answers_for_question(db: AsyncSession, session_id: int, question_id: int) -> list[Answer]:
+    stmt = select(Answer).where(
+        and_(Answer.session_id == session_id, Answer.question_id == question_id)
+    )
+    return (await db.scalars(stmt)).all()
+
+
+async def score_answer(db: AsyncSession, answer_id: int, score: int) -> Optional[Answer]:
+    stmt = select(Answer).where(Answer.id == answer_id).with_for_update()
+    answer = (await db.scalars(stmt)).first()
+    if not answer:
+        return None
+
+    old_score = answer.score or 0
+    score_diff = score - old_score
+
+    answer.score = score
+    answer.is_correct = score > 0
+
+    await add_participant_scores(db, {answer.participant_id: score_diff}, answer.session_id)
+
+    await db.flush()
+    return answer
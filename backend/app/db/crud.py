@@ -1,5 +1,11 @@
+"""
+The functions only stage their changes in the session. They flush when the caller
+needs generated values, which come back with the INSERT/UPDATE (RETURNING), and
+never commit: the caller commits once, see get_db for the request scope.
+"""
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, desc, select
+from sqlalchemy.orm.util import identity_key
+from sqlalchemy import and_, bindparam, case, delete, desc, func, insert, select, update
 from typing import Optional
 from datetime import datetime, UTC
 import random
@@ -16,8 +22,7 @@ from app.db.models import (
 def create_user(db: Session, username: str, email: str, hashed_password: str) -> User:
     user = User(username=username, email=email, hashed_password=hashed_password)
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    db.flush()
     return user
 
 
@@ -40,8 +45,7 @@ def get_user_by_email(db: Session, email: str) -> Optional[User]:
 def add_refresh_token(db: Session, user_id: int, token: str, expires_at: datetime) -> Optional[RefreshToken]:
     token = RefreshToken(user_id=user_id, token=token, expires_at=expires_at)
     db.add(token)
-    db.commit()
-    db.refresh(token)
+    db.flush()
     return token
 
 def get_refresh_token_by_token(db: Session, token: str) -> Optional[RefreshToken]:
@@ -54,8 +58,7 @@ def revoke_refresh_token(db: Session, token: str) -> Optional[RefreshToken]:
         return None
 
     rt.revoked = True
-    db.commit()
-    db.refresh(rt)
+    db.flush()
     return rt
 
 
@@ -64,8 +67,7 @@ def revoke_refresh_token(db: Session, token: str) -> Optional[RefreshToken]:
 def create_quiz(db: Session, title: str, description: str, creator_id: int) -> Quiz:
     quiz = Quiz(title=title, description=description, creator_id=creator_id)
     db.add(quiz)
-    db.commit()
-    db.refresh(quiz)
+    db.flush()
     return quiz
 
 
@@ -91,8 +93,7 @@ def update_quiz(db: Session, quiz_id: int, title: str = None, description: str =
     if is_published is not None:
         quiz.is_published = is_published
 
-    db.commit()
-    db.refresh(quiz)
+    db.flush()
     return quiz
 
 
@@ -103,7 +104,7 @@ def delete_quiz(db: Session, quiz_id: int) -> bool:
         return False
 
     db.delete(quiz)
-    db.commit()
+    db.flush()
     return True
 
 
@@ -135,11 +136,87 @@ def create_question(
         time_limit=time_limit
     )
     db.add(question)
-    db.commit()
-    db.refresh(question)
+    db.flush()
     return question
 
 
+def create_quiz_with_questions(
+    db: Session,
+    title: str,
+    description: str,
+    creator_id: int,
+    questions: list[dict]
+) -> tuple[Quiz, list[Question]]:
+    """
+    Create a quiz and all its questions, to be committed as one transaction.
+    Each dict holds the arguments of create_question except quiz_id and order, the
+    order is the position in the list. The questions are inserted in one statement.
+    """
+    quiz = create_quiz(db, title=title, description=description, creator_id=creator_id)
+    if not questions:
+        return quiz, []
+
+    rows = [_question_row(quiz.id, order, q) for order, q in enumerate(questions, start=1)]
+    created = list(db.scalars(insert(Question).returning(Question, sort_by_parameter_order=True), rows))
+    return quiz, created
+
+
+def replace_questions(db: Session, quiz_id: int, questions: list[dict]) -> Optional[list[Question]]:
+    """
+    Make the questions of a quiz the given list, in that order, to be committed as one transaction.
+    A dict with an "id" updates that question (its answers are kept), one without adds a question,
+    and questions of the quiz that are not in the list are deleted. Each kind is one statement.
+    Returns None if an id is not a question of the quiz.
+    """
+    existing = set(db.scalars(select(Question.id).where(Question.quiz_id == quiz_id)))
+    kept = {q["id"] for q in questions if q.get("id") is not None}
+    if not kept <= existing:
+        return None
+
+    questions_table = Question.__table__
+    if existing - kept:
+        db.execute(delete(questions_table).where(questions_table.c.id.in_(existing - kept)))
+
+    updates, inserts = [], []
+    for order, q in enumerate(questions, start=1):
+        row = _question_row(quiz_id, order, q)
+        if q.get("id") is not None:
+            updates.append({"question_id": q["id"], **row})
+        else:
+            inserts.append(row)
+    if updates:
+        db.execute(
+            update(questions_table)
+            .where(questions_table.c.id == bindparam("question_id"))
+            .values(updated_at=func.now()),
+            updates
+        )
+    if inserts:
+        db.execute(insert(Question), inserts)
+
+    # The statements bypassed the loaded questions, read them all back as they are now
+    stmt = (
+        select(Question).where(Question.quiz_id == quiz_id).order_by(Question.order)
+        .execution_options(populate_existing=True)
+    )
+    return db.scalars(stmt).all()
+
+
+def _question_row(quiz_id: int, order: int, question: dict) -> dict:
+    return {
+        "quiz_id": quiz_id,
+        "order": order,
+        "type": question["question_type"],
+        "content": question["content"],
+        "options": question.get("options"),
+        "correct_answer": question.get("correct_answer"),
+        "media_url": question.get("media_url"),
+        "media_type": question.get("media_type"),
+        "points": question.get("points", 10),
+        "time_limit": question.get("time_limit", 30),
+    }
+
+
 def get_question_by_id(db: Session, question_id: int) -> Optional[Question]:
     stmt = select(Question).where(Question.id == question_id)
     return db.scalars(stmt).first()
@@ -159,8 +236,7 @@ def update_question(db: Session, question_id: int, **kwargs) -> Optional[Questio
         if value is not None and hasattr(question, key):
             setattr(question, key, value)
 
-    db.commit()
-    db.refresh(question)
+    db.flush()
     return question
 
 
@@ -171,7 +247,7 @@ def delete_question(db: Session, question_id: int) -> bool:
         return False
 
     db.delete(question)
-    db.commit()
+    db.flush()
     return True
 
 
@@ -193,8 +269,7 @@ def create_session(db: Session, quiz_id: int, host_id: int) -> SessionModel:
         status=SessionStatus.WAITING
     )
     db.add(session)
-    db.commit()
-    db.refresh(session)
+    db.flush()
     return session
 
 
@@ -216,8 +291,7 @@ def start_session(db: Session, session_id: int) -> Optional[SessionModel]:
 
     session.status = SessionStatus.ACTIVE
     session.started_at = datetime.now(UTC)
-    db.commit()
-    db.refresh(session)
+    db.flush()
     return session
 
 
@@ -229,8 +303,7 @@ def end_session(db: Session, session_id: int) -> Optional[SessionModel]:
 
     session.status = SessionStatus.ENDED
     session.ended_at = datetime.now(UTC)
-    db.commit()
-    db.refresh(session)
+    db.flush()
     return session
 
 
@@ -240,8 +313,7 @@ def update_session_question(db: Session, session_id: int, question_index: int) -
         return None
 
     session.current_question_index = question_index
-    db.commit()
-    db.refresh(session)
+    db.flush()
     return session
 
 
@@ -250,8 +322,7 @@ def update_session_question(db: Session, session_id: int, question_index: int) -
 def create_participant(db: Session, session_id: int, name: str) -> Participant:
     participant = Participant(session_id=session_id, name=name)
     db.add(participant)
-    db.commit()
-    db.refresh(participant)
+    db.flush()
     return participant
 
 
@@ -266,14 +337,50 @@ def get_participants_by_session(db: Session, session_id: int) -> list[Participan
 
 
 def update_participant_score(db: Session, participant_id: int, points_to_add: int) -> Optional[Participant]:
-    participant = get_participant_by_id(db, participant_id)
-    if not participant:
-        return None
+    """Add points to the score of a participant in one UPDATE ... RETURNING, safe against concurrent grading"""
+    return db.scalars(_increment_score(participant_id, points_to_add)).first()
+
+
+def _increment_score(participant_id: int, points_to_add: int):
+    # total_score = total_score + delta is applied by the database, no read-modify-write in Python.
+    # populate_existing refreshes a participant that is already loaded with the returned row.
+    return (
+        update(Participant)
+        .where(Participant.id == participant_id)
+        .values(total_score=Participant.total_score + points_to_add)
+        .returning(Participant)
+        .execution_options(populate_existing=True)
+    )
 
-    participant.total_score += points_to_add
-    db.commit()
-    db.refresh(participant)
-    return participant
+
+def add_participant_scores(db: Session, score_deltas: dict[int, int], session_id: int = None) -> None:
+    """
+    Add points to the scores of many participants (participant_id -> points) in one UPDATE:
+        total_score = total_score + CASE id WHEN :pid THEN :delta ... END
+    With a session_id only participants of that session are updated.
+    """
+    score_deltas = {pid: delta for pid, delta in score_deltas.items() if delta}
+    if not score_deltas:
+        return
+
+    db.execute(_add_scores(score_deltas, session_id))
+    # The UPDATE bypassed the loaded participants, their scores are read again when next used
+    for pid in score_deltas:
+        participant = db.identity_map.get(identity_key(Participant, pid))
+        if participant is not None:
+            db.expire(participant, ["total_score"])
+
+
+def _add_scores(score_deltas: dict[int, int], session_id: int = None):
+    participants = Participant.__table__
+    condition = participants.c.id.in_(score_deltas)
+    if session_id is not None:
+        condition = and_(condition, participants.c.session_id == session_id)
+    return (
+        update(participants)
+        .where(condition)
+        .values(total_score=participants.c.total_score + case(score_deltas, value=participants.c.id, else_=0))
+    )
 
 
 def get_session_leaderboard(db: Session, session_id: int) -> list[Participant]:
@@ -294,14 +401,9 @@ def submit_answer(
     question_stmt = select(Question).where(Question.id == question_id)
     question = db.scalars(question_stmt).first()
 
-    is_correct = False
-    score = 0
-
-    if question and question.correct_answer:
-        is_correct = answer_text.strip().lower() == question.correct_answer.strip().lower()
-        if is_correct:
-            score = question.points
-            update_participant_score(db, participant_id, score)
+    is_correct, score = grade_answer(question, answer_text)
+    if is_correct:
+        add_participant_scores(db, {participant_id: score}, session_id)
 
     answer = Answer(
         session_id=session_id,
@@ -313,11 +415,83 @@ def submit_answer(
         time_taken=time_taken
     )
     db.add(answer)
-    db.commit()
-    db.refresh(answer)
+    db.flush()
     return answer
 
 
+def grade_answer(question: Optional[Question], answer_text: str) -> tuple[bool, int]:
+    """Auto-grade an answer, returns (is_correct, score)"""
+    if question and question.correct_answer:
+        if answer_text.strip().lower() == question.correct_answer.strip().lower():
+            return True, question.points
+    return False, 0
+
+
+def save_live_changes(db: Session, changes: list[dict]) -> None:
+    """
+    Stage the changes of in-memory live sessions, to be committed as one transaction.
+    Each dict holds the changes of one session:
+        session_id, current_question_index (None if unchanged), started_at (None unless it just started),
+        answers (already graded Answer rows), rescored ({participant_id, question_id, score} dicts),
+        score_deltas (participant_id -> points to add)
+    """
+    answers = [row for change in changes for row in change["answers"]]
+    if answers:
+        db.execute(insert(Answer), answers)
+
+    rescored = [
+        {
+            "sid": change["session_id"], "pid": r["participant_id"], "qid": r["question_id"],
+            "score": r["score"], "correct": r["score"] > 0
+        }
+        for change in changes for r in change["rescored"]
+    ]
+    if rescored:
+        answers_table = Answer.__table__
+        db.execute(
+            update(answers_table)
+            .where(and_(
+                answers_table.c.session_id == bindparam("sid"),
+                answers_table.c.participant_id == bindparam("pid"),
+                answers_table.c.question_id == bindparam("qid")
+            ))
+            .values(score=bindparam("score"), is_correct=bindparam("correct")),
+            rescored
+        )
+
+    score_deltas: dict[int, int] = {}
+    for change in changes:
+        for participant_id, delta in change["score_deltas"].items():
+            score_deltas[participant_id] = score_deltas.get(participant_id, 0) + delta
+    add_participant_scores(db, score_deltas)
+
+    indexes = [
+        {"sid": change["session_id"], "index": change["current_question_index"]}
+        for change in changes if change["current_question_index"] is not None
+    ]
+    if indexes:
+        sessions_table = SessionModel.__table__
+        db.execute(
+            update(sessions_table)
+            .where(sessions_table.c.id == bindparam("sid"))
+            .values(current_question_index=bindparam("index")),
+            indexes
+        )
+
+    started = [
+        {"sid": change["session_id"], "at": change["started_at"]}
+        for change in changes if change.get("started_at") is not None
+    ]
+    if started:
+        sessions_table = SessionModel.__table__
+        db.execute(
+            update(sessions_table)
+            .where(sessions_table.c.id == bindparam("sid"), sessions_table.c.status == SessionStatus.WAITING)
+            .values(status=SessionStatus.ACTIVE, started_at=bindparam("at")),
+            started
+        )
+
+
 def get_answer(db: Session, session_id: int, participant_id: int, question_id: int) -> Optional[Answer]:
     stmt = select(Answer).where(
         and_(
@@ -329,6 +503,11 @@ def get_answer(db: Session, session_id: int, participant_id: int, question_id: i
     return db.scalars(stmt).first()
 
 
+def get_answers_for_session(db: Session, session_id: int) -> list[Answer]:
+    stmt = select(Answer).where(Answer.session_id == session_id)
+    return db.scalars(stmt).all()
+
+
 def get_answers_for_question(db: Session, session_id: int, question_id: int) -> list[Answer]:
     stmt = select(Answer).where(
         and_(Answer.session_id == session_id, Answer.question_id == question_id)
@@ -337,7 +516,8 @@ def get_answers_for_question(db: Session, session_id: int, question_id: int) ->
 
 
 def score_answer(db: Session, answer_id: int, score: int) -> Optional[Answer]:
-    stmt = select(Answer).where(Answer.id == answer_id)
+    # Locked until the commit, so two graders rescoring the same answer apply their differences in turn
+    stmt = select(Answer).where(Answer.id == answer_id).with_for_update()
     answer = db.scalars(stmt).first()
     if not answer:
         return None
@@ -348,8 +528,7 @@ def score_answer(db: Session, answer_id: int, score: int) -> Optional[Answer]:
     answer.score = score
     answer.is_correct = score > 0
 
-    update_participant_score(db, answer.participant_id, score_diff)
+    add_participant_scores(db, {answer.participant_id: score_diff}, answer.session_id)
 
-    db.commit()
-    db.refresh(answer)
+    db.flush()
     return answer
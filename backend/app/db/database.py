@@ -1,14 +1,21 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, Session
 from sqlalchemy.orm import sessionmaker
-from typing import Generator, Any
+from typing import AsyncGenerator, Generator, Any
 import os
 
 # Get database URL from environment variable
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# Driver of the async engine for each database, the sync engine keeps the driver of DATABASE_URL
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
 engine = None
 SessionLocal = None
+async_engine = None
+AsyncSessionLocal = None
 
 # Base class for all models
 Base = declarative_base()
@@ -23,25 +30,76 @@ def init_db():
         max_overflow=20
     )
     # Create SessionLocal class for database sessions
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    # Objects stay readable after commit, routes return them after their request committed
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+    init_async_db()
+
+
+def async_url(url: str) -> str:
+    """DATABASE_URL with the async driver of its database, e.g. postgresql:// -> postgresql+asyncpg://"""
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        return url.render_as_string(hide_password=False)
+    return url.set(drivername=f"{url.get_backend_name()}+{driver}").render_as_string(hide_password=False)
+
+
+def init_async_db():
+    global async_engine, AsyncSessionLocal
+    url = async_url(DATABASE_URL)
+    # sqlite pools are not sized
+    pool_args = {} if url.startswith("sqlite") else {"pool_size": 10, "max_overflow": 20}
+    async_engine = create_async_engine(url, pool_pre_ping=True, **pool_args)
+    # Objects stay readable after commit, an async session cannot lazily refresh them
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+async def close_async_db():
+    """Close the connections of the async engine"""
+    if async_engine is not None:
+        await async_engine.dispose()
 
 
 # Dependency for FastAPI routes to get database session
 def get_db() -> Generator[Session, Any, None]:
     """
-    Dependency function that yields a database session.
-    Usage in FastAPI routes:
-        @app.get("/items")
-        def get_items(db: Session = Depends(get_db)):
+    Dependency function that yields a database session, the unit of work of a request.
+    The crud functions only stage changes, they are committed here once the route
+    returned and rolled back if it raised. Declare it with scope="function" so the
+    commit happens before the response is sent:
+        @app.post("/items")
+        def create_item(db: Session = Depends(get_db, scope="function")):
             ...
     """
     db = SessionLocal()
     try:
         yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
     finally:
         db.close()
 
 
+# Dependency for the async routes, their queries do not block the event loop
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Dependency function that yields an async database session, committed like get_db.
+    Usage in FastAPI routes:
+        @app.post("/items")
+        async def create_item(db: AsyncSession = Depends(get_async_db, scope="function")):
+            ...
+    """
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+
+
 # Helper function to create all tables (for testing/development)
 def create_tables():
     """Create all tables in the database"""
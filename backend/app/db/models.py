@@ -1,13 +1,15 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Boolean, Float, Enum
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Boolean, Float, Enum, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, null
 from app.db.database import Base
 import enum
 
 # TODO:
-#  - Add composite indices if needed using '__table_args__ = ()'
 #  - Make some of the ids random?
 
+# The composite indices follow the lookups in crud.py, a column leading one of them has
+# no index of its own. Changes to the schema go with a migration in alembic/versions.
+
 class QuestionType(str, enum.Enum):
     """Enum for question types"""
     MULTIPLE_CHOICE = "multiple_choice"
@@ -36,6 +38,7 @@ class SessionStatus(str, enum.Enum):
 class User(Base):
     """User model - Quiz creators only"""
     __tablename__ = "users"
+    __mapper_args__ = {"eager_defaults": True}  # updated_at comes back with the INSERT and UPDATE (RETURNING)
 
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String(50), unique=True, nullable=False, index=True)
@@ -43,7 +46,7 @@ class User(Base):
     hashed_password = Column(String(255), nullable=False)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=null(), onupdate=func.now())
 
     # Relationships
     quizzes = relationship("Quiz", back_populates="creator", cascade="all, delete-orphan")
@@ -64,6 +67,7 @@ class RefreshToken(Base):
 class Quiz(Base):
     """Quiz model - Collection of questions"""
     __tablename__ = "quizzes"
+    __mapper_args__ = {"eager_defaults": True}  # updated_at comes back with the INSERT and UPDATE (RETURNING)
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(200), nullable=False)
@@ -71,7 +75,11 @@ class Quiz(Base):
     creator_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     is_published = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=null(), onupdate=func.now())
+
+    __table_args__ = (
+        Index("ix_quizzes_creator_created", creator_id, created_at.desc()),  # get_quizzes_by_user
+    )
 
     # Relationships
     creator = relationship("User", back_populates="quizzes")
@@ -82,9 +90,10 @@ class Quiz(Base):
 class Question(Base):
     """Question model - Individual quiz questions"""
     __tablename__ = "questions"
+    __mapper_args__ = {"eager_defaults": True}  # updated_at comes back with the INSERT and UPDATE (RETURNING)
 
     id = Column(Integer, primary_key=True, index=True)
-    quiz_id = Column(Integer, ForeignKey("quizzes.id", ondelete="CASCADE"), nullable=False, index=True)
+    quiz_id = Column(Integer, ForeignKey("quizzes.id", ondelete="CASCADE"), nullable=False)
     order = Column(Integer, nullable=False)  # Question order in quiz
     type = Column(Enum(QuestionType), nullable=False)
     content = Column(Text, nullable=False)  # Question text
@@ -101,7 +110,11 @@ class Question(Base):
     time_limit = Column(Integer, default=30)  # Time limit in seconds
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=null(), onupdate=func.now())
+
+    __table_args__ = (
+        Index("ix_questions_quiz_order", quiz_id, order),  # get_questions_by_quiz
+    )
 
     # Relationships
     quiz = relationship("Quiz", back_populates="questions")
@@ -135,11 +148,15 @@ class Participant(Base):
     __tablename__ = "participants"
 
     id = Column(Integer, primary_key=True, index=True)
-    session_id = Column(Integer, ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False, index=True)
+    session_id = Column(Integer, ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False)
     name = Column(String(100), nullable=False)
     total_score = Column(Integer, default=0)
     joined_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    __table_args__ = (
+        Index("ix_participants_session_score", session_id, total_score.desc()),  # get_session_leaderboard
+    )
+
     # Relationships
     session = relationship("Session", back_populates="participants")
     answers = relationship("Answer", back_populates="participant", cascade="all, delete-orphan")
@@ -150,7 +167,7 @@ class Answer(Base):
     __tablename__ = "answers"
 
     id = Column(Integer, primary_key=True, index=True)
-    session_id = Column(Integer, ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False, index=True)
+    session_id = Column(Integer, ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False)
     participant_id = Column(Integer, ForeignKey("participants.id", ondelete="CASCADE"), nullable=False, index=True)
     question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"), nullable=False, index=True)
     
@@ -161,6 +178,12 @@ class Answer(Base):
     
     submitted_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    __table_args__ = (
+        # One answer per participant per question, its index serves get_answer
+        UniqueConstraint(session_id, participant_id, question_id, name="uq_answers_session_participant_question"),
+        Index("ix_answers_session_question", session_id, question_id),  # get_answers_for_question
+    )
+
     # Relationships
     session = relationship("Session", back_populates="answers")
     participant = relationship("Participant", back_populates="answers")
@@ -0,0 +1,75 @@
+"""
+Counting of the round trips a request makes to the database.
+
+Every statement executed and every COMMIT by any engine, sync or async, is added
+to the counter of the current context. QueryCountMiddleware gives every HTTP
+request its own counter and reports it in the X-Query-Count response header, so
+the effect of a change on the number of round trips of a route can be read off
+directly.
+"""
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryCount:
+    __slots__ = ("count",)
+
+    def __init__(self):
+        self.count = 0
+
+
+# A mutable holder, so statements run in a thread or task started by the request add to its count
+_current: ContextVar[Optional[QueryCount]] = ContextVar("query_count", default=None)
+
+
+def _count(*args):
+    counter = _current.get()
+    if counter is not None:
+        counter.count += 1
+
+
+event.listen(Engine, "before_cursor_execute", _count)
+event.listen(Engine, "commit", _count)
+
+
+class counting:
+    """
+    Count the round trips of a block:
+        with counting() as queries:
+            ...
+        queries.count
+    """
+
+    def __enter__(self) -> QueryCount:
+        self.counter = QueryCount()
+        self._token = _current.set(self.counter)
+        return self.counter
+
+    def __exit__(self, *exc_info):
+        _current.reset(self._token)
+
+
+class QueryCountMiddleware:
+    """Adds the number of round trips made for a request as the X-Query-Count header"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with counting() as queries:
+            async def send_with_count(message):
+                if message["type"] == "http.response.start":
+                    # the request scope has committed by the time the response starts
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-query-count", str(queries.count).encode()))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            await self.app(scope, receive, send_with_count)
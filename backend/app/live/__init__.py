@@ -0,0 +1,7 @@
+from .encoding import encode
+from .fanout import FanOut
+from .leaderboard import Leaderboard
+from .outbox import Outbox
+from .sharding import ShardMap
+from .state import LiveSession, LiveSessionStore
+from .timers import TimingWheel
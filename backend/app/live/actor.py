@@ -0,0 +1,155 @@
+"""
+One actor per live session for the messages of its clients.
+
+The receive loops of all sockets of a session put the messages they get into the
+inbound queue of the session's actor, and the actor handles them one at a time in
+arrival order. A handler therefore never runs while another handler of the same
+session is suspended halfway through its changes (e.g. waiting for a broadcast),
+without any locks, and sessions do not wait for each other. A full queue makes the
+receive loops wait, which pushes back on clients that send faster than their
+session can keep up with.
+
+An actor stops once it has been idle for LIVE_ACTOR_IDLE_TIMEOUT seconds and a new
+one is started for the next message of its session. A handler that raises is logged
+and passed to the on_error callback, so the sender of the message can be told.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable
+
+# ==================== CONFIG ====================
+ACTOR_QUEUE_SIZE = int(os.getenv("LIVE_ACTOR_QUEUE_SIZE", "1024"))  # inbound messages per session
+ACTOR_IDLE_TIMEOUT = float(os.getenv("LIVE_ACTOR_IDLE_TIMEOUT", "60"))  # seconds
+ACTOR_LATENCY_WINDOW = 1000  # most recent messages the latency metrics are computed over
+# ================================================
+
+Handler = Callable[..., Awaitable]
+ErrorHandler = Callable[[Handler, tuple, Exception], Awaitable]
+
+logger = logging.getLogger(__name__)
+
+
+class SessionActor:
+    """Handles the inbound messages of one session, one at a time"""
+
+    def __init__(self, session_code: str, maxsize: int = ACTOR_QUEUE_SIZE, idle_timeout: float = ACTOR_IDLE_TIMEOUT,
+                 on_idle: Callable[["SessionActor"], None] = None, on_error: ErrorHandler = None):
+        self.session_code = session_code
+        self.idle_timeout = idle_timeout
+        self.on_idle = on_idle
+        self.on_error = on_error
+        self.queue: asyncio.Queue[tuple[Handler, tuple, float]] = asyncio.Queue(maxsize)
+        self.processed = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.latencies: deque[float] = deque(maxlen=ACTOR_LATENCY_WINDOW)  # seconds from queued to handled
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    @property
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+    async def tell(self, handler: Handler, *args):
+        """Queue handler(*args), waits while the queue is full"""
+        await self.queue.put((handler, args, time.perf_counter()))
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    async def join(self):
+        """Wait until everything queued so far has been handled"""
+        await self.queue.join()
+
+    def metrics(self) -> dict:
+        latencies = sorted(self.latencies)
+        return {
+            "queue_depth": self.depth,
+            "max_queue_depth": self.max_depth,
+            "processed": self.processed,
+            "errors": self.errors,
+            "latency_p50_ms": _percentile_ms(latencies, 0.5),
+            "latency_p99_ms": _percentile_ms(latencies, 0.99),
+            "latency_max_ms": _percentile_ms(latencies, 1.0),
+        }
+
+    def close(self):
+        self.task.cancel()
+
+    async def _run(self):
+        while True:
+            try:
+                handler, args, queued_at = await asyncio.wait_for(self.queue.get(), self.idle_timeout)
+            except asyncio.TimeoutError:
+                if self.queue.empty():
+                    if self.on_idle:
+                        self.on_idle(self)
+                    return
+                continue
+            try:
+                await handler(*args)
+            except Exception as exc:
+                self.errors += 1
+                logger.exception("%s failed for session %s", getattr(handler, "__name__", handler), self.session_code)
+                await self._failed(handler, args, exc)
+            finally:
+                self.processed += 1
+                self.latencies.append(time.perf_counter() - queued_at)
+                self.queue.task_done()
+
+    async def _failed(self, handler: Handler, args: tuple, exc: Exception):
+        if self.on_error is None:
+            return
+        try:
+            await self.on_error(handler, args, exc)
+        except Exception:
+            logger.exception("Error handler failed for session %s", self.session_code)
+
+
+class SessionActors:
+    """The actors of the sessions of this worker, started on demand"""
+
+    def __init__(self, maxsize: int = ACTOR_QUEUE_SIZE, idle_timeout: float = ACTOR_IDLE_TIMEOUT,
+                 on_error: ErrorHandler = None):
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.on_error = on_error  # awaited with (handler, args, exception) when a handler raises
+        self.actors: dict[str, SessionActor] = {}
+
+    def get(self, session_code: str) -> SessionActor:
+        actor = self.actors.get(session_code)
+        if actor is None or actor.task.done():
+            actor = self.actors[session_code] = SessionActor(
+                session_code, self.maxsize, self.idle_timeout, on_idle=self._forget, on_error=self.on_error
+            )
+        return actor
+
+    async def tell(self, session_code: str, handler: Handler, *args):
+        """Queue handler(*args) on the actor of a session"""
+        await self.get(session_code).tell(handler, *args)
+
+    async def join(self, session_code: str):
+        actor = self.actors.get(session_code)
+        if actor is not None:
+            await actor.join()
+
+    def metrics(self, session_code: str) -> dict:
+        actor = self.actors.get(session_code)
+        return actor.metrics() if actor else {}
+
+    async def close(self):
+        actors = list(self.actors.values())
+        self.actors.clear()
+        for actor in actors:
+            actor.close()
+        await asyncio.gather(*(actor.task for actor in actors), return_exceptions=True)
+
+    def _forget(self, actor: SessionActor):
+        if self.actors.get(actor.session_code) is actor:
+            del self.actors[actor.session_code]
+
+
+def _percentile_ms(ordered: list[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return round(ordered[min(int(len(ordered) * q), len(ordered) - 1)] * 1000, 2)
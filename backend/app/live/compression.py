@@ -0,0 +1,45 @@
+"""
+Tuned permessage-deflate for the WebSocket server.
+
+uvicorn can only switch permessage-deflate on or off, and uses the websockets
+defaults when it is on. Quiz frames are small and highly repetitive (the same
+keys in every message), so a small window with a low compression level gets
+nearly the same ratio at a fraction of the CPU and memory per connection.
+DeflateWebSocketProtocol is a drop-in uvicorn WebSocket protocol that applies
+the WS_DEFLATE_* settings, see app.main for how it is selected.
+"""
+import os
+
+from uvicorn.protocols.websockets.websockets_impl import WebSocketProtocol
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
+
+# ==================== CONFIG ====================
+PER_MESSAGE_DEFLATE = os.getenv("WS_PER_MESSAGE_DEFLATE", "true").lower() in ("1", "true", "yes")
+DEFLATE_LEVEL = int(os.getenv("WS_DEFLATE_LEVEL", "1"))  # zlib level, 1 (fastest) .. 9 (smallest)
+DEFLATE_MEM_LEVEL = int(os.getenv("WS_DEFLATE_MEM_LEVEL", "5"))  # zlib memLevel, 1 .. 9
+DEFLATE_WINDOW_BITS = int(os.getenv("WS_DEFLATE_WINDOW_BITS", "12"))  # server window, 9 .. 15
+DEFLATE_NO_CONTEXT_TAKEOVER = os.getenv("WS_DEFLATE_NO_CONTEXT_TAKEOVER", "false").lower() in ("1", "true", "yes")
+# ================================================
+
+
+def deflate_factory(
+    level: int = DEFLATE_LEVEL,
+    mem_level: int = DEFLATE_MEM_LEVEL,
+    window_bits: int = DEFLATE_WINDOW_BITS,
+    no_context_takeover: bool = DEFLATE_NO_CONTEXT_TAKEOVER
+) -> ServerPerMessageDeflateFactory:
+    """permessage-deflate extension with the given (default: configured) settings"""
+    return ServerPerMessageDeflateFactory(
+        server_no_context_takeover=no_context_takeover,
+        server_max_window_bits=window_bits,
+        compress_settings={"level": level, "memLevel": mem_level},
+    )
+
+
+class DeflateWebSocketProtocol(WebSocketProtocol):
+    """uvicorn's websockets protocol with the configured permessage-deflate settings"""
+
+    def __init__(self, config, *args, **kwargs):
+        super().__init__(config, *args, **kwargs)
+        if config.ws_per_message_deflate:
+            self.available_extensions = [deflate_factory()]
@@ -0,0 +1,50 @@
+"""
+The questions of a live session as they are sent to clients.
+
+When a session is opened its questions are loaded once, in order, and each is
+turned into two views that are encoded right away: one for the participants,
+without the correct answer, and one for the host. next_question then only has to
+pick the views of the next question and splice their bytes into question_start.
+"""
+import json
+from typing import Optional
+
+from app.db.models import Question
+
+from .encoding import Preencoded
+
+
+def parse_options(options: Optional[str]) -> Optional[list]:
+    """The answer options of a question, stored as a JSON list"""
+    if not options:
+        return None
+    try:
+        parsed = json.loads(options)
+    except ValueError:
+        return None
+    return parsed if isinstance(parsed, list) else None
+
+
+def participant_view(question: Question) -> dict:
+    """What participants get to see of a question, nothing that gives away the answer"""
+    return {
+        "id": question.id,
+        "order": question.order,
+        "type": question.type.value if question.type else None,
+        "content": question.content,
+        "media_url": question.media_url,
+        "media_type": question.media_type.value if question.media_type else None,
+        "options": parse_options(question.options),
+        "points": question.points,
+        "time_limit": question.time_limit,
+    }
+
+
+def host_view(question: Question) -> dict:
+    """Everything the host needs to present and grade a question"""
+    return {**participant_view(question), "correct_answer": question.correct_answer}
+
+
+def encode_views(question: Question) -> tuple[Preencoded, Preencoded]:
+    """(participant view, host view) of a question, encoded in every wire encoding"""
+    return Preencoded(participant_view(question)), Preencoded(host_view(question))
@@ -0,0 +1,141 @@
+"""
+Serialization of WebSocket messages.
+
+Clients pick a wire encoding when they connect: JSON text frames (the default) or
+MessagePack binary frames. A message is encoded at most once per encoding in use,
+and the resulting frame is shared by every socket with that encoding. Values that
+are sent over and over (e.g. the questions of a quiz) can be encoded ahead of time
+as Preencoded, their bytes are then spliced into every message that contains them.
+orjson is used for JSON when it is installed, the standard library otherwise.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional encoding
+    msgpack = None
+
+
+Frame = str | bytes
+
+JSON = "json"
+MSGPACK = "msgpack"
+ENCODINGS = [JSON, MSGPACK] if msgpack is not None else [JSON]
+
+# WebSocket subprotocol that selects each encoding
+SUBPROTOCOLS = {f"quiz.{encoding}": encoding for encoding in ENCODINGS}
+
+
+def encode(message: dict, encoding: str = JSON) -> Frame:
+    """Encode message into a JSON text frame or a MessagePack binary frame"""
+    if type(message) is dict and any(type(value) is Preencoded for value in message.values()):
+        return _splice(message, encoding)
+    if encoding == MSGPACK:
+        return msgpack.packb(message)
+    if orjson is not None:
+        return orjson.dumps(message).decode("utf-8")
+    return json.dumps(message, separators=(",", ":"))
+
+
+def batch(frames: list[Frame], encoding: str = JSON) -> Frame:
+    """Join encoded messages into one array frame without decoding them"""
+    if encoding == MSGPACK:
+        return _msgpack_header(len(frames), 0x90, b"\xdc", b"\xdd") + b"".join(frames)
+    return "[" + ",".join(frames) + "]"
+
+
+def _msgpack_header(n: int, fix: int, size16: bytes, size32: bytes) -> bytes:
+    """Header of a MessagePack array or map of n elements"""
+    if n < 16:
+        return bytes([fix | n])
+    if n < 1 << 16:
+        return size16 + n.to_bytes(2, "big")
+    return size32 + n.to_bytes(4, "big")
+
+
+def _splice(message: dict, encoding: str) -> Frame:
+    """Encode message around the already encoded bytes of its Preencoded values"""
+    if encoding == MSGPACK:
+        parts = [_msgpack_header(len(message), 0x80, b"\xde", b"\xdf")]
+        for key, value in message.items():
+            parts.append(msgpack.packb(key))
+            parts.append(value.get(MSGPACK) if type(value) is Preencoded else msgpack.packb(value))
+        return b"".join(parts)
+    return "{" + ",".join(
+        encode(key) + ":" + (value.get(JSON) if type(value) is Preencoded else encode(value))
+        for key, value in message.items()
+    ) + "}"
+
+
+def decode(frame: Frame) -> dict | list:
+    """Decode a frame received from a client, binary frames are MessagePack"""
+    if isinstance(frame, bytes):
+        if msgpack is None:
+            raise ValueError("MessagePack is not supported")
+        return msgpack.unpackb(frame)
+    if orjson is not None:
+        return orjson.loads(frame)
+    return json.loads(frame)
+
+
+def negotiate(subprotocols: list[str], requested: str = None) -> tuple[str, str | None]:
+    """
+    Choose the encoding of a connection from the subprotocols the client offered
+    or an explicit encoding query parameter.
+    Returns (encoding, subprotocol to accept). Falls back to JSON.
+    """
+    for subprotocol in subprotocols:
+        if subprotocol in SUBPROTOCOLS:
+            return SUBPROTOCOLS[subprotocol], subprotocol
+    if requested in ENCODINGS:
+        return requested, None
+    return JSON, None
+
+
+class Preencoded:
+    """A value encoded ahead of time in every encoding, to be sent as part of messages"""
+    __slots__ = ("value", "_frames")
+
+    def __init__(self, value):
+        self.value = value
+        self._frames: dict[str, Frame] = {encoding: encode(value, encoding) for encoding in ENCODINGS}
+
+    def get(self, encoding: str = JSON) -> Frame:
+        return self._frames[encoding]
+
+
+class Frames:
+    """A message and its frames, each encoding is only done when first needed"""
+
+    def __init__(self, message: dict = None, json_frame: str = None):
+        self.message = message
+        self._frames: dict[str, Frame] = {JSON: json_frame} if json_frame is not None else {}
+
+    def get(self, encoding: str = JSON) -> Frame:
+        frame = self._frames.get(encoding)
+        if frame is None:
+            if self.message is None:
+                self.message = decode(self._frames[JSON])
+            frame = self._frames[encoding] = encode(self.message, encoding)
+        return frame
+
+
+def as_frames(message: dict | str | Frames) -> Frames:
+    """Wrap message unless it already is a Frames, a str is taken to be a JSON frame"""
+    if isinstance(message, Frames):
+        return message
+    if isinstance(message, str):
+        return Frames(json_frame=message)
+    return Frames(message)
+
+
+def as_frame(message: dict | Frame) -> Frame:
+    """Encode message as JSON unless it already is a frame"""
+    if isinstance(message, (str, bytes)):
+        return message
+    return encode(message)
@@ -0,0 +1,98 @@
+"""
+Fan-out of messages to many WebSocket connections.
+
+Every connection gets its own bounded Outbox with a writer task, so a broadcast
+only has to encode the message once per wire encoding in use and put the shared
+frame on each queue.
+Sends to all connections then proceed concurrently, and a slow consumer only
+delays (and eventually drops) its own messages, never anybody else's.
+"""
+from typing import Iterable
+
+from fastapi import WebSocket
+
+from .encoding import Frame, Frames, JSON, as_frames, batch
+from .outbox import Outbox, BATCHED_TYPES, COALESCED_TYPES
+
+
+class FanOut:
+    """Owns the outboxes of all connections and queues messages onto them"""
+
+    def __init__(self, **outbox_options):
+        self.outbox_options = outbox_options
+        self.outboxes: dict[WebSocket, Outbox] = {}
+
+    def open(self, websocket: WebSocket, encoding: str = JSON) -> Outbox:
+        """Create and start the outbox of a websocket"""
+        outbox = self.outboxes.get(websocket)
+        if outbox is None:
+            outbox = Outbox(websocket, encoding, **self.outbox_options)
+            outbox.start()
+            self.outboxes[websocket] = outbox
+        return outbox
+
+    def forget(self, websocket: WebSocket):
+        """Stop the writer of a websocket that is being removed"""
+        outbox = self.outboxes.pop(websocket, None)
+        if outbox:
+            outbox.close()
+
+    def close(self):
+        """Stop all writers"""
+        for outbox in self.outboxes.values():
+            outbox.close()
+        self.outboxes.clear()
+
+    def encoding(self, websocket: WebSocket) -> str:
+        outbox = self.outboxes.get(websocket)
+        return outbox.encoding if outbox else JSON
+
+    async def send(self, websocket: WebSocket, message: dict | Frame | Frames, msg_type: str | None = None) -> bool:
+        """Queue message for a single websocket. Returns False if the connection has failed."""
+        failed = await self.broadcast([websocket], message, msg_type)
+        return not failed
+
+    def send_batch(self, websocket: WebSocket, messages: list[Frames]) -> bool:
+        """Queue messages for a single websocket as one array frame. Returns False if the connection has failed."""
+        outbox = self.open(websocket)
+        return outbox.put(batch([frames.get(outbox.encoding) for frames in messages], outbox.encoding))
+
+    async def broadcast(
+        self,
+        websockets: Iterable[WebSocket],
+        message: dict | Frame | Frames,
+        msg_type: str | None = None
+    ) -> list[WebSocket]:
+        """
+        Queue message for all websockets.
+        The message is encoded once per encoding and the resulting frames are shared by all queues.
+        A str message is taken to be an encoded JSON frame, msg_type is only needed then.
+        Returns the websockets whose connection has failed.
+        """
+        frames = as_frames(message)
+        if isinstance(message, dict):
+            msg_type = message.get("type")
+        coalesce_key = msg_type if msg_type in COALESCED_TYPES else None
+        batched = msg_type in BATCHED_TYPES
+
+        failed = []
+        for websocket in websockets:
+            outbox = self.open(websocket)
+            if not outbox.put(frames.get(outbox.encoding), coalesce_key, batched):
+                failed.append(websocket)
+        return failed
+
+    def metrics(self, websockets: Iterable[WebSocket]) -> dict:
+        """Aggregated queue metrics of the given websockets"""
+        outboxes = [self.outboxes[ws] for ws in websockets if ws in self.outboxes]
+        return {
+            "connections": len(outboxes),
+            "queue_depth": sum(o.depth for o in outboxes),
+            "max_queue_depth": max((o.depth for o in outboxes), default=0),
+            "sent": sum(o.sent for o in outboxes),
+            "frames": sum(o.frames for o in outboxes),
+            "dropped": sum(o.dropped for o in outboxes),
+            "coalesced": sum(o.coalesced for o in outboxes),
+            "send_failures": sum(o.send_failures for o in outboxes),
+            "failed": sum(o.failed for o in outboxes),
+        }
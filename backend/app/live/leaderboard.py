@@ -0,0 +1,90 @@
+"""
+Incrementally maintained leaderboard of a live session.
+
+Participants are identified by their slot, a small index handed out in order of
+joining. Scores are kept in an array indexed by slot, and the ranking in a sorted
+list of single integers that pack (-score, slot), so a score change is a removal
+and an insertion (O(log n)), the top K are a slice of the list and the rank of a
+participant is a bisection. Ties are broken by slot, i.e. whoever joined first
+ranks higher, which keeps every rank unique and stable between updates.
+"""
+import os
+from array import array
+from typing import Iterator
+
+from sortedcontainers import SortedList
+
+# ==================== CONFIG ====================
+LEADERBOARD_SIZE = int(os.getenv("LIVE_LEADERBOARD_SIZE", "10"))  # entries in a leaderboard_update
+# ================================================
+
+SLOT_SPAN = 1 << 32  # slots per score in the packed ranking keys
+
+
+class Leaderboard:
+    """Order statistics over the scores of the participants of one session"""
+
+    def __init__(self):
+        self._scores = array("q")  # slot -> score
+        self._present = bytearray()  # slot -> 1 if on the leaderboard
+        self._count = 0
+        self._ranking = SortedList()  # -score * SLOT_SPAN + slot
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, slot: int) -> bool:
+        return slot < len(self._present) and self._present[slot] == 1
+
+    def score(self, slot: int) -> int | None:
+        return self._scores[slot] if slot in self else None
+
+    def set(self, slot: int, score: int):
+        """Set the score of a participant, adding them if needed"""
+        # the array is written first, a score that is not an int is refused before the ranking changes
+        if slot in self:
+            old = self._scores[slot]
+            if old == score:
+                return
+            self._scores[slot] = score
+            self._ranking.remove(-old * SLOT_SPAN + slot)
+        else:
+            if slot >= len(self._scores):
+                grow = slot + 1 - len(self._scores)
+                self._scores.frombytes(bytes(self._scores.itemsize * grow))
+                self._present.extend(bytes(grow))
+            self._scores[slot] = score
+            self._present[slot] = 1
+            self._count += 1
+        self._ranking.add(-score * SLOT_SPAN + slot)
+
+    def add(self, slot: int, points: int):
+        """Add points to the score of a participant"""
+        self.set(slot, (self.score(slot) or 0) + points)
+
+    def remove(self, slot: int):
+        if slot in self:
+            self._ranking.remove(-self._scores[slot] * SLOT_SPAN + slot)
+            self._present[slot] = 0
+            self._scores[slot] = 0
+            self._count -= 1
+
+    def rank(self, slot: int) -> int | None:
+        """1-based rank of a participant, None if they are not on the leaderboard"""
+        if slot not in self:
+            return None
+        return self._ranking.index(-self._scores[slot] * SLOT_SPAN + slot) + 1
+
+    def top(self, k: int = None) -> list[tuple[int, int]]:
+        """(slot, score) of the best k participants (default: all), best first"""
+        entries = self._ranking if k is None else self._ranking.islice(0, k)
+        return [_unpack(key) for key in entries]
+
+    def __iter__(self) -> Iterator[tuple[int, int]]:
+        for key in self._ranking:
+            yield _unpack(key)
+
+
+def _unpack(key: int) -> tuple[int, int]:
+    negative_score, slot = divmod(key, SLOT_SPAN)
+    return slot, -negative_score
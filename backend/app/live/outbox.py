@@ -0,0 +1,227 @@
+"""
+Bounded outbound queue of a single WebSocket connection.
+
+Messages are put on the queue without waiting, and a writer task per connection
+sends them in order. A lagging client therefore only backs up its own queue.
+Messages that are superseded by newer ones (leaderboard updates, answer counts)
+are coalesced so only the latest one is ever sent, and they are the only ones
+that are dropped when the queue is full. When there are none to drop the outbox
+fails instead: the connection is reaped and the client resumes from the replay
+buffer, rather than silently missing a question or an answer.
+
+Bursty, non urgent messages (join and answer notices, leaderboards) are batched:
+the writer holds them until the next tick of a WS_TICK_INTERVAL clock shared by
+all connections, and then sends everything that piled up as one array frame.
+Any other message is sent right away and takes the waiting batch along.
+The queue is bounded in frames to send, a pending batch takes a single place.
+"""
+import asyncio
+import os
+from collections import deque
+
+from fastapi import WebSocket
+
+from .encoding import Frame, JSON, batch
+
+# ==================== CONFIG ====================
+OUTBOX_SIZE = int(os.getenv("WS_OUTBOX_SIZE", "64"))  # frames
+MAX_BATCH = int(os.getenv("WS_MAX_BATCH", "512"))  # messages per array frame
+SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "5.0"))  # seconds
+TICK_INTERVAL = float(os.getenv("WS_TICK_INTERVAL", "0.05"))  # seconds, 0 disables waiting for a tick
+MAX_SEND_FAILURES = int(os.getenv("WS_MAX_SEND_FAILURES", "3"))  # consecutive failed sends before giving up
+# ================================================
+
+# Message types where only the most recent one matters
+COALESCED_TYPES = {"leaderboard_update", "leaderboard_rank", "answer_count"}
+
+# Message types that may wait for the next tick to be sent in one frame with others
+BATCHED_TYPES = {"participant_joined", "answer_submitted", "answer_count", "leaderboard_update", "leaderboard_rank"}
+
+
+class Outbox:
+    """Outbound queue and writer task of one websocket"""
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        encoding: str = JSON,
+        maxsize: int = OUTBOX_SIZE,
+        max_batch: int = MAX_BATCH,
+        send_timeout: float = SEND_TIMEOUT,
+        tick_interval: float = TICK_INTERVAL,
+        max_failures: int = MAX_SEND_FAILURES
+    ):
+        self.websocket = websocket
+        self.encoding = encoding
+        self.maxsize = maxsize
+        self.max_batch = max_batch
+        self.send_timeout = send_timeout
+        self.tick_interval = tick_interval
+        self.max_failures = max_failures
+
+        # queued are the frames to send, each a list of items [coalesce_key, frame, batched]
+        # so a coalesced frame can be replaced in place
+        self._queue: deque[list[list]] = deque()
+        self._open: list[list] | None = None  # last frame to send while more batched items can join it
+        self._coalesced: dict[str, list] = {}
+        self._wakeup = asyncio.Event()
+        self._urgent = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._task: asyncio.Task | None = None
+
+        # set once max_failures sends in a row raised or timed out, nothing is sent after that
+        self.failed = False
+        self._failures_in_a_row = 0
+
+        # counters
+        self.sent = 0  # messages
+        self.frames = 0  # websocket frames they were sent in
+        self.dropped = 0
+        self.coalesced = 0
+        self.send_failures = 0
+
+    @property
+    def depth(self) -> int:
+        """Number of messages queued"""
+        return sum(len(items) for items in self._queue)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def close(self):
+        """Stop the writer and discard everything still queued"""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        self._discard()
+
+    def _discard(self):
+        self._queue.clear()
+        self._open = None
+        self._coalesced.clear()
+        self._idle.set()
+
+    def _fail(self):
+        """Give up on the connection, nothing is sent after this"""
+        self.failed = True
+        self.dropped += self.depth
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        self._discard()
+
+    def put(self, frame: Frame, coalesce_key: str | None = None, batched: bool = False) -> bool:
+        """
+        Queue a frame, a batched frame may wait for the next tick.
+        Returns False if the connection has failed, which it does when the queue is full
+        and none of it can be dropped.
+        """
+        if self.failed:
+            return False
+
+        if coalesce_key is not None and coalesce_key in self._coalesced:
+            self._coalesced[coalesce_key][1] = frame
+            self.coalesced += 1
+            return True
+
+        item = [coalesce_key, frame, batched]
+        if self._open is not None:
+            self._open.append(item)
+            if not batched or len(self._open) >= self.max_batch:
+                self._open = None  # sent as soon as the writer gets to it
+                batched = False
+        else:
+            if len(self._queue) >= self.maxsize and not self._evict():
+                self.dropped += 1
+                self._fail()
+                return False
+            items = [item]
+            self._queue.append(items)
+            if batched and self.max_batch > 1:
+                self._open = items
+        if coalesce_key is not None:
+            self._coalesced[coalesce_key] = item
+
+        self._idle.clear()
+        self._wakeup.set()
+        if not batched:
+            self._urgent.set()
+        return True
+
+    def _evict(self) -> bool:
+        """Drop the oldest queued frame that only holds coalesced messages, False if there is none"""
+        for items in self._queue:
+            if all(key is not None for key, _, _ in items):
+                self._queue.remove(items)
+                if items is self._open:
+                    self._open = None
+                for key, _, _ in items:
+                    self._coalesced.pop(key, None)
+                self.dropped += len(items)
+                return True
+        return False
+
+    async def join(self):
+        """Wait until everything queued so far has been sent (or the connection failed)"""
+        await self._idle.wait()
+
+    async def _run(self):
+        while True:
+            if not self._queue:
+                self._idle.set()
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            if self.tick_interval and self._queue[0] is self._open:
+                # let the burst complete, unless something urgent is queued meanwhile
+                self._urgent.clear()
+                try:
+                    await asyncio.wait_for(self._urgent.wait(), self._until_tick())
+                except asyncio.TimeoutError:
+                    pass
+
+            items = self._take()
+            if not items:
+                continue  # evicted while waiting for the tick
+            frame = items[0][1] if len(items) == 1 else batch([frame for _, frame, _ in items], self.encoding)
+
+            try:
+                send = self.websocket.send_bytes(frame) if isinstance(frame, bytes) else self.websocket.send_text(frame)
+                await asyncio.wait_for(send, self.send_timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.send_failures += 1
+                self.dropped += len(items)
+                self._failures_in_a_row += 1
+                if self._failures_in_a_row >= self.max_failures:
+                    self._task = None
+                    self._fail()
+                    return
+                continue
+
+            self._failures_in_a_row = 0
+            self.sent += len(items)
+            self.frames += 1
+
+    def _take(self) -> list[list]:
+        """
+        Take the items of the next frame to send off the queue:
+        a batch, up to and including the urgent item that closed it
+        """
+        if not self._queue:
+            return []
+        items = self._queue.popleft()
+        if items is self._open:
+            self._open = None
+        for key, _, _ in items:
+            if key is not None:
+                self._coalesced.pop(key, None)
+        return items
+
+    def _until_tick(self) -> float:
+        interval = self.tick_interval
+        return interval - asyncio.get_running_loop().time() % interval
@@ -0,0 +1,75 @@
+"""
+Token bucket rate limiting of the messages a client sends.
+
+Every connection has a bucket per message type. A bucket holds up to `burst`
+tokens and refills at `rate` tokens per second, every message takes one and a
+message that finds its bucket empty is dropped before it is handled. Budgets are
+per message type (WS_RATE_LIMITS, e.g. "submit_answer=2/4,score_answer=20/100"
+for 2 per second with bursts of 4 and so on). All other types share one bucket
+of WS_RATE_LIMIT per second with bursts of WS_RATE_BURST, so made up types cannot
+make a connection keep more buckets.
+"""
+import os
+import time
+
+# ==================== CONFIG ====================
+DEFAULT_RATE = float(os.getenv("WS_RATE_LIMIT", "10"))  # messages per second
+DEFAULT_BURST = float(os.getenv("WS_RATE_BURST", "20"))
+RATE_LIMITS = os.getenv(
+    "WS_RATE_LIMITS",
+    "submit_answer=2/4,next_question=2/5,end_session=1/2,score_answer=20/100"
+)
+# ================================================
+
+
+def parse_limits(spec: str) -> dict[str, tuple[float, float]]:
+    """'type=rate/burst,...' -> {type: (rate, burst)}"""
+    limits = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        msg_type, _, budget = item.partition("=")
+        rate, _, burst = budget.partition("/")
+        limits[msg_type.strip()] = (float(rate), float(burst or rate))
+    return limits
+
+
+LIMITS = parse_limits(RATE_LIMITS)
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, burst: float, now: float):
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, rate: float, burst: float, now: float) -> bool:
+        """Take a token if there is one"""
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class RateLimiter:
+    """The buckets of one connection"""
+    __slots__ = ("limits", "buckets")
+
+    def __init__(self, limits: dict[str, tuple[float, float]] = None):
+        self.limits = LIMITS if limits is None else limits
+        self.buckets: dict[str, TokenBucket] = {}
+
+    def allow(self, msg_type: str, now: float = None) -> bool:
+        """Whether a message of msg_type is within budget, uses up a token if it is"""
+        now = time.monotonic() if now is None else now
+        if isinstance(msg_type, str) and msg_type in self.limits:
+            key, (rate, burst) = msg_type, self.limits[msg_type]
+        else:
+            key, rate, burst = "*", DEFAULT_RATE, DEFAULT_BURST
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(burst, now)
+        return bucket.take(rate, burst, now)
@@ -0,0 +1,47 @@
+"""
+Compact records for the per-connection and per-participant state of live sessions.
+
+A worker keeps one of these for every connected client, so they use __slots__:
+no per-instance __dict__, which makes a record a fraction of the size of the
+equivalent dict and its fields cheaper to read.
+"""
+import time
+from typing import Optional
+
+from fastapi import WebSocket
+
+
+class Connection:
+    """A connected socket of this worker"""
+    __slots__ = ("session_code", "participant_id", "last_seen")
+
+    def __init__(self, session_code: str, participant_id: Optional[str]):
+        self.session_code = session_code
+        self.participant_id = participant_id  # None for the host
+        self.last_seen = time.monotonic()  # when the last message was received from it
+
+
+class SessionConnections:
+    """The sockets of one session that are connected to this worker"""
+    __slots__ = ("host", "participants")
+
+    def __init__(self):
+        self.host: Optional[WebSocket] = None
+        self.participants: dict[str, WebSocket] = {}  # participant_id -> socket
+
+    def websockets(self) -> list[WebSocket]:
+        """Every socket of the session, the host last"""
+        websockets = list(self.participants.values())
+        if self.host:
+            websockets.append(self.host)
+        return websockets
+
+
+class Participant:
+    """A participant of a live session"""
+    __slots__ = ("id", "name", "slot")
+
+    def __init__(self, participant_id: int, name: str, slot: int):
+        self.id = participant_id
+        self.name = name
+        self.slot = slot  # index of the participant in the score arrays of its session
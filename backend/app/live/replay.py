@@ -0,0 +1,108 @@
+"""
+Per-session replay of recent events for resuming clients.
+
+Every event sent to a session gets the next sequence number of that session and
+is kept, already encoded, in bounded ring buffers. A client that reconnects
+presents the last sequence number it saw and gets just the events it missed and
+was a recipient of. When those are no longer all in the buffers (or the sequence
+number is unknown, e.g. after a restart) there is nothing to replay from and the
+client has to be sent a snapshot of the session state instead.
+
+The events are kept per recipient: one ring for what the participants all get,
+one for what the host gets and a small one per participant for what was sent to
+that participant only. Otherwise the per-answer notices to the host and the
+personal leaderboard frames of a large session would push the broadcasts out of
+a shared ring within seconds, and every resume would end in a snapshot.
+"""
+import heapq
+import os
+from collections import deque
+
+from .encoding import Frames
+
+# ==================== CONFIG ====================
+REPLAY_SIZE = int(os.getenv("WS_REPLAY_SIZE", "256"))  # events kept per session for the participants and the host
+REPLAY_UNICAST_SIZE = int(os.getenv("WS_REPLAY_UNICAST_SIZE", "16"))  # events kept per participant sent to it only
+# ================================================
+
+Event = tuple[int, str | None, Frames]  # seq, msg_type, frames
+
+
+class _Ring:
+    """The most recent events of one recipient"""
+    __slots__ = ("events", "evicted")
+
+    def __init__(self, size: int):
+        self.events: deque[Event] = deque(maxlen=size)
+        self.evicted = 0  # sequence number of the last event pushed out
+
+    def append(self, event: Event):
+        if len(self.events) == self.events.maxlen:
+            self.evicted = self.events[0][0]
+        self.events.append(event)
+
+    def since(self, last_seq: int) -> list[Event] | None:
+        if self.evicted > last_seq:
+            return None
+        missed = []
+        for event in reversed(self.events):
+            if event[0] <= last_seq:
+                break
+            missed.append(event)
+        missed.reverse()
+        return missed
+
+
+class ReplayBuffer:
+    """Sequence numbers and the most recent events of one session"""
+
+    def __init__(self, size: int = REPLAY_SIZE, unicast_size: int = REPLAY_UNICAST_SIZE):
+        self.seq = 0  # last sequence number handed out or seen
+        self.unicast_size = unicast_size
+        self._participants = _Ring(size)  # sent to "all" or "participants"
+        self._host = _Ring(size)  # sent to "all" or "host"
+        self._unicasts: dict[str, _Ring] = {}  # participant_id -> sent to that participant only
+
+    def next_seq(self) -> int:
+        self.seq += 1
+        return self.seq
+
+    def append(self, seq: int, target: str, participant_id: str | None, msg_type: str | None, frames: Frames):
+        event = (seq, msg_type, frames)
+        if target == "participant":
+            ring = self._unicasts.get(participant_id)
+            if ring is None:
+                ring = self._unicasts[participant_id] = _Ring(self.unicast_size)
+            ring.append(event)
+        else:
+            if target != "host":
+                self._participants.append(event)
+            if target in ("host", "all"):
+                self._host.append(event)
+        self.seq = max(self.seq, seq)
+
+    def since(self, last_seq: int, participant_id: str = None) -> list[tuple[str | None, Frames]] | None:
+        """
+        (msg_type, frames) of the events after last_seq that were sent to the participant
+        (or to the host when participant_id is None), oldest first.
+        Returns None if some of them are no longer in the buffers.
+        """
+        if last_seq > self.seq:
+            return None
+        if last_seq == self.seq:
+            return []
+
+        if participant_id is None:
+            rings = [self._host]
+        else:
+            rings = [self._participants]
+            if participant_id in self._unicasts:
+                rings.append(self._unicasts[participant_id])
+
+        streams = []
+        for ring in rings:
+            missed = ring.since(last_seq)
+            if missed is None:
+                return None
+            streams.append(missed)
+        return [(msg_type, frames) for _, msg_type, frames in heapq.merge(*streams, key=lambda event: event[0])]
@@ -0,0 +1,83 @@
+"""
+Session-affinity sharding of live sessions over a fixed set of worker processes.
+
+Each worker is started on its own address and knows the addresses of all workers
+(WS_SHARD_WORKERS) and its own (WS_SHARD_SELF). A session code is mapped onto its
+owning worker with rendezvous hashing, so every connection of a session ends up
+on one process and its state and fan-out stay local to it. This is how sessions
+scale over the cores of a machine (one worker each): connections that reach another
+worker are redirected to the owner, so no message of a session ever has to cross
+processes. A single worker, with WS_SHARD_WORKERS unset, owns every session.
+
+Rendezvous hashing keeps ownership stable when the worker set changes: removing
+a worker only moves the sessions it owned, adding one only moves the sessions
+the new worker now wins. To change the worker set of a running deployment, list
+the workers in WS_SHARD_WORKERS_FILE instead, edit it, and send SIGHUP to every
+worker: each re-reads the file and hands off the sessions it no longer owns.
+"""
+import hashlib
+import os
+from typing import Iterable
+
+# ==================== CONFIG ====================
+SHARD_WORKERS_FILE = os.getenv("WS_SHARD_WORKERS_FILE", "")  # takes the place of WS_SHARD_WORKERS, re-read on SIGHUP
+SHARD_SELF = os.getenv("WS_SHARD_SELF", "")
+# ================================================
+
+
+def parse_workers(text: str) -> list[str]:
+    """Worker addresses separated by commas or newlines"""
+    return [w.strip() for w in text.replace("\n", ",").split(",") if w.strip()]
+
+
+def read_workers(path: str = SHARD_WORKERS_FILE) -> list[str]:
+    """Worker addresses listed in a file"""
+    with open(path, encoding="utf-8") as file:
+        return parse_workers(file.read())
+
+
+# the workers at start up, comma separated in WS_SHARD_WORKERS unless there is a WS_SHARD_WORKERS_FILE
+SHARD_WORKERS = read_workers() if SHARD_WORKERS_FILE else parse_workers(os.getenv("WS_SHARD_WORKERS", ""))
+
+
+def _score(worker: str, session_code: str) -> int:
+    digest = hashlib.blake2b(f"{worker}|{session_code}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def _owner(workers: list[str], session_code: str) -> str | None:
+    if not workers:
+        return None
+    return max(workers, key=lambda worker: _score(worker, session_code))
+
+
+class ShardMap:
+    """Maps session codes onto their owning worker"""
+
+    def __init__(self, workers: Iterable[str] = SHARD_WORKERS, me: str = SHARD_SELF):
+        self.workers = list(workers)
+        self.me = me
+        if self.workers and me not in self.workers:
+            raise ValueError(f"This worker ({me!r}) is not one of the shard workers")
+
+    def owner(self, session_code: str) -> str:
+        """Address of the worker that owns a session"""
+        return _owner(self.workers, session_code) or self.me
+
+    def is_local(self, session_code: str) -> bool:
+        return self.owner(session_code) == self.me
+
+    def rebalance(self, workers: Iterable[str], session_codes: Iterable[str]) -> dict[str, str]:
+        """
+        Switch to a new set of workers.
+        Returns session_code -> new owner for the given (locally held) sessions that moved away.
+        """
+        previous = self.workers
+        self.workers = list(workers)
+
+        moved = {}
+        for code in session_codes:
+            was_local = (_owner(previous, code) or self.me) == self.me
+            if was_local and not self.is_local(code):
+                moved[code] = self.owner(code)
+        return moved
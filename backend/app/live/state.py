@@ -0,0 +1,549 @@
+"""
+Authoritative in-memory state of live sessions, persisted write-behind.
+
+While a quiz is running its participants, scores, current question and submitted answers
+live in a LiveSession, so the WebSocket handlers can read and update them in O(1)
+without a database round trip. Every change is also recorded, and the
+LiveSessionStore writes the recorded changes of every session to the database,
+each session in its own transaction, every LIVE_PERSIST_INTERVAL seconds (sooner
+when many changes pile up). The database therefore lags the live state by a
+bounded amount, and a session is flushed synchronously when it ends (if that fails
+the background writer keeps trying to write it and its end). Changes that
+keep failing are set aside after LIVE_PERSIST_MAX_ATTEMPTS tries, so one bad row
+cannot hold back the writes of the session forever.
+
+Whoever needs to know that a change is in the database, e.g. to acknowledge an answer,
+awaits LiveSession.committed(): a future shared by all changes recorded since the last
+flush, set to True once the transaction that holds them commits, or to False if they
+were set aside.
+"""
+import asyncio
+import logging
+import os
+import secrets
+import time
+from array import array
+from datetime import UTC, datetime
+from collections import deque
+from collections.abc import Mapping
+from typing import Callable, Iterator, NamedTuple, Optional
+
+from sqlalchemy.orm import Session
+
+from app.db import crud, database
+from app.db.models import Session as SessionModel, SessionStatus
+
+from .deck import encode_views
+from .encoding import Preencoded
+from .leaderboard import Leaderboard
+from .records import Participant
+
+# ==================== CONFIG ====================
+PERSIST_INTERVAL = float(os.getenv("LIVE_PERSIST_INTERVAL", "0.5"))  # seconds
+PERSIST_MAX_PENDING = int(os.getenv("LIVE_PERSIST_MAX_PENDING", "500"))  # changes before an early flush
+PERSIST_MAX_ATTEMPTS = int(os.getenv("LIVE_PERSIST_MAX_ATTEMPTS", "5"))  # failed writes before changes are dead-lettered
+ANSWER_GRACE = float(os.getenv("LIVE_ANSWER_GRACE", "0.5"))  # seconds after the time limit an answer still counts
+# ================================================
+
+logger = logging.getLogger(__name__)
+
+
+class LiveQuestion(NamedTuple):
+    """The parts of a Question needed while the session runs"""
+    id: int
+    order: int
+    correct_answer: Optional[str]
+    points: int
+    time_limit: int
+    view: Optional[Preencoded] = None  # what participants see of it, see app.live.deck
+    host_view: Optional[Preencoded] = None
+
+
+class LiveSession:
+    """In-memory state of one running session"""
+
+    def __init__(
+        self,
+        session_id: int,
+        code: str,
+        questions: list[LiveQuestion],
+        current_question_index: int = 0,
+        started: bool = False
+    ):
+        self.session_id = session_id
+        self.code = code
+        self.questions: dict[int, LiveQuestion] = {q.id: q for q in questions}
+        self.question_order: list[int] = [q.id for q in sorted(questions, key=lambda q: q.order)]
+        self.current_question_index = current_question_index
+        self.started = started
+        self.ended = False
+        self.question: dict | None = None  # question_start payload of the current question
+        self.opened_at: dict[int, float] = {}  # question_id -> time.monotonic() it was started
+        self.question_timer = None  # Timer that ends the current question
+
+        self.participants: dict[int, Participant] = {}  # participant_id -> participant
+        self._slots: list[Participant] = []  # slot -> participant
+        self.ranking = Leaderboard()  # by slot
+        self.scores = Scores(self)  # participant_id -> total score, read only
+        # slot -> rank (0: none yet) and score last sent to the participant
+        self._reported_rank = array("l")
+        self._reported_score = array("q")
+        self.answers: dict[tuple[int, int], int] = {}  # (participant_id, question_id) -> score
+        self.answer_counts: dict[int, int] = {}  # question_id -> number of answers
+        self.resume_tokens: dict[str, int] = {}  # resume token -> participant_id
+
+        # changes not yet written to the database
+        self._new_answers: list[dict] = []
+        self._rescored: dict[tuple[int, int], int] = {}
+        self._score_deltas: dict[int, int] = {}
+        self._index_changed = False
+        self._started_at: datetime | None = None  # when the session started, if that is not written yet
+        self.dirty_since: float | None = None
+        # futures of the changes not yet written, the last one is shared by the changes since the last flush
+        self._waiters: list[asyncio.Future] = []
+        self._waiter: asyncio.Future | None = None
+
+    @classmethod
+    def load(cls, db: Session, session: SessionModel) -> "LiveSession":
+        """Build the live state of a session, with its questions pre-encoded, from the database"""
+        questions = [
+            LiveQuestion(q.id, q.order, q.correct_answer, q.points, q.time_limit, *encode_views(q))
+            for q in crud.get_questions_by_quiz(db, session.quiz_id)
+        ]
+        live = cls(
+            session.id,
+            session.code,
+            questions,
+            current_question_index=session.current_question_index or 0,
+            started=session.status != SessionStatus.WAITING
+        )
+        live.ended = session.status == SessionStatus.ENDED
+        for participant in crud.get_participants_by_session(db, session.id):
+            live.add_participant(participant.id, participant.name, participant.total_score or 0)
+        for answer in crud.get_answers_for_session(db, session.id):
+            live.answers[(answer.participant_id, answer.question_id)] = answer.score or 0
+            live.answer_counts[answer.question_id] = live.answer_counts.get(answer.question_id, 0) + 1
+        return live
+
+    # ==================== STATE ====================
+
+    @property
+    def current_question(self) -> Optional[LiveQuestion]:
+        if not self.started or self.current_question_index >= len(self.question_order):
+            return None
+        return self.questions[self.question_order[self.current_question_index]]
+
+    @property
+    def upcoming_question_index(self) -> int:
+        """Index of the question after the current one, of the first one before the session started"""
+        return self.current_question_index + 1 if self.started else self.current_question_index
+
+    @property
+    def upcoming_question(self) -> Optional[LiveQuestion]:
+        index = self.upcoming_question_index
+        if index >= len(self.question_order):
+            return None
+        return self.questions[self.question_order[index]]
+
+    @property
+    def pending_changes(self) -> int:
+        return (
+            len(self._new_answers) + len(self._rescored) + len(self._score_deltas)
+            + self._index_changed + (self._started_at is not None)
+        )
+
+    def add_participant(self, participant_id: int, name: str, score: int = 0):
+        """Register a participant that was created in the database"""
+        participant = self.participants.get(participant_id)
+        if participant is not None:
+            participant.name = name
+            return
+        participant = self.participants[participant_id] = Participant(participant_id, name, len(self._slots))
+        self._slots.append(participant)
+        self._reported_rank.append(0)
+        self._reported_score.append(0)
+        self.ranking.set(participant.slot, score)
+
+    def rank(self, participant_id: int) -> Optional[int]:
+        """1-based rank of a participant, None if there is no such participant"""
+        participant = self.participants.get(participant_id)
+        return self.ranking.rank(participant.slot) if participant else None
+
+    def issue_resume_token(self, participant_id: int, previous: str = None) -> str:
+        """New token a participant can reconnect with, replacing the previous one"""
+        self.resume_tokens.pop(previous, None)
+        token = secrets.token_urlsafe(16)
+        self.resume_tokens[token] = participant_id
+        return token
+
+    def next_question(self, index: int = None) -> int:
+        """Move to the given or the next question, returns the new index"""
+        if index is None:
+            index = self.upcoming_question_index
+        if not self.started:
+            self.started = True
+            self._started_at = datetime.now(UTC)
+            self._touch()
+        if index != self.current_question_index:
+            self.current_question_index = index
+            self._index_changed = True
+            self._touch()
+        question = self.current_question
+        if question is not None:
+            self.opened_at[question.id] = time.monotonic()
+        return index
+
+    def deadline(self, question_id: int) -> Optional[float]:
+        """time.monotonic() at which the time limit of a started question runs out, None if it has none"""
+        question = self.questions.get(question_id)
+        opened = self.opened_at.get(question_id)
+        if question is None or opened is None or not question.time_limit:
+            return None
+        return opened + question.time_limit
+
+    def submit_answer(
+        self,
+        participant_id: int,
+        question_id: int,
+        answer_text: str
+    ) -> Optional[tuple[bool, int]]:
+        """
+        Grade and record an answer, timed by the server clock.
+        Returns (is_correct, score), or None if the answer is not accepted
+        (session ended, unknown participant, not the current question or not opened yet, already answered,
+        or too late).
+        """
+        question = self.current_question
+        opened = self.opened_at.get(question_id)
+        key = (participant_id, question_id)
+        if self.ended or question is None or question.id != question_id or opened is None:
+            return None
+        if participant_id not in self.participants or key in self.answers:
+            return None
+        now = time.monotonic()
+        deadline = self.deadline(question_id)
+        if deadline is not None and now > deadline + ANSWER_GRACE:
+            return None
+        time_taken = round(now - opened, 3)
+
+        is_correct, score = crud.grade_answer(question, answer_text or "")
+        self.answers[key] = score
+        self.answer_counts[question_id] = self.answer_counts.get(question_id, 0) + 1
+        self._add_score(participant_id, score)
+        self._new_answers.append({
+            "session_id": self.session_id,
+            "participant_id": participant_id,
+            "question_id": question_id,
+            "answer_text": answer_text,
+            "is_correct": is_correct,
+            "score": score,
+            "time_taken": time_taken,
+        })
+        self._touch()
+        return is_correct, score
+
+    def score_answer(self, participant_id: int, question_id: int, score: int) -> Optional[int]:
+        """Manually (re)score an answer. Returns the change in score, or None if there is no such answer."""
+        key = (participant_id, question_id)
+        if key not in self.answers:
+            return None
+
+        diff = score - self.answers[key]
+        self._add_score(participant_id, diff)
+        self.answers[key] = score
+        self._rescored[key] = score
+        self._touch()
+        return diff
+
+    def leaderboard(self, limit: int = None) -> list[dict]:
+        """The best `limit` (default: all) participants, best first"""
+        board = []
+        for rank, (slot, score) in enumerate(self.ranking.top(limit), start=1):
+            participant = self._slots[slot]
+            board.append({"rank": rank, "participant_id": participant.id, "name": participant.name, "total_score": score})
+        return board
+
+    def rank_changes(self) -> dict[int, dict]:
+        """
+        Personal standing of every participant whose rank changed since the previous call:
+        participant_id -> {"rank", "total_score", "delta"}, delta being the points gained since then.
+        """
+        changes = {}
+        reported_rank, reported_score = self._reported_rank, self._reported_score
+        for rank, (slot, score) in enumerate(self.ranking, start=1):
+            if reported_rank[slot] != rank:
+                delta = score - reported_score[slot]
+                changes[self._slots[slot].id] = {"rank": rank, "total_score": score, "delta": delta}
+                reported_rank[slot], reported_score[slot] = rank, score
+        return changes
+
+    def _add_score(self, participant_id: int, points: int):
+        if points:
+            self.ranking.add(self.participants[participant_id].slot, points)
+            self._score_deltas[participant_id] = self._score_deltas.get(participant_id, 0) + points
+
+    def _touch(self):
+        if self.dirty_since is None:
+            self.dirty_since = time.monotonic()
+
+    # ==================== PERSISTENCE ====================
+
+    def committed(self) -> asyncio.Future:
+        """Future that is set once the changes recorded so far are written: True, or False if they were given up on"""
+        if self._waiter is None:
+            self._waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(self._waiter)
+        return self._waiter
+
+    def take_changes(self) -> Optional[dict]:
+        """Hand over the changes recorded since the last call, None if there are none"""
+        if not self.pending_changes:
+            return None
+
+        changes = {
+            "session_id": self.session_id,
+            "current_question_index": self.current_question_index if self._index_changed else None,
+            "started_at": self._started_at,
+            "answers": self._new_answers,
+            "rescored": [
+                {"participant_id": pid, "question_id": qid, "score": score}
+                for (pid, qid), score in self._rescored.items()
+            ],
+            "score_deltas": self._score_deltas,
+            "dirty_since": self.dirty_since,
+            "waiters": self._waiters,
+        }
+        self._waiters = []
+        self._waiter = None
+        self._new_answers = []
+        self._rescored = {}
+        self._score_deltas = {}
+        self._index_changed = False
+        self._started_at = None
+        self.dirty_since = None
+        return changes
+
+    def restore_changes(self, changes: dict):
+        """Put back changes that could not be written, in front of anything recorded since"""
+        self._new_answers[:0] = changes["answers"]
+        for r in changes["rescored"]:
+            self._rescored.setdefault((r["participant_id"], r["question_id"]), r["score"])
+        for pid, delta in changes["score_deltas"].items():
+            self._score_deltas[pid] = self._score_deltas.get(pid, 0) + delta
+        if changes["current_question_index"] is not None:
+            self._index_changed = True
+        if changes["started_at"] is not None:
+            self._started_at = changes["started_at"]
+        self.dirty_since = min(filter(None, [self.dirty_since, changes["dirty_since"]]), default=None)
+        self._waiters = changes["waiters"] + self._waiters
+
+
+def _default_session() -> Session:
+    return database.SessionLocal()
+
+
+def _settle(waiters: list[asyncio.Future], written: bool):
+    for waiter in waiters:
+        if not waiter.done():
+            waiter.set_result(written)
+
+
+class Scores(Mapping):
+    """Read only participant_id -> total score view of the slot indexed leaderboard of a session"""
+
+    def __init__(self, live: LiveSession):
+        self._live = live
+
+    def __getitem__(self, participant_id: int) -> int:
+        return self._live.ranking.score(self._live.participants[participant_id].slot)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._live.participants)
+
+    def __len__(self) -> int:
+        return len(self._live.participants)
+
+
+class LiveSessionStore:
+    """The live sessions of this worker and their write-behind persistence"""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = _default_session,
+        interval: float = PERSIST_INTERVAL,
+        max_pending: int = PERSIST_MAX_PENDING,
+        max_attempts: int = PERSIST_MAX_ATTEMPTS
+    ):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.sessions: dict[str, LiveSession] = {}
+        self.dead_letters: deque[dict] = deque(maxlen=100)  # the most recent changes given up on
+        self._attempts: dict[str, int] = {}  # session code -> failed writes of its pending changes
+        self._ending: set[str] = set()  # codes of the ended sessions whose end is not written yet
+
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._lock = asyncio.Lock()
+
+        # counters
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.dead_lettered = 0
+        self.max_lag = 0.0
+
+    def get(self, session_code: str) -> Optional[LiveSession]:
+        return self.sessions.get(session_code)
+
+    async def open(self, db: Session, session: SessionModel) -> LiveSession:
+        """Live state of a session, loaded from the database in a thread the first time"""
+        live = self.sessions.get(session.code)
+        if live is None:
+            loaded = await asyncio.to_thread(LiveSession.load, db, session)
+            # another connection may have loaded it in the meantime
+            live = self.sessions.setdefault(session.code, loaded)
+        self._ensure_started()
+        return live
+
+    def notify(self, live: LiveSession):
+        """Flush early if a session has piled up many changes"""
+        if live.pending_changes >= self.max_pending:
+            self._wakeup.set()
+
+    def lag(self) -> float:
+        """Age in seconds of the oldest change not yet written"""
+        oldest = min((s.dirty_since for s in self.sessions.values() if s.dirty_since), default=None)
+        return time.monotonic() - oldest if oldest else 0.0
+
+    def metrics(self) -> dict:
+        return {
+            "sessions": len(self.sessions),
+            "ending": len(self._ending),
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "dead_lettered": self.dead_lettered,
+            "lag": self.lag(),
+            "max_lag": self.max_lag,
+        }
+
+    async def end(self, session_code: str) -> Optional[LiveSession]:
+        """
+        Flush a session synchronously and mark it ended. It is forgotten once it is fully written,
+        if that fails the background writer retries it.
+        """
+        live = self.sessions.get(session_code)
+        if live is None:
+            return None
+        live.ended = True
+        self._ending.add(session_code)
+        await self._finish(live)
+        return live
+
+    async def _finish(self, live: LiveSession) -> bool:
+        """Write what is left of an ended session and its end, then forget it"""
+        if not await self.flush([live]):
+            return False
+        try:
+            await asyncio.to_thread(self._end, live.session_id)
+        except Exception:
+            self.failed_flushes += 1
+            logger.exception("Could not write the end of session %s", live.code)
+            return False
+        self._ending.discard(live.code)
+        self.sessions.pop(live.code, None)
+        return True
+
+    async def _finish_ended(self):
+        for code in list(self._ending):
+            live = self.sessions.get(code)
+            if live is None:
+                self._ending.discard(code)
+            else:
+                await self._finish(live)
+
+    async def evict(self, session_code: str):
+        """Write a session that moved to another worker and forget it, its new owner loads it from the database"""
+        live = self.sessions.get(session_code)
+        if live is None or session_code in self._ending:
+            return  # an ended session is forgotten once its end is written
+        # retried until written or dead-lettered, the new owner must not miss the changes made here
+        while not await self.flush([live]):
+            await asyncio.sleep(self.interval)
+        self.sessions.pop(session_code, None)
+
+    async def flush(self, sessions: list[LiveSession] = None) -> bool:
+        """
+        Write the pending changes of the given (default: all) sessions, each session in its own
+        transaction. Returns False if the changes of any of them could not be written.
+        """
+        async with self._lock:
+            if sessions is None:
+                sessions = list(self.sessions.values())
+            written = True
+            for live in sessions:
+                changes = live.take_changes()
+                if changes is not None:
+                    written = await self._flush_session(live, changes) and written
+            return written
+
+    async def _flush_session(self, live: LiveSession, changes: dict) -> bool:
+        try:
+            await asyncio.to_thread(self._write, [changes])
+        except Exception:
+            self.failed_flushes += 1
+            attempts = self._attempts[live.code] = self._attempts.get(live.code, 0) + 1
+            if attempts < self.max_attempts:
+                live.restore_changes(changes)
+            else:
+                # give up on these changes, the ones recorded since get a fresh start
+                del self._attempts[live.code]
+                _settle(changes.pop("waiters"), False)
+                self.dead_letters.append(changes)
+                self.dead_lettered += 1
+                logger.exception("Dead-lettered the changes of session %s after %d failed writes", live.code, attempts)
+            return False
+
+        self._attempts.pop(live.code, None)
+        _settle(changes["waiters"], True)
+        self.flushes += 1
+        self.max_lag = max(self.max_lag, time.monotonic() - changes["dirty_since"])
+        return True
+
+    async def close(self):
+        """Stop the background writer after a last flush"""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+        await self._finish_ended()
+
+    def _ensure_started(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+            await self._finish_ended()
+
+    def _write(self, changes: list[dict]):
+        db = self.session_factory()
+        try:
+            crud.save_live_changes(db, changes)
+            db.commit()
+        finally:
+            db.close()
+
+    def _end(self, session_id: int):
+        db = self.session_factory()
+        try:
+            crud.end_session(db, session_id)
+            db.commit()
+        finally:
+            db.close()
@@ -0,0 +1,151 @@
+"""
+Question deadlines of all live sessions, on one hierarchical timing wheel.
+
+Time is cut into ticks of LIVE_TIMER_TICK seconds. The lowest wheel has a slot per
+tick, and each higher wheel has a slot per full turn of the wheel below it. A timer
+goes into the slot of the lowest wheel whose range reaches its deadline. When a
+wheel comes around, the timers in its next higher slot are spread over the wheels
+below. Scheduling and cancelling are O(1), a tick only looks at one slot, and the
+cost does not grow with the number of sessions. Timers fire at most one tick late.
+"""
+import asyncio
+import inspect
+import math
+import os
+import time
+from typing import Callable
+
+# ==================== CONFIG ====================
+TIMER_TICK = float(os.getenv("LIVE_TIMER_TICK", "0.1"))  # seconds, the resolution of deadlines
+TIMER_SLOTS = 64  # slots per wheel
+TIMER_LEVELS = 4  # wheels, 64**4 ticks of 0.1s is about 19 days
+# ================================================
+
+
+class Timer:
+    """A scheduled callback, see TimingWheel.schedule"""
+
+    def __init__(self, tick: int, deadline: float, callback: Callable, args: tuple):
+        self.tick = tick  # tick of the wheel at which it fires
+        self.deadline = deadline  # time.monotonic() at which it fires
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+        self._slot: set | None = None
+
+    def cancel(self):
+        self.cancelled = True
+        if self._slot is not None:
+            self._slot.discard(self)
+            self._slot = None
+
+
+class TimingWheel:
+    """One scheduler for the timers of every session of the process"""
+
+    def __init__(self, tick: float = TIMER_TICK, slots: int = TIMER_SLOTS, levels: int = TIMER_LEVELS):
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self._wheels: list[list[set[Timer]]] = [[set() for _ in range(slots)] for _ in range(levels)]
+        self._origin = time.monotonic()
+        self._now = 0  # last tick that was processed
+        self._task: asyncio.Task | None = None
+        self._tasks: set[asyncio.Task] = set()  # running coroutines of fired timers
+        self.fired = 0
+        self.errors = 0
+
+    def __len__(self) -> int:
+        return sum(len(slot) for wheel in self._wheels for slot in wheel)
+
+    def schedule(self, delay: float, callback: Callable, *args) -> Timer:
+        """
+        Call callback(*args) after delay seconds, at the first tick from then on.
+        A coroutine returned by callback is run as a task.
+        """
+        deadline = time.monotonic() + delay
+        tick = max(math.ceil(self._ticks(deadline)), self._now + 1)
+        timer = Timer(tick, deadline, callback, args)
+        self._place(timer)
+        self._ensure_started()
+        return timer
+
+    def advance(self, now: float = None):
+        """Fire the timers of every tick up to now (default: time.monotonic())"""
+        now = time.monotonic() if now is None else now
+        target = int(self._ticks(now))
+        while self._now < target:
+            self._now += 1
+            self._cascade()
+            self._fire(self._wheels[0][self._now % self.slots])
+
+    def _ticks(self, moment: float) -> float:
+        # rounded, so float error cannot push a deadline into the next tick
+        return round((moment - self._origin) / self.tick, 6)
+
+    async def close(self):
+        """Stop ticking, timers that have not fired are dropped"""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        for task in list(self._tasks):
+            task.cancel()
+        for wheel in self._wheels:
+            for slot in wheel:
+                slot.clear()
+
+    def _place(self, timer: Timer):
+        delta = max(timer.tick - self._now, 1)
+        span = 1  # ticks per slot of the wheel
+        for level in range(self.levels):
+            if delta < span * self.slots or level == self.levels - 1:
+                # beyond the top wheel: park it in the farthest slot and place it again from there
+                tick = timer.tick if delta < span * self.slots else self._now + span * (self.slots - 1)
+                slot = self._wheels[level][(tick // span) % self.slots]
+                break
+            span *= self.slots
+        slot.add(timer)
+        timer._slot = slot
+
+    def _cascade(self):
+        """Spread the timers of the higher wheels that came around over the lower ones"""
+        for level in range(self.levels - 1, 0, -1):
+            span = self.slots ** level
+            if self._now % span == 0:
+                slot = self._wheels[level][(self._now // span) % self.slots]
+                timers = list(slot)
+                slot.clear()
+                for timer in timers:
+                    self._place(timer)
+
+    def _fire(self, slot: set[Timer]):
+        timers = list(slot)
+        slot.clear()
+        for timer in timers:
+            timer._slot = None
+            if timer.tick > self._now:
+                self._place(timer)
+                continue
+            self.fired += 1
+            try:
+                result = timer.callback(*timer.args)
+                if inspect.isawaitable(result):
+                    task = asyncio.ensure_future(result)
+                    self._tasks.add(task)
+                    task.add_done_callback(self._done)
+            except Exception:
+                self.errors += 1
+
+    def _done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            self.advance()
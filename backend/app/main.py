@@ -1,26 +1,58 @@
+import asyncio
+import signal
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 import os
 
 from app import auth
 from app import quiz
 from app import db
+from app import media
+from app import websocket_handler
+from app.db.query_count import QueryCountMiddleware
+from app.live.sharding import SHARD_WORKERS_FILE
+from app.websocket_handler import METRICS_INTERVAL, log_metrics, manager, reload_shards, store, timers
 
 
 # setup database
 db.init()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # heartbeat of the WebSocket connections
+    await manager.start()
+    metrics = asyncio.create_task(log_metrics()) if METRICS_INTERVAL else None
+    reload_on_hup = bool(SHARD_WORKERS_FILE) and hasattr(signal, "SIGHUP")
+    if reload_on_hup:
+        # kill -HUP re-reads WS_SHARD_WORKERS_FILE and hands off the sessions that moved
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, timers.schedule, 0, reload_shards)
+    yield
+    if reload_on_hup:
+        asyncio.get_running_loop().remove_signal_handler(signal.SIGHUP)
+    if metrics:
+        metrics.cancel()
+    await timers.close()
+    await store.close()
+    await manager.close()
+    await db.close_async_db()
+
+
 # create app
 app = FastAPI(
     title="Quiz App API",
     description="Real-time quiz application API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS configuration
 origins = os.getenv("CORS_ORIGINS", "http://localhost:5173").split(",")
 
+# X-Query-Count: database round trips of every request
+app.add_middleware(QueryCountMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -29,15 +61,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Static files for media uploads
-os.makedirs("media", exist_ok=True)
-app.mount("/media", StaticFiles(directory="media"), name="media")
+# Static files for media uploads, served from memory when cached
+app.mount("/media", media.files, name="media")
 
 # Include routers
 app.include_router(auth.router, prefix="/auth", tags=["Authentication"])
 app.include_router(quiz.router, prefix="/quizzes", tags=["Quizzes"])
 # app.include_router(sessions.router, prefix="/sessions", tags=["Sessions"])
-# app.include_router(websocket.router, prefix="/ws", tags=["WebSocket"])
+app.include_router(websocket_handler.router, prefix="/ws", tags=["WebSocket"])
 
 @app.get("/")
 async def root():
@@ -55,4 +86,13 @@ async def health_check():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    from app.live.compression import DeflateWebSocketProtocol, PER_MESSAGE_DEFLATE
+    
+    # permessage-deflate with the WS_DEFLATE_* settings, the uvicorn CLI cannot select them
+    uvicorn.run(
+        app, 
+        host="0.0.0.0", 
+        port=8000, 
+        ws=DeflateWebSocketProtocol, 
+        ws_per_message_deflate=PER_MESSAGE_DEFLATE
+    )
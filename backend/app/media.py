@@ -0,0 +1,200 @@
+"""
+Serving of uploaded media files from memory.
+
+Every device in a session asks for the media of a question at about the same
+moment, so /media keeps recently used files in a size bounded LRU cache instead
+of reading them from disk for every request. The session engine warms the cache
+with the media of the next question (see the prefetch message in
+websocket_handler) before it tells the clients to fetch it. Files that changed on
+disk are read again, files larger than MEDIA_CACHE_MAX_FILE are never cached.
+"""
+import hashlib
+import os
+import stat
+import threading
+from collections import OrderedDict
+from email.utils import formatdate
+from mimetypes import guess_type
+from typing import NamedTuple, Optional
+from urllib.parse import unquote, urlparse
+
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.staticfiles import NotModifiedResponse
+
+# ==================== CONFIG ====================
+MEDIA_DIR = os.getenv("MEDIA_DIR", "media")
+MEDIA_PREFIX = "/media/"  # where MEDIA_DIR is mounted
+CACHE_SIZE = int(os.getenv("MEDIA_CACHE_SIZE", str(64 * 2 ** 20)))  # bytes
+CACHE_MAX_FILE = int(os.getenv("MEDIA_CACHE_MAX_FILE", str(8 * 2 ** 20)))  # bytes
+# ================================================
+
+
+class CachedFile(NamedTuple):
+    data: bytes
+    mtime: float
+    headers: dict[str, str]
+
+
+def file_headers(path: str, stat_result: os.stat_result) -> dict[str, str]:
+    """The headers FileResponse sends for a file, so validators match either way"""
+    media_type = guess_type(path)[0] or "text/plain"
+    etag = hashlib.md5(f"{stat_result.st_mtime}-{stat_result.st_size}".encode(), usedforsecurity=False).hexdigest()
+    return {
+        "content-type": media_type,
+        "content-length": str(stat_result.st_size),
+        "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "etag": f'"{etag}"',
+        "accept-ranges": "bytes",
+    }
+
+
+def parse_range(header: str, size: int) -> Optional[tuple[int, int]]:
+    """(start, end) inclusive of a single 'bytes=start-end' range, None if it is not one"""
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    start, _, end = spec.strip().partition("-")
+    try:
+        if not start:
+            length = int(end)
+            return (max(size - length, 0), size - 1) if length > 0 else None
+        first = int(start)
+        last = min(int(end), size - 1) if end else size - 1
+    except ValueError:
+        return None
+    return (first, last) if first <= last else None
+
+
+class MediaCache:
+    """
+    Least recently used file contents, at most max_bytes in total.
+    Used from the event loop and from the threads warming it, so every access holds a lock.
+    """
+
+    def __init__(self, max_bytes: int = CACHE_SIZE, max_file_bytes: int = CACHE_MAX_FILE):
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.size = 0
+        self._files: OrderedDict[str, CachedFile] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._files)
+
+    def get(self, path: str, stat_result: os.stat_result) -> Optional[CachedFile]:
+        """The cached contents of path, unless the file changed since they were read"""
+        with self._lock:
+            cached = self._fresh(path, stat_result)
+            if cached is None:
+                self.misses += 1
+                return None
+            self._files.move_to_end(path)
+            self.hits += 1
+            return cached
+
+    def load(self, path: str) -> Optional[CachedFile]:
+        """Read path into the cache, blocks so call it from a thread"""
+        try:
+            stat_result = os.stat(path)
+        except OSError:
+            return None
+        if not stat.S_ISREG(stat_result.st_mode) or stat_result.st_size > self.max_file_bytes:
+            return None
+        with self._lock:
+            cached = self._fresh(path, stat_result)
+        if cached is not None:
+            return cached
+        with open(path, "rb") as file:  # outside the lock, hits are not held up by the disk
+            data = file.read()
+        if len(data) != stat_result.st_size:
+            return None  # changed while reading
+        with self._lock:
+            self._discard(path)
+            cached = self._files[path] = CachedFile(data, stat_result.st_mtime, file_headers(path, stat_result))
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._files.popitem(last=False)
+                self.size -= len(evicted.data)
+                self.evictions += 1
+        return cached
+
+    def discard(self, path: str):
+        with self._lock:
+            self._discard(path)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "files": len(self._files),
+                "bytes": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _fresh(self, path: str, stat_result: os.stat_result) -> Optional[CachedFile]:
+        cached = self._files.get(path)
+        if cached is None or cached.mtime != stat_result.st_mtime or len(cached.data) != stat_result.st_size:
+            return None
+        return cached
+
+    def _discard(self, path: str):
+        cached = self._files.pop(path, None)
+        if cached is not None:
+            self.size -= len(cached.data)
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles that answers from a MediaCache when it can"""
+
+    def __init__(self, *, cache: MediaCache, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache
+
+    def local_path(self, url: str) -> Optional[str]:
+        """The file a media URL of this mount refers to, None for other URLs"""
+        path = unquote(urlparse(url).path)
+        if not path.startswith(MEDIA_PREFIX):
+            return None
+        full_path, stat_result = self.lookup_path(path[len(MEDIA_PREFIX):])
+        return full_path if stat_result is not None else None
+
+    def warm(self, url: str) -> bool:
+        """Read the file behind a media URL into the cache, blocks so call it from a thread"""
+        path = self.local_path(url)
+        return path is not None and self.cache.load(path) is not None
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope, status_code: int = 200) -> Response:
+        cached = self.cache.get(str(full_path), stat_result)
+        if cached is None:
+            return super().file_response(full_path, stat_result, scope, status_code)
+
+        request_headers = Headers(scope=scope)
+        if self.is_not_modified(cached.headers, request_headers):
+            return NotModifiedResponse(cached.headers)
+        headers = dict(cached.headers)
+        body = cached.data
+        requested = request_headers.get("range")
+        byte_range = parse_range(requested, len(body)) if requested else None
+        if byte_range is not None:
+            start, end = byte_range
+            body = body[start:end + 1]
+            status_code = 206
+            headers["content-range"] = f"bytes {start}-{end}/{len(cached.data)}"
+            headers["content-length"] = str(len(body))
+        elif requested:
+            return super().file_response(full_path, stat_result, scope, status_code)
+        if scope["method"] == "HEAD":
+            body = b""
+        return Response(body, status_code=status_code, headers=headers)
+
+
+cache = MediaCache()
+os.makedirs(MEDIA_DIR, exist_ok=True)
+files = CachedStaticFiles(directory=MEDIA_DIR, cache=cache)
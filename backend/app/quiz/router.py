@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from .schemas import CreateQuiz, UpdateQuiz
+from .schemas import CreateQuiz, CreateQuizWithQuestions, QuizQuestion, SaveQuiz, UpdateQuiz
 from .. import db as database
 from ..auth import get_current_user
 
@@ -15,46 +15,99 @@ router = APIRouter()
 @router.get("/from-user")
 async def get_quizzes_by_user(
         user: database.User = Depends(get_current_user),
-        db: Session = Depends(database.get_db)):
-    quizzes: list[database.Quiz] = database.get_quizzes_by_user(db, user_id=user.id)
+        db: AsyncSession = Depends(database.get_async_db, scope="function")):
+    quizzes: list[database.Quiz] = await database.async_crud.get_quizzes_by_user(db, user_id=user.id)
     return quizzes
 
 
 @router.get("/{quiz_id}")
-async def get_quiz_by_id(quiz_id: int, db: Session = Depends(database.get_db)):
-    quiz = database.get_quiz_by_id(db, quiz_id=quiz_id)
+async def get_quiz_by_id(quiz_id: int, db: AsyncSession = Depends(database.get_async_db, scope="function")):
+    quiz = await database.async_crud.get_quiz_by_id(db, quiz_id=quiz_id)
     if not quiz:
         raise HTTPException(status_code=404, detail="Quiz not found")
 
     return quiz
 
+
+@router.get("/{quiz_id}/questions")
+async def get_questions_by_quiz(
+        quiz_id: int,
+        user: database.User = Depends(get_current_user),
+        db: AsyncSession = Depends(database.get_async_db, scope="function")):
+    """The questions of a quiz with their answers, for its creator only"""
+    quiz = await database.async_crud.get_quiz_by_id(db, quiz_id=quiz_id)
+    if not quiz:
+        raise HTTPException(status_code=404, detail="Quiz not found")
+
+    if quiz.creator_id != user.id:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+
+    return await database.async_crud.get_questions_by_quiz(db, quiz_id=quiz_id)
+
 # ==================== POST ====================
 
 @router.post("/create")
-async def create_quiz(quiz_info: CreateQuiz, db: Session = Depends(database.get_db)):
-    quiz = database.create_quiz(db, title=quiz_info.title, description=quiz_info.description, creator_id=quiz_info.creator_id)
+async def create_quiz(quiz_info: CreateQuiz, db: AsyncSession = Depends(database.get_async_db, scope="function")):
+    quiz = await database.async_crud.create_quiz(db, title=quiz_info.title, description=quiz_info.description, creator_id=quiz_info.creator_id)
     return quiz
 
 
+@router.post("/bulk")
+async def create_quiz_with_questions(
+        quiz_info: CreateQuizWithQuestions,
+        user: database.User = Depends(get_current_user),
+        db: AsyncSession = Depends(database.get_async_db, scope="function")):
+    """Create a quiz with all its questions in one request, the questions are inserted in one statement"""
+    quiz, questions = await database.async_crud.create_quiz_with_questions(
+        db, title=quiz_info.title, description=quiz_info.description, creator_id=user.id,
+        questions=[question_args(q) for q in quiz_info.questions]
+    )
+    return {"quiz": quiz, "questions": questions}
+
+
 # ==================== PUT ====================
 @router.put("/{quiz_id}")
 async def update_quiz(
         quiz_id: int,
         quiz_info: UpdateQuiz,
         user: database.User = Depends(get_current_user),
-        db: Session = Depends(database.get_db)):
-    quiz = database.get_quiz_by_id(db, quiz_id=quiz_id)
+        db: AsyncSession = Depends(database.get_async_db, scope="function")):
+    quiz = await database.async_crud.get_quiz_by_id(db, quiz_id=quiz_id)
     if not quiz:
         raise HTTPException(status_code=404, detail="Quiz not found")
 
     if quiz.creator_id != user.id:
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
-    quiz = database.update_quiz(db, quiz_id=quiz_id, title=quiz_info.title, description=quiz_info.description, is_published=quiz_info.is_published)
+    quiz = await database.async_crud.update_quiz(db, quiz_id=quiz_id, title=quiz_info.title, description=quiz_info.description, is_published=quiz_info.is_published)
     if not quiz:
         raise HTTPException(status_code=404, detail="Quiz not found")
 
     return quiz
 
 
+@router.put("/{quiz_id}/bulk")
+async def save_quiz(
+        quiz_id: int,
+        quiz_info: SaveQuiz,
+        user: database.User = Depends(get_current_user),
+        db: AsyncSession = Depends(database.get_async_db, scope="function")):
+    """Save a quiz and replace its questions in one request and one transaction"""
+    quiz = await database.async_crud.get_quiz_by_id(db, quiz_id=quiz_id)
+    if not quiz:
+        raise HTTPException(status_code=404, detail="Quiz not found")
+
+    if quiz.creator_id != user.id:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+
+    quiz = await database.async_crud.update_quiz(db, quiz_id=quiz_id, title=quiz_info.title, description=quiz_info.description, is_published=quiz_info.is_published)
+    questions = await database.async_crud.replace_questions(db, quiz_id, [question_args(q) for q in quiz_info.questions])
+    if questions is None:
+        raise HTTPException(status_code=400, detail="Question not in quiz")
+
+    return {"quiz": quiz, "questions": questions}
+
 
+def question_args(question: QuizQuestion) -> dict:
+    """The arguments of crud.create_question for a question of a request"""
+    return {"question_type": question.type, **question.model_dump(exclude={"type"})}
@@ -1,5 +1,9 @@
+from typing import Optional
+
 from pydantic import BaseModel
 
+from ..db.models import MediaType, QuestionType
+
 
 class User(BaseModel):
     username: str
@@ -13,4 +17,24 @@ class CreateQuiz(BaseModel):
 class UpdateQuiz(BaseModel):
     title: str
     description: str
-    is_published: bool
\ No newline at end of file
+    is_published: bool
+
+
+class QuizQuestion(BaseModel):
+    id: Optional[int] = None  # of an existing question, when saving a quiz
+    type: QuestionType
+    content: str
+    options: Optional[str] = None  # JSON list of the choices of a multiple choice question
+    correct_answer: Optional[str] = None
+    media_url: Optional[str] = None
+    media_type: Optional[MediaType] = None
+    points: int = 10
+    time_limit: int = 30
+
+class CreateQuizWithQuestions(BaseModel):
+    title: str
+    description: str
+    questions: list[QuizQuestion]  # in order
+
+class SaveQuiz(UpdateQuiz):
+    questions: list[QuizQuestion]  # in order, replaces the questions of the quiz
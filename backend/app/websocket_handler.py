@@ -1,59 +1,250 @@
 """
-Example WebSocket handler structure for quiz sessions
-This shows how to handle real-time communication between host and participants
+WebSocket handler for quiz sessions
+Handles the real-time communication between host and participants
 """
-from fastapi import WebSocket, WebSocketDisconnect
-import json
+from typing import Optional
+import asyncio
+import logging
+import os
+import time
+
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app import db as database
+from app import media
+from app.auth import get_current_user
+from app.live import FanOut, LiveSession, LiveSessionStore, ShardMap, TimingWheel
+from app.live.actor import SessionActors
+from app.live.encoding import JSON, Frame, Frames, Preencoded, decode, negotiate
+from app.live.leaderboard import LEADERBOARD_SIZE
+from app.live.ratelimit import RateLimiter
+from app.live.sharding import SHARD_WORKERS_FILE, read_workers
+from app.live.records import Connection, SessionConnections
+from app.live.replay import ReplayBuffer
+
+# Application specific close codes
+CLOSE_REDIRECT = 4001   # session is owned by another worker, see the redirect message
+CLOSE_FORBIDDEN = 4003
+CLOSE_NOT_FOUND = 4004
+CLOSE_GONE = 4008       # reaped: silent for too long or sends kept failing
+
+INVALID_MESSAGE = {"type": "error", "message": "Invalid message"}
+HANDLER_FAILED = {"type": "error", "message": "Message could not be handled"}
+
+# ==================== CONFIG ====================
+HEARTBEAT_INTERVAL = float(os.getenv("WS_HEARTBEAT_INTERVAL", "15"))  # seconds between pings
+IDLE_TIMEOUT = float(os.getenv("WS_IDLE_TIMEOUT", "45"))  # seconds without any message before reaping
+SESSION_EXPIRY = float(os.getenv("WS_SESSION_EXPIRY", "3600"))  # seconds without any connection before a session is forgotten
+CLOSE_TIMEOUT = float(os.getenv("WS_CLOSE_TIMEOUT", "5"))  # seconds to send what is queued before closing an ended session
+METRICS_INTERVAL = float(os.getenv("WS_METRICS_INTERVAL", "60"))  # seconds between metrics log lines, 0 disables them
+# ================================================
+
+logger = logging.getLogger(__name__)
 
 class ConnectionManager:
     """Manages WebSocket connections for quiz sessions"""
     
-    def __init__(self):
-        # session_code -> { "host": WebSocket, "participants": { participant_id: WebSocket } }
-        self.sessions: dict[str, dict] = {}
+    def __init__(
+        self, 
+        shards: ShardMap = None, 
+        store: LiveSessionStore = None,
+        heartbeat_interval: float = HEARTBEAT_INTERVAL, 
+        idle_timeout: float = IDLE_TIMEOUT,
+        session_expiry: float = SESSION_EXPIRY
+    ):
+        # session_code -> host and participant sockets
+        # All connections of a session are on the worker that owns it, see app.live.sharding.
+        self.sessions: dict[str, SessionConnections] = {}
+        # websocket -> its session, participant and when it was last heard from
+        self.connections: dict[WebSocket, Connection] = {}
+        # session_code -> number of connections reaped
+        self.reaped: dict[str, int] = {}
+        # session_code -> message type -> number of messages dropped for exceeding their rate limit
+        self.rate_limited: dict[str, dict[str, int]] = {}
+        # websocket -> token buckets of its rate limits, from the first message it sent
+        self.limiters: dict[WebSocket, RateLimiter] = {}
+        # session_code -> sequence numbers and recent events, kept across disconnects for resuming clients
+        self.replays: dict[str, ReplayBuffer] = {}
+        # session_code -> when the last connection of a session that has none left went away
+        self.empty_since: dict[str, float] = {}
+        # session_code -> actor that handles the inbound messages of the session one at a time
+        self.actors = SessionActors(on_error=self._handler_failed)
+        self.fanout = FanOut()
+        self.shards = shards or ShardMap()
+        # live state of the sessions, written and forgotten when a session is handed off
+        self.store = store
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.session_expiry = session_expiry
+        self._heartbeat_task: asyncio.Task | None = None
+    
+    async def start(self):
+        """Start the heartbeat"""
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
     
-    async def connect_host(self, session_code: str, websocket: WebSocket):
+    async def close(self):
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        await self.actors.close()
+        self.fanout.close()
+    
+    async def connect_host(
+        self, 
+        session_code: str, 
+        websocket: WebSocket, 
+        encoding: str = JSON, 
+        subprotocol: str = None
+    ):
         """Connect quiz host"""
-        await websocket.accept()
-        if session_code not in self.sessions:
-            self.sessions[session_code] = {"host": None, "participants": {}}
-        self.sessions[session_code]["host"] = websocket
+        await websocket.accept(subprotocol=subprotocol)
+        session = self._session(session_code)
+        if session.host:
+            self._forget(session.host)  # replaced by a reconnect
+        session.host = websocket
+        self._register(websocket, session_code, None, encoding)
     
     async def connect_participant(
         self, 
         session_code: str, 
         participant_id: str, 
-        websocket: WebSocket
+        websocket: WebSocket, 
+        encoding: str = JSON, 
+        subprotocol: str = None, 
+        notify: bool = True
     ):
         """Connect participant to quiz session"""
-        await websocket.accept()
-        if session_code not in self.sessions:
-            self.sessions[session_code] = {"host": None, "participants": {}}
-        self.sessions[session_code]["participants"][participant_id] = websocket
+        await websocket.accept(subprotocol=subprotocol)
+        session = self._session(session_code)
+        if participant_id in session.participants:
+            self._forget(session.participants[participant_id])  # replaced by a reconnect
+        session.participants[participant_id] = websocket
+        self._register(websocket, session_code, participant_id, encoding)
+        if not notify:
+            return
         
         # Notify host of new participant
-        if self.sessions[session_code]["host"]:
-            await self.send_to_host(session_code, {
-                "type": "participant_joined",
-                "participant_id": participant_id
-            })
+        await self.send_to_host(session_code, {
+            "type": "participant_joined",
+            "participant_id": participant_id
+        })
+    
+    def _session(self, session_code: str) -> SessionConnections:
+        session = self.sessions.get(session_code)
+        if session is None:
+            session = self.sessions[session_code] = SessionConnections()
+        return session
+    
+    def _register(self, websocket: WebSocket, session_code: str, participant_id: Optional[str], encoding: str):
+        self.connections[websocket] = Connection(session_code, participant_id)
+        self.fanout.open(websocket, encoding)
+    
+    def _forget(self, websocket: WebSocket):
+        self.connections.pop(websocket, None)
+        self.limiters.pop(websocket, None)
+        self.fanout.forget(websocket)
     
-    def disconnect(self, session_code: str, participant_id: str = None):
-        """Disconnect a participant or host"""
-        if session_code in self.sessions:
+    def touch(self, websocket: WebSocket):
+        """Record that a message was received from a connection"""
+        connection = self.connections.get(websocket)
+        if connection is not None:
+            connection.last_seen = time.monotonic()
+    
+    def allow(self, websocket: WebSocket, msg_type: str) -> bool:
+        """Whether a message received from a connection is within its rate limit, counts the ones that are not"""
+        connection = self.connections.get(websocket)
+        if connection is None:
+            return True
+        limiter = self.limiters.get(websocket)
+        if limiter is None:
+            limiter = self.limiters[websocket] = RateLimiter()
+        if limiter.allow(msg_type):
+            return True
+        dropped = self.rate_limited.setdefault(connection.session_code, {})
+        key = msg_type if isinstance(msg_type, str) and msg_type in limiter.limits else "other"
+        dropped[key] = dropped.get(key, 0) + 1
+        return False
+    
+    def disconnect(self, session_code: str, participant_id: str = None, websocket: WebSocket = None):
+        """
+        Disconnect a participant or host.
+        If websocket is given nothing happens unless it still is the registered connection,
+        so a late disconnect of a reaped connection cannot remove its replacement.
+        """
+        session = self.sessions.get(session_code)
+        if session:
             if participant_id:
-                self.sessions[session_code]["participants"].pop(participant_id, None)
+                if websocket is not None and session.participants.get(participant_id) is not websocket:
+                    return
+                self._forget(session.participants.pop(participant_id, None))
             else:
-                # Host disconnected - clean up session
-                self.sessions.pop(session_code, None)
+                if websocket is not None and session.host is not websocket:
+                    return
+                # the session goes on without its host, who can reconnect
+                self._forget(session.host)
+                session.host = None
+    
+    async def reap(self, websocket: WebSocket):
+        """Evict a dead connection from its session and close it"""
+        connection = self.connections.get(websocket)
+        if connection is None:
+            return
+        session_code, participant_id = connection.session_code, connection.participant_id
+        session = self.sessions.get(session_code)
+        if session:
+            if participant_id is None:
+                if session.host is websocket:
+                    session.host = None  # the session goes on, the host can reconnect
+            elif session.participants.get(participant_id) is websocket:
+                del session.participants[participant_id]
+        self._forget(websocket)
+        self.reaped[session_code] = self.reaped.get(session_code, 0) + 1
+        try:
+            await websocket.close(code=CLOSE_GONE)
+        except Exception:
+            pass
+    
+    async def heartbeat(self):
+        """Reap the connections that stayed silent for too long and ping the others"""
+        deadline = time.monotonic() - self.idle_timeout
+        for websocket in [ws for ws, connection in self.connections.items() if connection.last_seen < deadline]:
+            await self.reap(websocket)
+        
+        failed = await self.fanout.broadcast(list(self.connections), {"type": "ping"})
+        for websocket in failed:
+            await self.reap(websocket)
+        
+        await self.expire_abandoned()
+    
+    async def expire_abandoned(self):
+        """Forget the sessions nobody was connected to for session_expiry seconds, their state stays in the database"""
+        now = time.monotonic()
+        codes = set(self.sessions) | set(self.store.sessions if self.store is not None else ())
+        for session_code in codes:
+            session = self.sessions.get(session_code)
+            if session and (session.host or session.participants):
+                self.empty_since.pop(session_code, None)
+            elif now - self.empty_since.setdefault(session_code, now) >= self.session_expiry:
+                if self.store is not None:
+                    live = self.store.get(session_code)
+                    if live and live.question_timer:
+                        live.question_timer.cancel()
+                    await self.store.evict(session_code)
+                self._drop(session_code)
+    
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await self.heartbeat()
+            except Exception:
+                pass  # a failing round must not stop the heartbeat
     
     async def send_to_host(self, session_code: str, message: dict):
         """Send message to host"""
-        if session_code in self.sessions and self.sessions[session_code]["host"]:
-            try:
-                await self.sessions[session_code]["host"].send_json(message)
-            except:
-                pass
+        await self._route(session_code, "host", message)
     
     async def send_to_participant(
         self, 
@@ -62,60 +253,370 @@ class ConnectionManager:
         message: dict
     ):
         """Send message to specific participant"""
-        if session_code in self.sessions:
-            websocket = self.sessions[session_code]["participants"].get(participant_id)
-            if websocket:
-                try:
-                    await websocket.send_json(message)
-                except:
-                    pass
+        await self._route(session_code, "participant", message, participant_id)
     
     async def broadcast_to_participants(self, session_code: str, message: dict):
-        """Broadcast message to all participants"""
-        if session_code in self.sessions:
-            for websocket in self.sessions[session_code]["participants"].values():
-                try:
-                    await websocket.send_json(message)
-                except:
-                    pass
+        """Broadcast message to all participants concurrently"""
+        await self._route(session_code, "participants", message)
     
     async def broadcast_to_all(self, session_code: str, message: dict):
-        """Broadcast to host and all participants"""
-        await self.send_to_host(session_code, message)
-        await self.broadcast_to_participants(session_code, message)
+        """Broadcast to host and all participants concurrently"""
+        await self._route(session_code, "all", message)
+    
+    async def send_direct(self, websocket: WebSocket, message: dict):
+        """Send a message to one connection, outside the sequence of session events"""
+        await self.fanout.send(websocket, message)
+    
+    async def _route(self, session_code: str, target: str, message: dict, participant_id: str = None):
+        """Number message as the next event of its session and deliver it to the targeted connections"""
+        replay = self._replay(session_code)
+        seq = replay.next_seq()
+        session = self.sessions.get(session_code)
+        if not session:
+            return
+        
+        frames = Frames({**message, "seq": seq})
+        replay.append(seq, target, participant_id, message.get("type"), frames)
+        
+        if target == "host":
+            websockets = [session.host] if session.host else []
+        elif target == "participant":
+            websocket = session.participants.get(participant_id)
+            websockets = [websocket] if websocket else []
+        elif target == "all":
+            websockets = session.websockets()
+        else:
+            websockets = list(session.participants.values())
+        
+        failed = await self.fanout.broadcast(websockets, frames, message.get("type"))
+        for websocket in failed:
+            await self.reap(websocket)
+    
+    def _replay(self, session_code: str) -> ReplayBuffer:
+        replay = self.replays.get(session_code)
+        if replay is None:
+            replay = self.replays[session_code] = ReplayBuffer()
+        return replay
+    
+    def seq(self, session_code: str) -> int:
+        """Sequence number of the last event of a session"""
+        replay = self.replays.get(session_code)
+        return replay.seq if replay else 0
+    
+    async def resume(self, session_code: str, websocket: WebSocket, last_seq: int, participant_id: str = None) -> bool:
+        """
+        Replay the events after last_seq to a reconnected participant (or host).
+        Returns False if they cannot all be replayed, the client then needs a snapshot.
+        The events are sent as one array frame, so they take a single place in its outbox.
+        """
+        replay = self.replays.get(session_code)
+        missed = replay.since(last_seq, participant_id) if replay else None
+        if missed is None:
+            return False
+        if missed:
+            self.fanout.send_batch(websocket, [frames for _, frames in missed])
+        return True
+    
+    async def end(self, session_code: str):
+        """Forget a session that ended, its connections are closed once they were sent what is queued for them"""
+        session = self._drop(session_code)
+        if session:
+            await asyncio.gather(*(self._close(websocket) for websocket in session.websockets()))
+    
+    async def _close(self, websocket: WebSocket):
+        outbox = self.fanout.outboxes.get(websocket)
+        if outbox:
+            try:
+                await asyncio.wait_for(outbox.join(), CLOSE_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+        self._forget(websocket)
+        try:
+            await websocket.close()
+        except Exception:
+            pass
+    
+    def _drop(self, session_code: str) -> Optional[SessionConnections]:
+        """Forget everything kept about a session, returns its connections"""
+        self.replays.pop(session_code, None)
+        self.reaped.pop(session_code, None)
+        self.rate_limited.pop(session_code, None)
+        self.empty_since.pop(session_code, None)
+        return self.sessions.pop(session_code, None)
+    
+    async def rebalance(self, workers: list[str]):
+        """Switch to a new set of shard workers and hand off the sessions that moved away"""
+        codes = set(self.sessions) | set(self.store.sessions if self.store is not None else ())
+        moved = self.shards.rebalance(workers, codes)
+        for session_code, owner in moved.items():
+            await self.handoff(session_code, owner)
+    
+    async def handoff(self, session_code: str, owner: str):
+        """Write the live state of a session and redirect its connections to the worker that now owns it"""
+        if self.store is not None:
+            live = self.store.get(session_code)
+            if live and live.question_timer:
+                live.question_timer.cancel()
+            await self.store.evict(session_code)
+        session = self._drop(session_code)
+        if not session:
+            return
+        websockets = session.websockets()
+        
+        frames = Frames({"type": "redirect", "url": owner})
+        sends = []
+        for websocket in websockets:
+            sends.append(redirect(websocket, frames.get(self.fanout.encoding(websocket))))
+            self._forget(websocket)
+        await asyncio.gather(*sends)
+    
+    async def _handler_failed(self, handler, args: tuple, exc: Exception):
+        """Tell the sender of a message that it could not be handled"""
+        if handler is handle_participant_message:
+            session_code, participant_id, message = args
+            if message.get("type") == "submit_answer":
+                reply = {"type": "answer_rejected", "question_id": message.get("question_id")}
+            else:
+                reply = HANDLER_FAILED
+            await self.send_to_participant(session_code, participant_id, reply)
+        elif handler is handle_host_message:
+            session_code, _ = args
+            await self.send_to_host(session_code, HANDLER_FAILED)
+    
+    def session_metrics(self, session_code: str) -> dict:
+        """
+        Live and reaped connections, outbound queue depth and drop counters of a session,
+        inbound messages dropped by the rate limits, and the inbound queue depth and
+        processing latency of its actor
+        """
+        session = self.sessions.get(session_code)
+        if not session:
+            return {}
+        websockets = session.websockets()
+        return {
+            "live": len(websockets),
+            "reaped": self.reaped.get(session_code, 0),
+            "rate_limited": dict(self.rate_limited.get(session_code, {})),
+            **self.fanout.metrics(websockets),
+            "actor": self.actors.metrics(session_code)
+        }
+
+
+# Global connection manager, live session state and question timers
+store = LiveSessionStore()
+manager = ConnectionManager(store=store)
+timers = TimingWheel()
+
+
+def worker_metrics() -> dict:
+    """Connections and outbound queues of this worker, its write-behind store, question timers and media cache"""
+    return {
+        "sessions": len(manager.sessions),
+        **manager.fanout.metrics(list(manager.connections)),
+        "store": store.metrics(),
+        "timers": {"scheduled": len(timers), "fired": timers.fired, "errors": timers.errors},
+        "media": media.cache.metrics(),
+    }
+
 
+async def reload_shards(path: str = SHARD_WORKERS_FILE):
+    """Re-read the shard workers from their file and hand off the sessions now owned by another worker"""
+    try:
+        workers = await asyncio.to_thread(read_workers, path)
+    except OSError:
+        logger.exception("Could not read the shard workers from %s", path)
+        return
+    logger.info("Rebalancing onto %s", workers)
+    await manager.rebalance(workers)
 
-# Global connection manager instance
-manager = ConnectionManager()
+
+async def log_metrics(interval: float = METRICS_INTERVAL):
+    """Log the metrics of this worker every interval seconds"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            logger.info("Live metrics: %s", worker_metrics())
+        except Exception:
+            logger.exception("Could not collect the live metrics")
 
 
 async def handle_host_message(session_code: str, message: dict):
     """Process messages from host"""
     msg_type = message.get("type")
+    live = store.get(session_code)
     
     if msg_type == "next_question":
-        # Broadcast next question to all participants
-        question_data = message.get("question")
+        # Move to the next (or requested) question and broadcast it to all participants
+        # The question comes from the deck loaded when the session was opened, so the
+        # host only has to send the index. A question sent along is relayed as before
+        # for sessions without a deck.
+        index, question, host_view = None, message.get("question"), None
+        if live:
+            requested = message.get("index")
+            if requested is not None and not valid_index(requested, live):
+                await manager.send_to_host(session_code, {"type": "error", "message": "Invalid question index"})
+                return
+            index = live.next_question(requested)
+            current = live.current_question
+            if current is not None and current.view is not None:
+                question, host_view = current.view, current.host_view
+            live.question = question.value if isinstance(question, Preencoded) else question
+            start_question_timer(session_code, live)
         await manager.broadcast_to_participants(session_code, {
             "type": "question_start",
-            "question": question_data
+            "question_index": index,
+            "question": question
         })
+        if host_view is not None:
+            await manager.send_to_host(session_code, {
+                "type": "question_start",
+                "question_index": index,
+                "question": host_view
+            })
+        if live and prefetch_hint(live):
+            # Off the actor, answers to the question that just started should not wait for the disk
+            timers.schedule(0, send_prefetch, session_code, live)
     
     elif msg_type == "end_session":
-        # End the session
+        # Write everything to the database before telling anybody the session is over
+        if live and live.question_timer:
+            live.question_timer.cancel()
+        await store.end(session_code)
         await manager.broadcast_to_all(session_code, {
             "type": "session_ended"
         })
+        await manager.end(session_code)
     
     elif msg_type == "score_answer":
         # Manual scoring for open-ended questions
         participant_id = message.get("participant_id")
+        question_id = message.get("question_id")
         score = message.get("score")
-        # Update score in database
+        if not live or participant_id is None or score is None:
+            return
+        if not valid_score(score):
+            await manager.send_to_host(session_code, {"type": "error", "message": "Invalid score"})
+            return
+        if live.score_answer(int(participant_id), question_id, score) is None:
+            return
+        store.notify(live)
+        
         # Send updated leaderboard to all
-        await manager.broadcast_to_all(session_code, {
-            "type": "leaderboard_update",
-            "leaderboard": []  # Fetch from database
+        await broadcast_leaderboard(session_code, live)
+
+
+def valid_index(index, live: LiveSession) -> bool:
+    """Whether a question index sent by the host is one of the questions of the session"""
+    return isinstance(index, int) and not isinstance(index, bool) and 0 <= index < len(live.question_order)
+
+
+def valid_score(score) -> bool:
+    """Whether a score sent by the host is a whole number of points"""
+    return isinstance(score, int) and not isinstance(score, bool)
+
+
+def start_question_timer(session_code: str, live: LiveSession):
+    """(Re)schedule the end of the current question for when its time limit runs out"""
+    if live.question_timer:
+        live.question_timer.cancel()
+        live.question_timer = None
+    question = live.current_question
+    deadline = live.deadline(question.id) if question else None
+    if deadline is not None:
+        live.question_timer = timers.schedule(
+            deadline - time.monotonic(),
+            manager.actors.tell, session_code, end_question, session_code, live.current_question_index
+        )
+
+
+async def end_question(session_code: str, index: int):
+    """
+    Tell everybody the time of a question is up, unless the session moved on in the meantime.
+    The grading of the question is then written at once, its score deltas in a single UPDATE.
+    """
+    live = store.get(session_code)
+    if not live or live.ended or live.current_question_index != index:
+        return
+    live.question_timer = None
+    question = live.current_question
+    await manager.broadcast_to_all(session_code, {
+        "type": "question_end",
+        "question_index": index,
+        "question_id": question.id,
+        "answer_count": live.answer_counts.get(question.id, 0)
+    })
+    await store.flush([live])
+
+
+def prefetch_hint(live: LiveSession) -> Optional[dict]:
+    """Message telling clients to fetch the media of the next question ahead of time, None if it has none"""
+    upcoming = live.upcoming_question
+    if upcoming is None or upcoming.view is None or not upcoming.view.value["media_url"]:
+        return None
+    return {
+        "type": "prefetch",
+        "question_index": live.upcoming_question_index,
+        "media_url": upcoming.view.value["media_url"],
+        "media_type": upcoming.view.value["media_type"],
+    }
+
+
+async def send_prefetch(session_code: str, live: LiveSession):
+    """
+    Read the media of the next question into the /media cache, then tell everybody to
+    fetch it, so the downloads of all clients while the current question runs are
+    served from memory and the media is already there when the question starts
+    """
+    hint = prefetch_hint(live)
+    if hint is None:
+        return
+    await asyncio.to_thread(media.files.warm, hint["media_url"])
+    await manager.broadcast_to_all(session_code, hint)
+
+
+def snapshot(live: LiveSession, participant_id: str = None) -> dict:
+    """Compact state of a session, for a client that missed more events than can be replayed"""
+    question = live.current_question
+    message = {
+        "type": "snapshot",
+        "seq": manager.seq(live.code),
+        "ended": live.ended,
+        "question_index": live.current_question_index if question else None,
+        "question": None,
+        "time_left": None,
+        "participants": len(live.ranking),
+        "leaderboard": live.leaderboard(LEADERBOARD_SIZE),
+    }
+    if question is not None:
+        view = question.view if participant_id is not None else question.host_view
+        message["question"] = view if view is not None else live.question
+    deadline = live.deadline(question.id) if question else None
+    if deadline is not None:
+        message["time_left"] = round(max(deadline - time.monotonic(), 0.0), 1)
+    if participant_id is None:
+        message["answer_count"] = live.answer_counts.get(question.id, 0) if question else 0
+    else:
+        pid = int(participant_id)
+        message["rank"] = live.rank(pid)
+        message["total_score"] = live.scores.get(pid, 0)
+        message["answered"] = question is not None and (pid, question.id) in live.answers
+    return message
+
+
+async def broadcast_leaderboard(session_code: str, live: LiveSession):
+    """
+    Send the top of the leaderboard to everybody, encoded once, and a small personal
+    frame with their own rank to just the participants whose rank changed
+    """
+    await manager.broadcast_to_all(session_code, {
+        "type": "leaderboard_update",
+        "leaderboard": live.leaderboard(LEADERBOARD_SIZE),
+        "participants": len(live.ranking)
+    })
+    for participant_id, standing in live.rank_changes().items():
+        await manager.send_to_participant(session_code, str(participant_id), {
+            "type": "leaderboard_rank",
+            **standing
         })
 
 
@@ -128,12 +629,24 @@ async def handle_participant_message(
     msg_type = message.get("type")
     
     if msg_type == "submit_answer":
-        # Save answer to database
         answer = message.get("answer")
         question_id = message.get("question_id")
         
-        # Calculate score for auto-gradable questions
-        # score = calculate_score(question_id, answer)
+        # Grade and record the answer in memory, it is written to the database in the background.
+        # Late answers are refused and time_taken is measured by the server, not trusted from the client.
+        live = store.get(session_code)
+        result = live.submit_answer(int(participant_id), question_id, answer) if live else None
+        if result is None:
+            await manager.send_to_participant(session_code, participant_id, {
+                "type": "answer_rejected",
+                "question_id": question_id
+            })
+            return
+        store.notify(live)
+        
+        # Confirmed to the participant once the write-behind flush holding the answer has committed,
+        # off the actor so the messages of the session do not wait for the database
+        timers.schedule(0, acknowledge_answer, session_code, participant_id, question_id, live.committed())
         
         # Notify host
         await manager.send_to_host(session_code, {
@@ -141,51 +654,190 @@ async def handle_participant_message(
             "participant_id": participant_id,
             "question_id": question_id
         })
-        
-        # Send confirmation to participant
-        await manager.send_to_participant(session_code, participant_id, {
-            "type": "answer_received",
-            "question_id": question_id
+        await manager.send_to_host(session_code, {
+            "type": "answer_count",
+            "question_id": question_id,
+            "count": live.answer_counts[question_id]
         })
 
 
-# Example router implementation
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
-
-# router = APIRouter()
-#
-# @router.websocket("/session/{session_code}")
-# async def websocket_endpoint(
-#     websocket: WebSocket,
-#     session_code: str,
-#     token: Optional[str] = None,
-#     name: Optional[str] = None
-# ):
-#     is_host = bool(token)
-#
-#     try:
-#         if is_host:
-#             # Authenticate and connect host
-#             user = await authenticate_user(token)
-#             await manager.connect_host(session_code, websocket)
-#
-#             while True:
-#                 data = await websocket.receive_json()
-#                 await handle_host_message(session_code, data)
-#
-#         else:
-#             # Connect participant
-#             # Register participant in database
-#             participant_id = await register_participant(session_code, name)
-#             await manager.connect_participant(session_code, participant_id, websocket)
-#
-#             while True:
-#                 data = await websocket.receive_json()
-#                 await handle_participant_message(session_code, participant_id, data)
-#
-#     except WebSocketDisconnect:
-#         if is_host:
-#             manager.disconnect(session_code)
-#         else:
-#             manager.disconnect(session_code, participant_id)
+async def acknowledge_answer(session_code: str, participant_id: str, question_id: int, committed: asyncio.Future):
+    """Send answer_received once the answer is in the database, an error if it could not be written"""
+    if await committed:
+        reply = {"type": "answer_received", "question_id": question_id}
+    else:
+        reply = {"type": "error", "message": "Answer could not be saved"}
+    await manager.send_to_participant(session_code, participant_id, reply)
 
+
+# ==================== ROUTER ====================
+
+router = APIRouter()
+
+
+@router.get("/session/{session_code}/metrics")
+async def get_session_metrics(
+        session_code: str,
+        user: database.User = Depends(get_current_user),
+        db: AsyncSession = Depends(database.get_async_db, scope="function")):
+    """Connection, queue, rate limit and actor metrics of a live session on this worker, for its host only"""
+    session = await database.async_crud.get_session_by_code(db, code=session_code)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    if session.host_id != user.id:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+
+    return manager.session_metrics(session_code)
+
+
+def session_factory() -> Session:
+    """Database session of the lookups done when a client connects, the load test answers them from memory"""
+    return database.database.SessionLocal()
+
+
+def register_participant(db: Session, session_id: int, name: str):
+    """Create a participant, committed before its answers can reach the write-behind store"""
+    participant = database.create_participant(db, session_id=session_id, name=name)
+    db.commit()
+    return participant
+
+
+async def redirect(websocket: WebSocket, frame: Frame):
+    """Point a client at the worker that owns its session and close the connection"""
+    try:
+        if isinstance(frame, bytes):
+            await websocket.send_bytes(frame)
+        else:
+            await websocket.send_text(frame)
+        await websocket.close(code=CLOSE_REDIRECT)
+    except Exception:
+        pass
+
+
+async def receive(websocket: WebSocket) -> Optional[dict]:
+    """Receive a message sent as JSON text or MessagePack binary, None if it is not a valid message"""
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    try:
+        data = decode(message["bytes"] if message.get("bytes") is not None else message["text"])
+    except (ValueError, TypeError):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+@router.websocket("/session/{session_code}")
+async def websocket_endpoint(
+    websocket: WebSocket,
+    session_code: str,
+    token: Optional[str] = None,
+    name: Optional[str] = None,
+    encoding: Optional[str] = None,
+    resume: Optional[str] = None,
+    last_seq: Optional[int] = None
+):
+    # Wire encoding, chosen through a "quiz.<encoding>" subprotocol or the encoding parameter
+    encoding, subprotocol = negotiate(websocket.scope.get("subprotocols", []), encoding)
+    
+    if not manager.shards.is_local(session_code):
+        await websocket.accept(subprotocol=subprotocol)
+        frames = Frames({"type": "redirect", "url": manager.shards.owner(session_code)})
+        await redirect(websocket, frames.get(encoding))
+        return
+    
+    is_host = bool(token)
+    participant_id = None
+    resumed = None
+    
+    # The database is only needed to connect, its connection goes back to the pool before the receive loop.
+    # Every query runs in a thread, so thousands of joins do not block the event loop.
+    db = session_factory()
+    try:
+        session = await asyncio.to_thread(database.get_session_by_code, db, code=session_code)
+        if not session:
+            await websocket.close(code=CLOSE_NOT_FOUND)
+            return
+        
+        live = await store.open(db, session)
+        if is_host:
+            # Authenticate host
+            try:
+                user = await asyncio.to_thread(get_current_user, token=token, db_session=db)
+            except HTTPException:
+                user = None
+            if not user or user.id != session.host_id:
+                await websocket.close(code=CLOSE_FORBIDDEN)
+                return
+        else:
+            # Resume the participant of a resume token, or register a new one in database
+            resumed = live.resume_tokens.get(resume) if resume else None
+            if resumed is None:
+                participant = await asyncio.to_thread(register_participant, db, session.id, name or "Anonymous")
+                live.add_participant(participant.id, participant.name)
+                participant_id = str(participant.id)
+            else:
+                participant_id = str(resumed)
+    finally:
+        await asyncio.to_thread(db.close)
+    
+    try:
+        if is_host:
+            await manager.connect_host(session_code, websocket, encoding, subprotocol)
+            if last_seq is None:
+                await manager.send_direct(websocket, {"type": "welcome", "seq": manager.seq(session_code)})
+                if not live.started and prefetch_hint(live):
+                    timers.schedule(0, send_prefetch, session_code, live)  # media of the first question
+            elif not await manager.resume(session_code, websocket, last_seq):
+                await manager.send_direct(websocket, snapshot(live))
+            
+            while True:
+                data = await receive(websocket)
+                manager.touch(websocket)
+                msg_type = data.get("type") if data is not None else None
+                # Over budget messages are dropped here, before any database or broadcast work
+                if msg_type == "pong" or not manager.allow(websocket, msg_type):
+                    continue
+                if data is None:
+                    await manager.send_direct(websocket, INVALID_MESSAGE)
+                    continue
+                # Handled by the actor of the session, in order with the messages of all its other clients
+                await manager.actors.tell(session_code, handle_host_message, session_code, data)
+        
+        else:
+            await manager.connect_participant(
+                session_code, participant_id, websocket, encoding, subprotocol, notify=resumed is None
+            )
+            
+            welcome = {
+                "type": "welcome",
+                "participant_id": participant_id,
+                "resume_token": live.issue_resume_token(int(participant_id), previous=resume)
+            }
+            if resumed is None:
+                welcome["seq"] = manager.seq(session_code)
+            await manager.send_direct(websocket, welcome)
+            hint = prefetch_hint(live) if resumed is None else None
+            if hint is not None:
+                await manager.send_direct(websocket, hint)  # joined after the hint went out
+            
+            # Catch up on what was missed while disconnected
+            if resumed is not None and not await manager.resume(session_code, websocket, last_seq or 0, participant_id):
+                await manager.send_direct(websocket, snapshot(live, participant_id))
+            
+            while True:
+                data = await receive(websocket)
+                manager.touch(websocket)
+                msg_type = data.get("type") if data is not None else None
+                if msg_type == "pong" or not manager.allow(websocket, msg_type):
+                    continue
+                if data is None:
+                    await manager.send_direct(websocket, INVALID_MESSAGE)
+                    continue
+                await manager.actors.tell(session_code, handle_participant_message, session_code, participant_id, data)
+    
+    except WebSocketDisconnect:
+        if is_host:
+            manager.disconnect(session_code, websocket=websocket)
+        else:
+            manager.disconnect(session_code, participant_id, websocket)
@@ -0,0 +1,83 @@
+"""
+Benchmark: delivery latency of a participant broadcast versus participant count.
+
+Every simulated participant socket needs a few milliseconds to accept a frame,
+and one percent of them are slow mobile clients that need two seconds.
+The sequential loop that ConnectionManager used to run is compared to FanOut.
+
+Usage (from the backend directory):
+    python -m benchmarks.broadcast_latency
+"""
+import asyncio
+import json
+import random
+import statistics
+import time
+
+from app.live import FanOut
+
+PARTICIPANT_COUNTS = [100, 500, 1000, 5000]
+SLOW_FRACTION = 0.01
+SLOW_DELAY = 2.0
+
+
+class BenchWebSocket:
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.delivered_at = None
+
+    async def send_text(self, data):
+        await asyncio.sleep(self.delay)
+        self.delivered_at = time.perf_counter()
+
+
+def make_sockets(n: int) -> list[BenchWebSocket]:
+    rng = random.Random(n)
+    return [
+        BenchWebSocket(SLOW_DELAY if rng.random() < SLOW_FRACTION else rng.uniform(0.0005, 0.005))
+        for _ in range(n)
+    ]
+
+
+async def sequential(sockets, message):
+    for websocket in sockets:
+        try:
+            await websocket.send_text(json.dumps(message))
+        except Exception:
+            pass
+
+
+async def measure(n: int, concurrent: bool) -> tuple[float, float, float]:
+    sockets = make_sockets(n)
+    message = {"type": "question_start", "question": {"id": 1, "content": "What is 2+2?"}}
+
+    start = time.perf_counter()
+    if concurrent:
+        fanout = FanOut()
+        await fanout.broadcast(sockets, message)
+        await asyncio.gather(*(outbox.join() for outbox in fanout.outboxes.values()))
+        fanout.close()
+    else:
+        await sequential(sockets, message)
+
+    latencies = sorted((ws.delivered_at - start) * 1000 for ws in sockets)
+    p50 = statistics.median(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    return p50, p99, latencies[-1]
+
+
+async def main():
+    print(f"{'participants':>12} | {'mode':>10} | {'p50 ms':>9} | {'p99 ms':>9} | {'max ms':>9}")
+    print("-" * 61)
+    for n in PARTICIPANT_COUNTS:
+        for concurrent in (False, True):
+            if not concurrent and n > 1000:
+                print(f"{n:>12} | {'sequential':>10} | {'(skipped, too slow)':>33}")
+                continue
+            p50, p99, worst = await measure(n, concurrent)
+            mode = "fanout" if concurrent else "sequential"
+            print(f"{n:>12} | {mode:>10} | {p50:>9.1f} | {p99:>9.1f} | {worst:>9.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
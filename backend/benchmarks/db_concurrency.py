@@ -0,0 +1,160 @@
+"""
+Benchmark: concurrent quiz API requests per worker, sync vs async database access.
+
+One worker (one event loop) serves GET /quizzes/{id} to many concurrent clients,
+talking ASGI in-process, against the database of DATABASE_URL (Postgres). Compared
+are the route as it was, an async def calling the sync crud functions on a sync
+Session, and the route as it is, awaiting app.db.async_crud on an AsyncSession.
+
+Every request first waits --latency ms in the database (pg_sleep), standing in for
+the network round trip to a database that is not on the same machine. A sync query
+holds the whole event loop for that long, so the requests of a worker run one at a
+time and everything else on the loop, such as the WebSockets of live sessions,
+waits with them. Reported are requests per second, the request latency and how
+late a 5 ms ticker on the same loop woke up, as a stand-in for those WebSockets.
+
+Concurrency stays below the size of the connection pool. Beyond it the sync route
+stalls: it blocks the loop waiting for a connection, and the connections it waits
+for are handed back by dependency teardowns that need that loop to run.
+
+Usage (from the backend directory):
+    DATABASE_URL=postgresql://... python -m benchmarks.db_concurrency [--requests 500] [--latency 2]
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+from fastapi import Depends, FastAPI, HTTPException
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app import db as database
+from app.db import database as engines
+from app.quiz import router as quiz_router
+
+CONCURRENCY = [1, 10, 25]  # the sync route stalls beyond the 30 connections of the pool
+TICK = 0.005
+
+
+def sync_app(latency: float) -> FastAPI:
+    """The route before: async def, sync Session"""
+    app = FastAPI()
+
+    @app.get("/quizzes/{quiz_id}")
+    async def get_quiz_by_id(quiz_id: int, db: Session = Depends(database.get_db)):
+        db.execute(text("SELECT pg_sleep(:s)"), {"s": latency})
+        quiz = database.get_quiz_by_id(db, quiz_id=quiz_id)
+        if not quiz:
+            raise HTTPException(status_code=404, detail="Quiz not found")
+        return quiz
+
+    return app
+
+
+def async_app(latency: float) -> FastAPI:
+    """The route now: the handler of app.quiz.router on an AsyncSession"""
+    app = FastAPI()
+
+    async def get_async_db():
+        async for db in database.get_async_db():
+            await db.execute(text("SELECT pg_sleep(:s)"), {"s": latency})
+            yield db
+
+    app.dependency_overrides[database.get_async_db] = get_async_db
+    app.include_router(quiz_router, prefix="/quizzes")
+    return app
+
+
+async def ticker(lateness: list[float], stop: asyncio.Event):
+    """How much later than asked for the loop gets around to a 5 ms sleep"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lateness.append(time.perf_counter() - start - TICK)
+
+
+async def run(app: FastAPI, quiz_id: int, requests: int, concurrency: int) -> dict:
+    latencies, lateness, stop = [], [], asyncio.Event()
+    pending = iter(range(requests))
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        async def worker():
+            for _ in pending:
+                start = time.perf_counter()
+                response = await client.get(f"/quizzes/{quiz_id}")
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        tick = asyncio.create_task(ticker(lateness, stop))
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await tick
+
+    latencies.sort()
+    lateness.sort()
+    return {
+        "rps": requests / elapsed,
+        "p50": latencies[len(latencies) // 2] * 1000,
+        "p99": latencies[int(len(latencies) * 0.99)] * 1000,
+        "tick_p99": lateness[int(len(lateness) * 0.99)] * 1000 if lateness else 0.0,
+        "tick_max": lateness[-1] * 1000 if lateness else 0.0,
+    }
+
+
+def seed() -> int:
+    db = engines.SessionLocal()
+    try:
+        user = database.get_user_by_username(db, "db-benchmark") or database.create_user(
+            db, username="db-benchmark", email="db-benchmark@example.com", hashed_password="x"
+        )
+        quiz = database.create_quiz(db, title="Benchmark", description="", creator_id=user.id)
+        db.commit()  # the CRUD functions only flush, the requests read it through other sessions
+        return quiz.id
+    finally:
+        db.close()
+
+
+def clean_up(quiz_id: int):
+    db = engines.SessionLocal()
+    try:
+        quiz = database.get_quiz_by_id(db, quiz_id)
+        if quiz is not None:
+            db.delete(quiz)
+        user = database.get_user_by_username(db, "db-benchmark")
+        if user is not None:
+            db.delete(user)
+        db.commit()
+    finally:
+        db.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=500, help="requests per run")
+    parser.add_argument("--latency", type=float, default=2.0, help="ms every request waits in the database")
+    args = parser.parse_args()
+
+    database.init()
+    quiz_id = seed()
+    latency = args.latency / 1000
+    try:
+        print(f"{args.requests} requests per run, {args.latency:g} ms in the database per request\n")
+        print(f"{'concurrency':>11} | {'session':>7} | {'req/s':>8} | {'p50 ms':>7} | {'p99 ms':>7} | {'loop lag p99/max ms':>19}")
+        print("-" * 76)
+        for concurrency in CONCURRENCY:
+            for name, app in (("sync", sync_app(latency)), ("async", async_app(latency))):
+                result = await run(app, quiz_id, args.requests, concurrency)
+                print(
+                    f"{concurrency:>11} | {name:>7} | {result['rps']:>8.0f} | {result['p50']:>7.1f} | "
+                    f"{result['p99']:>7.1f} | {result['tick_p99']:>9.1f} / {result['tick_max']:>7.1f}"
+                )
+    finally:
+        clean_up(quiz_id)
+        await database.close_async_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
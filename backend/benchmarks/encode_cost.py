@@ -0,0 +1,66 @@
+"""
+Benchmark: serialization cost of one leaderboard broadcast.
+
+Compares encoding the message once per recipient (what send_json did) with
+encoding it once per broadcast, using both the standard library and orjson.
+
+Usage (from the backend directory):
+    python -m benchmarks.encode_cost
+"""
+import json
+import timeit
+
+from app.live import encoding
+
+PARTICIPANT_COUNTS = [10, 100, 500, 1000]
+LEADERBOARD_SIZE = 10
+
+
+def leaderboard_message() -> dict:
+    return {
+        "type": "leaderboard_update",
+        "leaderboard": [
+            {"participant_id": i, "name": f"Player {i}", "total_score": 1000 - i * 10, "rank": i + 1}
+            for i in range(LEADERBOARD_SIZE)
+        ],
+    }
+
+
+def per_recipient(message: dict, n: int):
+    for _ in range(n):
+        json.dumps(message)
+
+
+def once_stdlib(message: dict, n: int):
+    frame = json.dumps(message, separators=(",", ":"))
+    for _ in range(n):
+        frame  # shared by every send
+
+
+def once_fast(message: dict, n: int):
+    frame = encoding.encode(message)
+    for _ in range(n):
+        frame
+
+
+def bench(fn, message: dict, n: int) -> float:
+    """Microseconds per broadcast"""
+    runs = max(10, 20_000 // n)
+    return timeit.timeit(lambda: fn(message, n), number=runs) / runs * 1e6
+
+
+def main():
+    message = leaderboard_message()
+    fast = "orjson" if encoding.orjson is not None else "stdlib (orjson not installed)"
+    print(f"fast encoder: {fast}")
+    print(f"{'participants':>12} | {'per recipient us':>16} | {'once stdlib us':>14} | {'once fast us':>12}")
+    print("-" * 65)
+    for n in PARTICIPANT_COUNTS:
+        print(
+            f"{n:>12} | {bench(per_recipient, message, n):>16.1f} | "
+            f"{bench(once_stdlib, message, n):>14.1f} | {bench(once_fast, message, n):>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
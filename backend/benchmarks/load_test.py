@@ -0,0 +1,350 @@
+"""
+Load test: one host and thousands of participants in a single live session.
+
+The WebSocket router runs in-process and every simulated client talks ASGI to it
+directly, so there is no network and no database involved. The database calls of
+the endpoint are answered from memory and the write-behind store counts the rows
+it would have written. Everything else (ConnectionManager, the outboxes, the live
+session state and the handlers) is the real code.
+
+The participants join all at once, then the host runs next_question/submit_answer
+cycles and ends the session. Reported are:
+    join throughput       joins per second, and the time from connecting to the welcome
+    fan-out latency       from the host sending next_question to a participant receiving question_start
+    answer-ack latency    from a participant sending submit_answer to receiving answer_received,
+                          which waits for the write-behind flush that holds the answer
+    memory/connection     allocated by the server per connected participant (a separate
+                          pass under tracemalloc, so it does not slow down the timed run)
+
+Usage (from the backend directory):
+    python -m benchmarks.load_test [--participants 2000] [--questions 5] [--think 0.5] [--encoding json]
+"""
+import argparse
+import asyncio
+import gc
+import random
+import statistics
+import time
+import tracemalloc
+from itertools import count
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from fastapi import FastAPI
+
+from app import websocket_handler
+from app.live import LiveSession, LiveSessionStore
+from app.live.encoding import JSON, MSGPACK, decode, encode
+from app.live.state import LiveQuestion
+from app.websocket_handler import ConnectionManager
+
+HOST_ID = 1
+HOST_TOKEN = "load-test"
+
+
+class Phase:
+    """Counts down events expected from every client"""
+
+    def __init__(self, expected: int):
+        self.expected = expected
+        self.seen = 0
+        self.done = asyncio.Event()
+        if expected == 0:
+            self.done.set()
+
+    def hit(self):
+        self.seen += 1
+        if self.seen >= self.expected:
+            self.done.set()
+
+    async def wait(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self.done.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class MemoryDatabase:
+    """The database functions the WebSocket endpoint calls, answered from memory"""
+
+    def __init__(self):
+        self.sessions: dict[str, SimpleNamespace] = {}
+        self._participant_ids = count(1)
+
+    def add_session(self, code: str) -> SimpleNamespace:
+        session = self.sessions[code] = SimpleNamespace(id=len(self.sessions) + 1, code=code, host_id=HOST_ID)
+        return session
+
+    def get_session_by_code(self, db, code: str):
+        return self.sessions.get(code)
+
+    def create_participant(self, db, session_id: int, name: str):
+        return SimpleNamespace(id=next(self._participant_ids), session_id=session_id, name=name)
+
+    def session(self):
+        return SimpleNamespace(commit=lambda: None, close=lambda: None)  # nothing is staged, so nothing to commit
+
+
+class MemoryStore(LiveSessionStore):
+    """Write-behind store that counts what it would write instead of writing it"""
+
+    def __init__(self):
+        super().__init__(session_factory=None)
+        self.rows = 0
+
+    def _write(self, changes: list[dict]):
+        self.rows += sum(len(c["answers"]) + len(c["rescored"]) for c in changes)
+
+    def _end(self, session_id: int):
+        pass
+
+
+class Client:
+    """A WebSocket client speaking ASGI straight to the app"""
+
+    def __init__(self, app: FastAPI, path: str, encoding: str):
+        self.app = app
+        self.encoding = encoding
+        self.scope = {
+            "type": "websocket",
+            "asgi": {"version": "3.0"},
+            "scheme": "ws",
+            "path": path.split("?")[0],
+            "raw_path": path.split("?")[0].encode(),
+            "query_string": path.partition("?")[2].encode(),
+            "root_path": "",
+            "headers": [],
+            "subprotocols": [f"quiz.{encoding}"],
+            "client": ("127.0.0.1", 0),
+            "server": ("testserver", 80),
+        }
+        self.inbox: asyncio.Queue = asyncio.Queue()  # what the server receives
+        self.task: asyncio.Task | None = None
+        self.closed = False
+
+    def start(self):
+        self.inbox.put_nowait({"type": "websocket.connect"})
+        self.task = asyncio.create_task(self.app(self.scope, self.inbox.get, self._from_server))
+
+    def send(self, message: dict):
+        frame = encode(message, self.encoding)
+        key = "bytes" if isinstance(frame, bytes) else "text"
+        self.inbox.put_nowait({"type": "websocket.receive", key: frame})
+
+    async def stop(self):
+        if self.task is None:
+            return
+        self.inbox.put_nowait({"type": "websocket.disconnect", "code": 1000})
+        try:
+            await self.task
+        except Exception:
+            pass
+
+    async def _from_server(self, event: dict):
+        if event["type"] == "websocket.send":
+            data = decode(event["bytes"] if event.get("bytes") is not None else event["text"])
+            for message in data if isinstance(data, list) else [data]:
+                if message.get("type") == "ping":
+                    self.send({"type": "pong"})
+                else:
+                    self.on_message(message)
+        elif event["type"] == "websocket.close":
+            self.closed = True
+
+    def on_message(self, message: dict):
+        pass
+
+
+class Participant(Client):
+
+    def __init__(self, run: "LoadTest", index: int):
+        super().__init__(run.app, f"/ws/session/{run.code}?name=Player{index}", run.encoding)
+        self.run = run
+        self.connected_at = 0.0
+        self.answered_at = 0.0
+        self.participant_id = None
+
+    def start(self):
+        self.connected_at = time.perf_counter()
+        super().start()
+
+    def on_message(self, message: dict):
+        run, now = self.run, time.perf_counter()
+        msg_type = message.get("type")
+        if msg_type == "welcome":
+            self.participant_id = message["participant_id"]
+            run.join_latencies.append(now - self.connected_at)
+            run.joined.hit()
+        elif msg_type == "question_start":
+            run.fanout_latencies.append(now - run.question_sent_at)
+            run.started.hit()
+            question_id = message["question"]["id"]
+            if run.think:
+                asyncio.get_running_loop().call_later(random.uniform(0, run.think), self.answer, question_id)
+            else:
+                self.answer(question_id)
+        elif msg_type in ("answer_received", "answer_rejected"):
+            run.ack_latencies.append(now - self.answered_at)
+            run.acked.hit()
+        elif msg_type == "session_ended":
+            run.ended.hit()
+
+    def answer(self, question_id: int):
+        self.answered_at = time.perf_counter()
+        self.send({"type": "submit_answer", "question_id": question_id, "answer": random.choice("345")})
+
+
+class Host(Client):
+
+    def __init__(self, run: "LoadTest"):
+        super().__init__(run.app, f"/ws/session/{run.code}?token={HOST_TOKEN}", run.encoding)
+        self.run = run
+
+    def on_message(self, message: dict):
+        if message.get("type") == "welcome":
+            self.run.host_ready.set()
+
+
+class LoadTest:
+    """One quiz run against a fresh ConnectionManager and live session store"""
+
+    def __init__(self, participants: int, questions: int, think: float, encoding: str, timeout: float):
+        self.participants = participants
+        self.questions = [LiveQuestion(100 + i, i + 1, "4", 10, 30) for i in range(questions)]
+        self.think = think
+        self.encoding = encoding
+        self.timeout = timeout
+        self.code = "LOADT"
+
+        self.app = FastAPI()
+        self.app.include_router(websocket_handler.router, prefix="/ws")
+        self.database = MemoryDatabase()
+        self.manager = ConnectionManager()
+        self.store = MemoryStore()
+
+        self.join_latencies: list[float] = []
+        self.fanout_latencies: list[float] = []
+        self.ack_latencies: list[float] = []
+        self.question_sent_at = 0.0
+        self.host_ready = asyncio.Event()
+        self.joined = self.started = self.acked = self.ended = Phase(0)
+
+    def open_session(self, code: str):
+        session = self.database.add_session(code)
+        self.store.sessions[code] = LiveSession(session.id, code, self.questions)
+
+    def patches(self) -> list:
+        return [
+            patch.object(websocket_handler, "database", self.database),
+            patch.object(websocket_handler, "session_factory", self.database.session),
+            patch.object(websocket_handler, "manager", self.manager),
+            patch.object(websocket_handler, "store", self.store),
+            patch.object(websocket_handler, "get_current_user", lambda token, db_session: SimpleNamespace(id=HOST_ID)),
+        ]
+
+    async def join(self, n: int) -> tuple[list[Participant], float]:
+        """Connect n participants at once, returns them and the seconds until all were welcomed"""
+        self.joined = Phase(n)
+        clients = [Participant(self, i) for i in range(n)]
+        start = time.perf_counter()
+        for client in clients:
+            client.start()
+        if not await self.joined.wait(self.timeout):
+            print(f"warning: only {self.joined.seen}/{n} participants joined")
+        return clients, time.perf_counter() - start
+
+    async def quiz(self) -> dict:
+        self.open_session(self.code)
+        host = Host(self)
+        host.start()
+        await asyncio.wait_for(self.host_ready.wait(), self.timeout)
+
+        clients, join_time = await self.join(self.participants)
+        for question in self.questions:
+            self.started, self.acked = Phase(len(clients)), Phase(len(clients))
+            self.question_sent_at = time.perf_counter()
+            host.send({"type": "next_question", "question": {"id": question.id, "content": "What is 2 + 2?"}})
+            for phase, name in ((self.started, "question_start"), (self.acked, "answer_received")):
+                if not await phase.wait(self.timeout + self.think):
+                    print(f"warning: only {phase.seen}/{phase.expected} participants got {name}")
+
+        self.ended = Phase(len(clients))
+        host.send({"type": "end_session"})
+        await self.ended.wait(self.timeout)
+
+        metrics = self.manager.fanout.metrics(list(self.manager.connections))
+        await asyncio.gather(*(client.stop() for client in clients), host.stop())
+        return {"join_time": join_time, "rows": self.store.rows, "metrics": metrics}
+
+    async def memory_per_connection(self) -> float:
+        """Bytes allocated per connected participant, measured on a session of its own"""
+        self.code = "MEMRY"
+        self.open_session(self.code)
+        timed, self.join_latencies = self.join_latencies, []
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        clients, _ = await self.join(self.participants)
+        await asyncio.sleep(0.1)  # let the outboxes settle
+        gc.collect()
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        await asyncio.gather(*(client.stop() for client in clients))
+        self.join_latencies = timed
+
+        allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+        return allocated / len(clients)
+
+    async def run(self) -> dict:
+        patches = self.patches()
+        for p in patches:
+            p.start()
+        try:
+            await self.manager.start()
+            result = await self.quiz()
+            result["memory"] = await self.memory_per_connection()
+            await self.manager.close()
+            await self.store.close()
+        finally:
+            for p in reversed(patches):
+                p.stop()
+        return result
+
+
+def percentiles(seconds: list[float]) -> str:
+    if not seconds:
+        return f"{'-':>9} | {'-':>9} | {'-':>9} | {'-':>9}"
+    ms = sorted(s * 1000 for s in seconds)
+    p95 = ms[max(int(len(ms) * 0.95) - 1, 0)]
+    p99 = ms[max(int(len(ms) * 0.99) - 1, 0)]
+    return f"{statistics.median(ms):>9.1f} | {p95:>9.1f} | {p99:>9.1f} | {ms[-1]:>9.1f}"
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--participants", type=int, default=2000)
+    parser.add_argument("--questions", type=int, default=5)
+    parser.add_argument("--think", type=float, default=0.5, help="participants answer within this many seconds")
+    parser.add_argument("--encoding", choices=[JSON, MSGPACK], default=JSON)
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for each phase")
+    args = parser.parse_args()
+
+    run = LoadTest(args.participants, args.questions, args.think, args.encoding, args.timeout)
+    result = await run.run()
+
+    n = args.participants
+    print(f"{n} participants, {args.questions} questions, {args.encoding} frames\n")
+    print(f"join throughput     {n / result['join_time']:>10.0f} joins/s  ({result['join_time']:.2f} s)")
+    print(f"memory/connection   {result['memory'] / 1024:>10.1f} KiB")
+    print(f"answers written     {result['rows']:>10}")
+    print(f"frames sent         {result['metrics']['frames']:>10}  ({result['metrics']['sent']} messages)\n")
+    print(f"{'latency':>18} | {'p50 ms':>9} | {'p95 ms':>9} | {'p99 ms':>9} | {'max ms':>9}")
+    print("-" * 64)
+    print(f"{'join -> welcome':>18} | {percentiles(run.join_latencies)}")
+    print(f"{'question fan-out':>18} | {percentiles(run.fanout_latencies)}")
+    print(f"{'answer ack':>18} | {percentiles(run.ack_latencies)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,71 @@
+"""
+Benchmark: payload size and encode time of the wire encodings.
+
+Compares JSON (standard library and orjson) with MessagePack for the two
+messages that are broadcast most: question_start and leaderboard_update.
+
+Usage (from the backend directory):
+    python -m benchmarks.wire_format
+"""
+import json
+import timeit
+
+from app.live import encoding
+
+LEADERBOARD_SIZE = 10
+
+
+def question_start_message() -> dict:
+    return {
+        "type": "question_start",
+        "question_index": 4,
+        "question": {
+            "id": 1234,
+            "type": "multiple_choice",
+            "content": "Which planet in our solar system has the most moons?",
+            "options": ["Jupiter", "Saturn", "Uranus", "Neptune"],
+            "media_url": "/media/abcdef0123456789.jpg",
+            "media_type": "image",
+            "points": 10,
+            "time_limit": 30,
+        },
+    }
+
+
+def leaderboard_message() -> dict:
+    return {
+        "type": "leaderboard_update",
+        "leaderboard": [
+            {"rank": i + 1, "participant_id": 1000 + i, "name": f"Player {i}", "total_score": 1000 - i * 10}
+            for i in range(LEADERBOARD_SIZE)
+        ],
+        "participants": 1000,
+    }
+
+
+def encoders() -> dict:
+    result = {"json (stdlib)": lambda m: json.dumps(m, separators=(",", ":")).encode("utf-8")}
+    if encoding.orjson is not None:
+        result["json (orjson)"] = lambda m: encoding.encode(m, encoding.JSON).encode("utf-8")
+    if encoding.msgpack is not None:
+        result["msgpack"] = lambda m: encoding.encode(m, encoding.MSGPACK)
+    return result
+
+
+def bench(encode, message: dict) -> float:
+    """Microseconds per encode"""
+    runs = 20_000
+    return timeit.timeit(lambda: encode(message), number=runs) / runs * 1e6
+
+
+def main():
+    messages = {"question_start": question_start_message(), "leaderboard_update": leaderboard_message()}
+    print(f"{'message':>18} | {'encoding':>14} | {'bytes':>6} | {'encode us':>9}")
+    print("-" * 58)
+    for name, message in messages.items():
+        for label, encode in encoders().items():
+            print(f"{name:>18} | {label:>14} | {len(encode(message)):>6} | {bench(encode, message):>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import os
+from typing import Any, AsyncGenerator
+
+import pytest
+import pytest_asyncio
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.db.database import async_url
+from app.db.models import Base, QuestionType, SessionStatus
+import app.db.async_crud as crud
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+
+# ---------------------------------------------------------------------------
+# One async session per test, its changes are rolled back afterwards
+# ---------------------------------------------------------------------------
+@pytest_asyncio.fixture()
+async def db() -> AsyncGenerator[AsyncSession, Any]:
+    """
+    Yields an AsyncSession on a connection whose transaction is rolled back after
+    the test, db.commit() in the code under test only releases a SAVEPOINT.
+    """
+    engine = create_async_engine(async_url(DATABASE_URL))
+    async with engine.connect() as connection:
+        transaction = await connection.begin()
+        await connection.run_sync(Base.metadata.create_all)
+        session = AsyncSession(bind=connection, join_transaction_mode="create_savepoint", expire_on_commit=False)
+
+        yield session
+
+        await session.close()
+        await transaction.rollback()
+    await engine.dispose()
+
+
+async def make_quiz(db):
+    user = await crud.create_user(db, username="alice", email="alice@example.com", hashed_password="hashed")
+    quiz = await crud.create_quiz(db, title="My Quiz", description="desc", creator_id=user.id)
+    return user, quiz
+
+
+async def make_session(db):
+    user, quiz = await make_quiz(db)
+    question = await crud.create_question(
+        db, quiz_id=quiz.id, content="What is 2+2?", question_type=QuestionType.MULTIPLE_CHOICE,
+        order=1, options='["2","3","4","5"]', correct_answer="4", points=10
+    )
+    session = await crud.create_session(db, quiz_id=quiz.id, host_id=user.id)
+    participant = await crud.create_participant(db, session_id=session.id, name="Bob")
+    return session, participant, question
+
+
+class TestAsyncUrl:
+
+    def test_selects_the_async_driver(self):
+        assert async_url("postgresql://u:p@host/db") == "postgresql+asyncpg://u:p@host/db"
+        assert async_url("postgresql+psycopg2://u:p@host/db") == "postgresql+asyncpg://u:p@host/db"
+        assert async_url("sqlite:///./quiz.db") == "sqlite+aiosqlite:///./quiz.db"
+
+
+@pytest.mark.asyncio
+class TestAsyncQuizCrud:
+
+    async def test_create_and_get_quiz(self, db):
+        user, quiz = await make_quiz(db)
+        assert (await crud.get_quiz_by_id(db, quiz.id)).title == "My Quiz"
+        assert [q.id for q in await crud.get_quizzes_by_user(db, user.id)] == [quiz.id]
+        assert await crud.get_quiz_by_id(db, quiz.id + 1000) is None
+
+    async def test_update_quiz(self, db):
+        _, quiz = await make_quiz(db)
+        updated = await crud.update_quiz(db, quiz.id, title="New", is_published=True)
+        assert (updated.title, updated.description, updated.is_published) == ("New", "desc", True)
+        assert await crud.update_quiz(db, quiz.id + 1000, title="x") is None
+
+    async def test_delete_quiz(self, db):
+        _, quiz = await make_quiz(db)
+        assert await crud.delete_quiz(db, quiz.id)
+        assert await crud.get_quiz_by_id(db, quiz.id) is None
+        assert not await crud.delete_quiz(db, quiz.id)
+
+    async def test_questions_are_ordered(self, db):
+        _, quiz = await make_quiz(db)
+        for order in (2, 1):
+            await crud.create_question(
+                db, quiz_id=quiz.id, content=f"Q{order}", question_type=QuestionType.OPEN_ENDED, order=order
+            )
+        assert [q.content for q in await crud.get_questions_by_quiz(db, quiz.id)] == ["Q1", "Q2"]
+
+    async def test_bulk_authoring(self, db):
+        user, _ = await make_quiz(db)
+        quiz, created = await crud.create_quiz_with_questions(db, "Big Quiz", "desc", user.id, [
+            {"question_type": QuestionType.OPEN_ENDED, "content": "Q1"},
+            {"question_type": QuestionType.OPEN_ENDED, "content": "Q2"},
+        ])
+        questions = await crud.replace_questions(db, quiz.id, [
+            {"id": created[1].id, "question_type": QuestionType.OPEN_ENDED, "content": "Q2"},
+            {"question_type": QuestionType.TRUE_FALSE, "content": "Q3"},
+        ])
+        assert [(q.content, q.order) for q in questions] == [("Q2", 1), ("Q3", 2)]
+
+
+@pytest.mark.asyncio
+class TestAsyncSessionCrud:
+
+    async def test_session_lifecycle(self, db):
+        session, _, _ = await make_session(db)
+        assert (await crud.get_session_by_code(db, session.code)).id == session.id
+        assert (await crud.start_session(db, session.id)).status == SessionStatus.ACTIVE
+        assert (await crud.update_session_question(db, session.id, 2)).current_question_index == 2
+        ended = await crud.end_session(db, session.id)
+        assert ended.status == SessionStatus.ENDED and ended.ended_at is not None
+
+    async def test_submit_and_score_answer(self, db):
+        session, participant, question = await make_session(db)
+        answer = await crud.submit_answer(db, session.id, participant.id, question.id, "4", time_taken=1.5)
+        assert (answer.is_correct, answer.score) == (True, 10)
+        await crud.score_answer(db, answer.id, 4)
+        assert (await crud.get_participant_by_id(db, participant.id)).total_score == 4
+        assert [a.id for a in await crud.get_answers_for_question(db, session.id, question.id)] == [answer.id]
+
+    async def test_score_increments(self, db):
+        session, participant, _ = await make_session(db)
+        assert (await crud.update_participant_score(db, participant.id, 3)).total_score == 3
+        await crud.add_participant_scores(db, {participant.id: 7}, session.id)
+        assert (await crud.get_participant_by_id(db, participant.id)).total_score == 10
+        assert await crud.update_participant_score(db, 999_999, 1) is None
+
+    async def test_save_live_changes(self, db):
+        session, participant, question = await make_session(db)
+        await crud.save_live_changes(db, [{
+            "session_id": session.id,
+            "current_question_index": 1,
+            "answers": [{
+                "session_id": session.id, "participant_id": participant.id, "question_id": question.id,
+                "answer_text": "4", "is_correct": True, "score": 10, "time_taken": 2.0,
+            }],
+            "rescored": [],
+            "score_deltas": {participant.id: 10},
+        }])
+        session_id, participant_id, question_id = session.id, participant.id, question.id
+        db.expire_all()  # the writes bypassed the loaded objects
+        assert (await crud.get_answer(db, session_id, participant_id, question_id)).score == 10
+        assert [p.total_score for p in await crud.get_session_leaderboard(db, session_id)] == [10]
+        assert (await crud.get_session_by_id(db, session_id)).current_question_index == 1
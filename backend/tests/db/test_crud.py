@@ -23,6 +23,7 @@ from app.db.models import (
     QuestionType,
 )
 import app.db.crud as crud
+from app.db.query_count import counting
 
 # ---------------------------------------------------------------------------
 # Database URL
@@ -272,6 +273,59 @@ class TestQuestionCrud:
     def test_delete_question_not_found(self, db):
         assert crud.delete_question(db, 999_999) is False
 
+    def test_create_quiz_with_questions(self, db):
+        user = make_user(db)
+        questions = [
+            {"question_type": QuestionType.MULTIPLE_CHOICE, "content": f"Q{i}", "options": '["a","b"]',
+             "correct_answer": "a"}
+            for i in range(50)
+        ]
+        with counting() as queries:
+            quiz, created = crud.create_quiz_with_questions(db, "Big Quiz", "desc", user.id, questions)
+        assert queries.count == 2  # INSERT quiz, one INSERT of all questions
+        assert quiz.id is not None and quiz.creator_id == user.id
+        assert [q.order for q in created] == list(range(1, 51))
+        assert [q.content for q in crud.get_questions_by_quiz(db, quiz.id)] == [f"Q{i}" for i in range(50)]
+
+    def test_create_quiz_without_questions(self, db):
+        user = make_user(db)
+        quiz, created = crud.create_quiz_with_questions(db, "Empty", "desc", user.id, [])
+        assert created == [] and crud.get_quiz_by_id(db, quiz.id) is not None
+
+    def test_replace_questions(self, db):
+        user = make_user(db)
+        quiz = make_quiz(db, creator_id=user.id)
+        first = make_question(db, quiz_id=quiz.id, content="Q1", order=1)
+        second = make_question(db, quiz_id=quiz.id, content="Q2", order=2)
+        dropped = make_question(db, quiz_id=quiz.id, content="Q3", order=3)
+
+        questions = crud.replace_questions(db, quiz.id, [
+            {"question_type": QuestionType.OPEN_ENDED, "content": "New"},
+            {"id": second.id, "question_type": QuestionType.TRUE_FALSE, "content": "Q2 edited", "points": 5},
+            {"id": first.id, "question_type": QuestionType.MULTIPLE_CHOICE, "content": "Q1"},
+        ])
+        assert [(q.content, q.order) for q in questions] == [("New", 1), ("Q2 edited", 2), ("Q1", 3)]
+        assert questions[1] is second and (second.type, second.points) == (QuestionType.TRUE_FALSE, 5)
+        assert second.updated_at is not None
+        assert crud.get_question_by_id(db, dropped.id) is None
+
+    def test_replace_questions_keeps_answers_of_kept_questions(self, db):
+        session, participant, question = TestAnswerCrud()._setup(db)
+        crud.submit_answer(db, session.id, participant.id, question.id, "4")
+        crud.replace_questions(db, session.quiz_id, [
+            {"id": question.id, "question_type": QuestionType.MULTIPLE_CHOICE, "content": "What is 2+2?"}
+        ])
+        assert crud.get_answer(db, session.id, participant.id, question.id) is not None
+
+    def test_replace_questions_of_another_quiz(self, db):
+        user = make_user(db)
+        quiz = make_quiz(db, creator_id=user.id)
+        other = make_question(db, quiz_id=make_quiz(db, creator_id=user.id).id)
+        assert crud.replace_questions(db, quiz.id, [
+            {"id": other.id, "question_type": QuestionType.OPEN_ENDED, "content": "Mine now"}
+        ]) is None
+        assert crud.get_question_by_id(db, other.id).quiz_id != quiz.id
+
 
 # ===========================================================================
 # SESSION tests
@@ -520,3 +574,132 @@ class TestAnswerCrud:
 
     def test_score_answer_not_found(self, db):
         assert crud.score_answer(db, 999_999, score=10) is None
+
+    def test_get_answers_for_session(self, db):
+        session, participant, question = self._setup(db)
+        crud.submit_answer(db, session.id, participant.id, question.id, "4")
+        answers = crud.get_answers_for_session(db, session.id)
+        assert [(a.participant_id, a.question_id) for a in answers] == [(participant.id, question.id)]
+
+    def test_save_live_changes(self, db):
+        session, p1, question = self._setup(db)
+        p2 = make_participant(db, session_id=session.id, name="Carol")
+        crud.submit_answer(db, session.id, p2.id, question.id, "open")
+
+        crud.save_live_changes(db, [{
+            "session_id": session.id,
+            "current_question_index": 2,
+            "answers": [{
+                "session_id": session.id, "participant_id": p1.id, "question_id": question.id,
+                "answer_text": "4", "is_correct": True, "score": 10, "time_taken": 1.5,
+            }],
+            "rescored": [{"participant_id": p2.id, "question_id": question.id, "score": 6}],
+            "score_deltas": {p1.id: 10, p2.id: 6},
+        }])
+
+        db.expire_all()
+        assert crud.get_answer(db, session.id, p1.id, question.id).score == 10
+        rescored = crud.get_answer(db, session.id, p2.id, question.id)
+        assert (rescored.score, rescored.is_correct) == (6, True)
+        assert crud.get_participant_by_id(db, p1.id).total_score == 10
+        assert crud.get_participant_by_id(db, p2.id).total_score == 6
+        assert crud.get_session_by_id(db, session.id).current_question_index == 2
+
+    def test_live_session_round_trip(self, db):
+        from app.live import LiveSession
+
+        session, participant, question = self._setup(db)
+        live = LiveSession.load(db, session)
+        live.next_question()
+        assert live.submit_answer(participant.id, question.id, "4") == (True, 10)
+        crud.save_live_changes(db, [live.take_changes()])
+
+        db.expire_all()
+        stored = crud.get_session_by_id(db, session.id)
+        assert (stored.status, stored.started_at is not None) == (SessionStatus.ACTIVE, True)
+        reloaded = LiveSession.load(db, stored)
+        assert reloaded.started and reloaded.current_question.id == question.id
+        assert reloaded.scores == {participant.id: 10}
+        assert reloaded.answers == {(participant.id, question.id): 10}
+        assert [p.name for p in reloaded.participants.values()] == ["Bob"]
+
+    def test_live_session_deck(self, db):
+        from app.live import LiveSession
+
+        session, _, question = self._setup(db)
+        live = LiveSession.load(db, session)
+        loaded = live.questions[question.id]
+        assert loaded.view.value == {
+            "id": question.id, "order": 1, "type": "multiple_choice", "content": "What is 2+2?",
+            "media_url": None, "media_type": None, "options": ["2", "3", "4", "5"],
+            "points": 10, "time_limit": 30,
+        }
+        assert loaded.host_view.value == {**loaded.view.value, "correct_answer": "4"}
+
+
+# ===========================================================================
+# Unit of work tests
+# ===========================================================================
+
+class TestUnitOfWork:
+    def _setup(self, db):
+        return TestAnswerCrud()._setup(db)
+
+    def test_changes_are_staged_not_committed(self, db):
+        user = make_user(db)
+        quiz = make_quiz(db, creator_id=user.id)
+        assert quiz.id is not None and quiz.created_at is not None  # from the INSERT ... RETURNING
+        db.rollback()  # to the savepoint of the test
+        assert crud.get_quiz_by_id(db, quiz.id) is None
+
+    def test_updated_at_comes_back_with_the_update(self, db):
+        user = make_user(db)
+        quiz = make_quiz(db, creator_id=user.id)
+        with counting() as queries:
+            crud.update_quiz(db, quiz.id, title="New")
+            assert quiz.updated_at is not None
+        assert queries.count == 2  # SELECT, UPDATE ... RETURNING
+
+    def test_create_participant_round_trips(self, db):
+        session, _, _ = self._setup(db)
+        with counting() as queries:
+            crud.create_participant(db, session_id=session.id, name="Eve")
+        assert queries.count == 1  # was INSERT, COMMIT and a refresh SELECT
+
+    def test_submit_answer_round_trips(self, db):
+        session, participant, question = self._setup(db)
+        with counting() as queries:
+            crud.submit_answer(db, session.id, participant.id, question.id, "4")
+        assert queries.count == 3  # SELECT question, UPDATE score, INSERT answer
+
+    def test_score_answer_round_trips(self, db):
+        session, participant, question = self._setup(db)
+        answer = crud.submit_answer(db, session.id, participant.id, question.id, "4")
+        with counting() as queries:
+            crud.score_answer(db, answer.id, 5)
+        assert queries.count == 3  # SELECT ... FOR UPDATE, UPDATE score, UPDATE answer
+        assert crud.get_participant_by_id(db, participant.id).total_score == 5
+
+    def test_score_increment_is_one_statement(self, db):
+        session, participant, _ = self._setup(db)
+        with counting() as queries:
+            updated = crud.update_participant_score(db, participant.id, points_to_add=7)
+        assert queries.count == 1  # UPDATE ... SET total_score = total_score + 7 RETURNING
+        assert updated is participant and participant.total_score == 7
+
+    def test_bulk_score_increment_is_one_statement(self, db):
+        session, p1, _ = self._setup(db)
+        p2 = make_participant(db, session_id=session.id, name="Carol")
+        p3 = make_participant(db, session_id=session.id, name="Dave")
+        with counting() as queries:
+            crud.add_participant_scores(db, {p1.id: 10, p2.id: 5, p3.id: 0}, session.id)
+        assert queries.count == 1
+        assert (p1.total_score, p2.total_score, p3.total_score) == (10, 5, 0)
+
+    def test_bulk_score_increment_is_scoped_to_the_session(self, db):
+        session, participant, _ = self._setup(db)
+        other = make_session(db, quiz_id=session.quiz_id, host_id=session.host_id)
+        stranger = make_participant(db, session_id=other.id, name="Eve")
+        crud.add_participant_scores(db, {participant.id: 10, stranger.id: 10}, session.id)
+        assert participant.total_score == 10
+        assert stranger.total_score == 0
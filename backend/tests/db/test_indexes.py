@@ -0,0 +1,149 @@
+"""
+Tests for the Alembic migrations and the indexes they create: the migrations build
+the schema of the models, and the hot queries of crud.py are planned with the
+composite indexes (EXPLAIN, with sequential and bitmap scans disabled as the test
+tables are tiny). They need PostgreSQL and are skipped for any other DATABASE_URL.
+"""
+import os
+from pathlib import Path
+
+import pytest
+
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from sqlalchemy import create_engine, event, make_url, pool, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.db.models import Base, QuestionType
+import app.db.crud as crud
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+SCHEMA = "migration_test"
+ALEMBIC_INI = Path(__file__).parents[2] / "alembic.ini"
+
+pytestmark = pytest.mark.skipif(
+    not DATABASE_URL or make_url(DATABASE_URL).get_backend_name() != "postgresql",
+    reason="schemas, DESC index columns and EXPLAIN output of PostgreSQL"
+)
+
+
+def migrate(connection, revision: str = "head", downgrade: bool = False):
+    config = Config(str(ALEMBIC_INI))
+    config.attributes["connection"] = connection
+    (command.downgrade if downgrade else command.upgrade)(config, revision)
+    connection.commit()
+
+
+@pytest.fixture(scope="module")
+def connection():
+    """A connection whose search_path is an empty schema, migrated to head"""
+    engine = create_engine(DATABASE_URL, poolclass=pool.NullPool)
+    with engine.connect() as connection:
+        connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        connection.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        connection.execute(text(f"SET search_path TO {SCHEMA}"))
+        connection.commit()
+        migrate(connection)
+
+        yield connection
+
+        connection.rollback()
+        connection.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+        connection.commit()
+    engine.dispose()
+
+
+@pytest.fixture()
+def db(connection):
+    session = Session(bind=connection, join_transaction_mode="create_savepoint")
+    connection.execute(text("SET enable_seqscan = off; SET enable_bitmapscan = off"))
+    yield session
+    session.close()
+    connection.rollback()
+
+
+def plan(db, query, *args) -> str:
+    """EXPLAIN output of the statement a crud function runs"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(db.get_bind(), "before_cursor_execute", record)
+    try:
+        query(db, *args)
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", record)
+    statement, parameters = statements[-1]
+    return "\n".join(row[0] for row in db.connection().exec_driver_sql("EXPLAIN " + statement, parameters))
+
+
+class TestMigrations:
+
+    def test_migrations_match_the_models(self, connection):
+        assert compare_metadata(MigrationContext.configure(connection), Base.metadata) == []
+
+    def test_downgrade_and_upgrade_again(self, connection):
+        migrate(connection, "base", downgrade=True)
+        assert connection.execute(text("SELECT to_regclass('answers')")).scalar() is None
+        migrate(connection)
+        assert compare_metadata(MigrationContext.configure(connection), Base.metadata) == []
+
+    def test_upgrade_drops_repeated_answers_and_their_scores(self, connection):
+        migrate(connection, "9fd0a0f6cc76", downgrade=True)
+        db = Session(bind=connection)
+        user = crud.create_user(db, "alice", "alice@example.com", "hashed")
+        quiz = crud.create_quiz(db, "My Quiz", "desc", user.id)
+        q1 = crud.create_question(db, quiz.id, "What is 2+2?", QuestionType.OPEN_ENDED, 1, correct_answer="4")
+        q2 = crud.create_question(db, quiz.id, "What is 3+3?", QuestionType.OPEN_ENDED, 2, correct_answer="6")
+        session = crud.create_session(db, quiz.id, user.id)
+        bob, carol = crud.create_participant(db, session.id, "Bob"), crud.create_participant(db, session.id, "Carol")
+        for participant, question, answer in [(bob, q1, "4"), (bob, q1, "4"), (bob, q2, "6"), (carol, q1, "4")]:
+            crud.submit_answer(db, session.id, participant.id, question.id, answer)
+        db.commit()
+        ids = bob.id, carol.id
+        db.close()
+
+        migrate(connection)
+        scores = dict(connection.execute(text("SELECT id, total_score FROM participants")).all())
+        assert connection.execute(text("SELECT COUNT(*) FROM answers")).scalar() == 3
+        assert [scores[pid] for pid in ids] == [20, 10]
+        connection.execute(text("TRUNCATE users CASCADE"))
+        connection.commit()
+
+
+class TestQueryPlans:
+
+    def test_get_answer(self, db):
+        assert "uq_answers_session_participant_question" in plan(db, crud.get_answer, 1, 2, 3)
+
+    def test_get_answers_for_question(self, db):
+        assert "ix_answers_session_question" in plan(db, crud.get_answers_for_question, 1, 3)
+
+    def test_get_session_leaderboard(self, db):
+        explained = plan(db, crud.get_session_leaderboard, 1)
+        assert "ix_participants_session_score" in explained
+        assert "Sort" not in explained  # read in order from the index
+
+    def test_get_questions_by_quiz(self, db):
+        explained = plan(db, crud.get_questions_by_quiz, 1)
+        assert "ix_questions_quiz_order" in explained
+        assert "Sort" not in explained
+
+    def test_get_quizzes_by_user(self, db):
+        explained = plan(db, crud.get_quizzes_by_user, 1)
+        assert "ix_quizzes_creator_created" in explained
+        assert "Sort" not in explained
+
+    def test_one_answer_per_participant_per_question(self, db):
+        user = crud.create_user(db, "alice", "alice@example.com", "hashed")
+        quiz = crud.create_quiz(db, "My Quiz", "desc", user.id)
+        question = crud.create_question(db, quiz.id, "What is 2+2?", QuestionType.OPEN_ENDED, 1, correct_answer="4")
+        session = crud.create_session(db, quiz.id, user.id)
+        participant = crud.create_participant(db, session.id, "Bob")
+        crud.submit_answer(db, session.id, participant.id, question.id, "4")
+        with pytest.raises(IntegrityError, match="uq_answers_session_participant_question"):
+            crud.submit_answer(db, session.id, participant.id, question.id, "4")
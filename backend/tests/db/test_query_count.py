@@ -0,0 +1,75 @@
+"""
+Tests for db/query_count.py and the unit of work of get_db
+"""
+
+from unittest.mock import MagicMock, patch
+
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from app.db import database
+from app.db.query_count import QueryCountMiddleware, counting
+
+
+def make_app() -> tuple[FastAPI, MagicMock]:
+    app = FastAPI()
+    app.add_middleware(QueryCountMiddleware)
+    engine = create_engine("sqlite://")
+    session = MagicMock()
+
+    @app.get("/queries/{n}")
+    def run_queries(n: int, db=Depends(database.get_db, scope="function")):
+        with engine.connect() as connection:
+            for _ in range(n):
+                connection.execute(text("SELECT 1"))
+            connection.commit()
+        if n == 0:
+            raise HTTPException(status_code=404)
+        return {"n": n}
+
+    return app, session
+
+
+class TestQueryCount:
+
+    def test_counts_statements_and_commits(self):
+        engine = create_engine("sqlite://")
+        with counting() as queries, engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+            connection.execute(text("SELECT 2"))
+            connection.commit()
+        assert queries.count == 3
+
+    def test_nothing_is_counted_outside_a_block(self):
+        engine = create_engine("sqlite://")
+        with counting() as queries:
+            pass
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+        assert queries.count == 0
+
+    def test_header_per_request(self):
+        app, session = make_app()
+        with patch.object(database, "SessionLocal", return_value=session):
+            client = TestClient(app)
+            assert client.get("/queries/2").headers["x-query-count"] == "3"
+            assert client.get("/queries/5").headers["x-query-count"] == "6"
+
+
+class TestGetDb:
+
+    def test_request_commits_once(self):
+        app, session = make_app()
+        with patch.object(database, "SessionLocal", return_value=session):
+            TestClient(app).get("/queries/1")
+        session.commit.assert_called_once()
+        session.rollback.assert_not_called()
+        session.close.assert_called_once()
+
+    def test_failed_request_rolls_back(self):
+        app, session = make_app()
+        with patch.object(database, "SessionLocal", return_value=session):
+            assert TestClient(app).get("/queries/0").status_code == 404
+        session.commit.assert_not_called()
+        session.rollback.assert_called_once()
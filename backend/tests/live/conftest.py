@@ -0,0 +1,53 @@
+"""
+Shared fixtures and helpers used across the live session test modules.
+"""
+
+import asyncio
+import json
+
+import msgpack
+
+
+# ── factory helpers ────────────────────────────────────────────────────────────
+
+class FakeWebSocket:
+    """Stand-in for a starlette WebSocket that records what was sent to it"""
+
+    def __init__(self, delay: float = 0.0, fail: bool = False):
+        self.delay = delay
+        self.fail  = fail
+        self.sent  = []  # messages, array frames are unpacked
+        self.frames = 0
+        self.binary = 0  # number of frames that were sent as bytes
+        self.closed_with = None
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def send_text(self, data: str):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("connection closed")
+        self._received(json.loads(data))
+
+    async def send_bytes(self, data: bytes):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("connection closed")
+        self.binary += 1
+        self._received(msgpack.unpackb(data))
+
+    def _received(self, message):
+        self.frames += 1
+        if isinstance(message, list):
+            self.sent.extend(message)
+        else:
+            self.sent.append(message)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+    async def send_json(self, message):
+        await self.send_text(json.dumps(message))
@@ -0,0 +1,122 @@
+"""
+Tests for live/actor.py
+"""
+
+import asyncio
+import time
+from unittest.mock import patch
+
+import pytest
+
+from app.live.actor import SessionActor, SessionActors
+
+
+@pytest.mark.asyncio
+class TestSessionActor:
+
+    async def test_messages_of_a_session_are_handled_one_at_a_time(self):
+        actors, log = SessionActors(), []
+
+        async def handler(name):
+            log.append(("start", name))
+            await asyncio.sleep(0.01)  # e.g. a broadcast
+            log.append(("end", name))
+
+        for name in "abc":
+            await actors.tell("ABCDE", handler, name)
+        await actors.join("ABCDE")
+        assert log == [("start", "a"), ("end", "a"), ("start", "b"), ("end", "b"), ("start", "c"), ("end", "c")]
+        await actors.close()
+
+    async def test_sessions_do_not_wait_for_each_other(self):
+        actors = SessionActors()
+
+        async def slow():
+            await asyncio.sleep(0.2)
+
+        start = time.perf_counter()
+        for code in ("AAAAA", "BBBBB", "CCCCC", "DDDDD"):
+            await actors.tell(code, slow)
+        await asyncio.gather(*(actors.join(code) for code in ("AAAAA", "BBBBB", "CCCCC", "DDDDD")))
+        assert time.perf_counter() - start < 0.5  # one after the other would take 0.8
+        await actors.close()
+
+    async def test_failing_handler_does_not_stop_the_actor(self):
+        actors, handled = SessionActors(), []
+
+        async def fail():
+            raise ValueError
+
+        async def ok():
+            handled.append(True)
+
+        await actors.tell("ABCDE", fail)
+        await actors.tell("ABCDE", ok)
+        await actors.join("ABCDE")
+        assert handled == [True]
+        assert actors.metrics("ABCDE")["errors"] == 1
+        assert actors.metrics("ABCDE")["processed"] == 2
+        await actors.close()
+
+    async def test_failing_handler_is_logged_and_reported(self):
+        failures = []
+
+        async def on_error(handler, args, exc):
+            failures.append((handler, args, type(exc)))
+
+        async def fail(*args):
+            raise ValueError
+
+        actors = SessionActors(on_error=on_error)
+        with patch("app.live.actor.logger") as logger:
+            await actors.tell("ABCDE", fail, "5", {"type": "submit_answer"})
+            await actors.join("ABCDE")
+        assert failures == [(fail, ("5", {"type": "submit_answer"}), ValueError)]
+        assert "ABCDE" in logger.exception.call_args.args
+        await actors.close()
+
+    async def test_metrics_report_depth_and_latency(self):
+        actor = SessionActor("ABCDE")
+
+        async def handler():
+            await asyncio.sleep(0.01)
+
+        for _ in range(5):
+            await actor.tell(handler)
+        assert actor.depth == 5
+        await actor.join()
+
+        metrics = actor.metrics()
+        assert metrics["max_queue_depth"] == 5 and metrics["queue_depth"] == 0
+        assert 10 <= metrics["latency_p50_ms"] <= metrics["latency_max_ms"]
+        assert metrics["latency_max_ms"] >= 50  # the last one waited for the four before it
+        actor.close()
+
+    async def test_full_queue_makes_the_sender_wait(self):
+        actor, release = SessionActor("ABCDE", maxsize=1), asyncio.Event()
+        await actor.tell(release.wait)
+        await asyncio.sleep(0)  # taken off the queue, being handled
+        await actor.tell(release.wait)
+        blocked = asyncio.create_task(actor.tell(release.wait))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+        release.set()
+        await asyncio.wait_for(blocked, 1)
+        await actor.join()
+        actor.close()
+
+    async def test_idle_actor_stops_and_is_replaced(self):
+        actors, handled = SessionActors(idle_timeout=0.01), []
+
+        async def handler(value):
+            handled.append(value)
+
+        await actors.tell("ABCDE", handler, 1)
+        first = actors.get("ABCDE")
+        await asyncio.sleep(0.05)
+        assert first.task.done() and "ABCDE" not in actors.actors
+
+        await actors.tell("ABCDE", handler, 2)
+        await actors.join("ABCDE")
+        assert handled == [1, 2] and actors.get("ABCDE") is not first
+        await actors.close()
@@ -0,0 +1,33 @@
+"""
+Tests for live/compression.py
+"""
+
+import pytest
+from uvicorn.config import Config
+from uvicorn.server import ServerState
+
+from app.live.compression import DeflateWebSocketProtocol, deflate_factory
+
+
+async def app(scope, receive, send):
+    pass
+
+
+class TestDeflate:
+
+    def test_factory_uses_settings(self):
+        factory = deflate_factory(level=3, mem_level=4, window_bits=10, no_context_takeover=True)
+        assert factory.compress_settings == {"level": 3, "memLevel": 4}
+        assert factory.server_max_window_bits == 10
+        assert factory.server_no_context_takeover is True
+
+    @pytest.mark.asyncio
+    async def test_protocol_offers_tuned_extension(self):
+        protocol  = DeflateWebSocketProtocol(Config(app, ws_per_message_deflate=True), ServerState(), {})
+        [factory] = protocol.available_extensions
+        assert factory.compress_settings == deflate_factory().compress_settings
+
+    @pytest.mark.asyncio
+    async def test_deflate_can_be_switched_off(self):
+        protocol = DeflateWebSocketProtocol(Config(app, ws_per_message_deflate=False), ServerState(), {})
+        assert protocol.available_extensions == []
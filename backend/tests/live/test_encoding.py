@@ -0,0 +1,112 @@
+"""
+Tests for live/encoding.py
+"""
+
+import json
+from unittest.mock import patch
+
+from app.live import encoding
+
+
+class TestEncode:
+
+    def test_round_trips_through_json(self):
+        message = {"type": "leaderboard_update", "leaderboard": [{"name": "Bob", "score": 10}]}
+        assert json.loads(encoding.encode(message)) == message
+
+    def test_returns_text(self):
+        assert isinstance(encoding.encode({"type": "ping"}), str)
+
+    def test_unicode(self):
+        message = {"name": "Zoë 🎉"}
+        assert json.loads(encoding.encode(message)) == message
+
+    @patch("app.live.encoding.orjson", None)
+    def test_falls_back_to_stdlib_json(self):
+        frame = encoding.encode({"type": "ping", "n": 1})
+        assert frame == '{"type":"ping","n":1}'
+
+
+class TestMsgpack:
+
+    def test_round_trips_through_msgpack(self):
+        message = {"type": "question_start", "question": {"id": 1, "options": ["a", "b"]}}
+        frame   = encoding.encode(message, encoding.MSGPACK)
+        assert isinstance(frame, bytes)
+        assert encoding.decode(frame) == message
+
+    def test_decode_text_is_json(self):
+        assert encoding.decode('{"type":"ping"}') == {"type": "ping"}
+
+
+class TestBatch:
+
+    def test_json_array(self):
+        frames = [encoding.encode({"n": n}) for n in range(3)]
+        assert json.loads(encoding.batch(frames)) == [{"n": 0}, {"n": 1}, {"n": 2}]
+
+    def test_msgpack_array_of_any_length(self):
+        for count in (1, 15, 16, 70_000):
+            frames = [encoding.encode({"n": n}, encoding.MSGPACK) for n in range(count)]
+            assert encoding.decode(encoding.batch(frames, encoding.MSGPACK)) == [{"n": n} for n in range(count)]
+
+
+class TestNegotiate:
+
+    def test_subprotocol_wins(self):
+        assert encoding.negotiate(["chat", "quiz.msgpack"], "json") == ("msgpack", "quiz.msgpack")
+
+    def test_query_parameter(self):
+        assert encoding.negotiate([], "msgpack") == ("msgpack", None)
+
+    def test_falls_back_to_json(self):
+        assert encoding.negotiate(["chat"], "xml") == ("json", None)
+
+    @patch("app.live.encoding.ENCODINGS", ["json"])
+    def test_msgpack_unavailable(self):
+        assert encoding.negotiate([], "msgpack") == ("json", None)
+
+
+class TestFrames:
+
+    def test_each_encoding_is_done_once(self):
+        frames = encoding.Frames({"type": "ping"})
+        with patch("app.live.encoding.encode", wraps=encoding.encode) as spy:
+            assert frames.get() is frames.get()
+            assert frames.get(encoding.MSGPACK) is frames.get(encoding.MSGPACK)
+        assert spy.call_count == 2
+
+    def test_from_json_frame(self):
+        frames = encoding.as_frames('{"type":"ping"}')
+        assert frames.get() == '{"type":"ping"}'
+        assert encoding.decode(frames.get(encoding.MSGPACK)) == {"type": "ping"}
+
+
+class TestAsFrame:
+
+    def test_encodes_dicts(self):
+        assert json.loads(encoding.as_frame({"a": 1})) == {"a": 1}
+
+    def test_passes_frames_through(self):
+        frame = '{"a":1}'
+        assert encoding.as_frame(frame) is frame
+
+
+class TestPreencoded:
+
+    def test_spliced_into_json(self):
+        question = encoding.Preencoded({"id": 3, "content": "Zoë?"})
+        frame = encoding.encode({"type": "question_start", "question": question, "seq": 4})
+        assert json.loads(frame) == {"type": "question_start", "question": {"id": 3, "content": "Zoë?"}, "seq": 4}
+
+    def test_spliced_into_msgpack(self):
+        question = encoding.Preencoded({"id": 3, "options": ["a", "b"]})
+        message = {f"k{i}": i for i in range(20)}
+        message["question"] = question
+        decoded = encoding.decode(encoding.encode(message, encoding.MSGPACK))
+        assert decoded == {**{f"k{i}": i for i in range(20)}, "question": {"id": 3, "options": ["a", "b"]}}
+
+    def test_is_not_encoded_again(self):
+        question = encoding.Preencoded({"id": 3})
+        question.value["id"] = 4
+        assert json.loads(encoding.encode({"question": question})) == {"question": {"id": 3}}
@@ -0,0 +1,141 @@
+"""
+Tests for live/fanout.py
+"""
+
+import asyncio
+import time
+from unittest.mock import patch
+
+import pytest
+
+from app.live.encoding import JSON, MSGPACK, encode
+from app.live.fanout import FanOut
+from .conftest import FakeWebSocket
+
+
+MESSAGE = {"type": "question_start", "question": {"id": 1}}
+
+
+async def drain(fanout: FanOut):
+    await asyncio.gather(*(outbox.join() for outbox in fanout.outboxes.values()))
+
+
+@pytest.mark.asyncio
+class TestBroadcast:
+
+    async def test_delivers_to_every_socket(self):
+        fanout  = FanOut()
+        sockets = [FakeWebSocket() for _ in range(10)]
+        failed  = await fanout.broadcast(sockets, MESSAGE)
+        await drain(fanout)
+        assert failed == []
+        assert all(ws.sent == [MESSAGE] for ws in sockets)
+        assert fanout.metrics(sockets)["sent"] == 10
+
+    async def test_sends_concurrently(self):
+        fanout  = FanOut()
+        sockets = [FakeWebSocket(delay=0.05) for _ in range(20)]
+        start   = time.perf_counter()
+        await fanout.broadcast(sockets, MESSAGE)
+        await drain(fanout)
+        # sequential sending would take 20 * 0.05 = 1s
+        assert time.perf_counter() - start < 0.5
+
+    async def test_failed_sockets_are_returned(self):
+        fanout = FanOut(max_failures=1)
+        good, bad = FakeWebSocket(), FakeWebSocket(fail=True)
+        await fanout.broadcast([good, bad], MESSAGE)
+        await drain(fanout)
+        failed = await fanout.broadcast([good, bad], MESSAGE)
+        assert failed == [bad]
+        assert fanout.metrics([bad])["failed"] == 1
+
+    async def test_empty_broadcast(self):
+        assert await FanOut().broadcast([], MESSAGE) == []
+
+    async def test_leaderboard_updates_are_coalesced(self):
+        fanout = FanOut()
+        ws     = FakeWebSocket()
+        for n in range(5):
+            await fanout.broadcast([ws], {"type": "leaderboard_update", "n": n})
+        await drain(fanout)
+        # the writer did not get to run in between, so only the latest update is sent
+        assert ws.sent == [{"type": "leaderboard_update", "n": 4}]
+
+
+@pytest.mark.asyncio
+class TestSlowConsumers:
+
+    async def test_slow_socket_does_not_stall_broadcast(self):
+        fanout = FanOut()
+        fast, slow = FakeWebSocket(), FakeWebSocket(delay=1.0)
+        start = time.perf_counter()
+        await fanout.broadcast([slow, fast], MESSAGE)
+        await fanout.outboxes[fast].join()
+        assert time.perf_counter() - start < 0.5
+        assert fast.sent == [MESSAGE]
+        assert fanout.metrics([slow])["sent"] == 0
+        fanout.forget(slow)
+
+    async def test_send_reports_failed_connection(self):
+        fanout = FanOut(send_timeout=0.01, max_failures=1)
+        slow   = FakeWebSocket(delay=1.0)
+        assert await fanout.send(slow, MESSAGE) is True
+        await drain(fanout)
+        assert await fanout.send(slow, MESSAGE) is False
+
+    async def test_forget_cancels_pending_send(self):
+        fanout = FanOut()
+        slow   = FakeWebSocket(delay=1.0)
+        await fanout.broadcast([slow], MESSAGE)
+        await asyncio.sleep(0)
+        fanout.forget(slow)
+        await asyncio.sleep(0)
+        assert fanout.outboxes == {}
+        assert slow.sent == []
+
+
+@pytest.mark.asyncio
+class TestEncodeOnce:
+
+    async def test_message_is_encoded_once_per_broadcast(self):
+        fanout  = FanOut()
+        sockets = [FakeWebSocket() for _ in range(50)]
+        with patch("app.live.encoding.encode", wraps=encode) as spy:
+            await fanout.broadcast(sockets, MESSAGE)
+        await drain(fanout)
+        assert spy.call_count == 1
+        assert all(ws.sent == [MESSAGE] for ws in sockets)
+
+    async def test_message_is_encoded_once_per_encoding_in_use(self):
+        fanout  = FanOut()
+        sockets = [FakeWebSocket() for _ in range(50)]
+        for ws in sockets[::2]:
+            fanout.open(ws, MSGPACK)
+        with patch("app.live.encoding.encode", wraps=encode) as spy:
+            await fanout.broadcast(sockets, MESSAGE)
+        await drain(fanout)
+        assert sorted(call.args[1] for call in spy.call_args_list) == [JSON, MSGPACK]
+        assert all(ws.sent == [MESSAGE] for ws in sockets)
+        assert [ws.binary for ws in sockets[:2]] == [1, 0]
+
+    async def test_pre_encoded_frames_are_converted_for_msgpack(self):
+        fanout = FanOut()
+        ws     = FakeWebSocket()
+        fanout.open(ws, MSGPACK)
+        await fanout.broadcast([ws], encode(MESSAGE))
+        await drain(fanout)
+        assert ws.sent == [MESSAGE] and ws.binary == 1
+
+    async def test_accepts_pre_encoded_frames(self):
+        fanout = FanOut()
+        ws     = FakeWebSocket()
+        await fanout.broadcast([ws], encode(MESSAGE))
+        await drain(fanout)
+        assert ws.sent == [MESSAGE]
+
+    async def test_close_stops_all_writers(self):
+        fanout = FanOut()
+        await fanout.broadcast([FakeWebSocket(), FakeWebSocket()], MESSAGE)
+        fanout.close()
+        assert fanout.outboxes == {}
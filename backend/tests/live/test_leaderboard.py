@@ -0,0 +1,70 @@
+"""
+Tests for live/leaderboard.py
+"""
+
+import random
+
+import pytest
+
+from app.live import Leaderboard
+
+
+def make_board(scores: dict[int, int]) -> Leaderboard:
+    board = Leaderboard()
+    for slot, score in scores.items():
+        board.set(slot, score)
+    return board
+
+
+class TestLeaderboard:
+
+    def test_top_is_ordered_by_score_then_slot(self):
+        board = make_board({3: 10, 1: 5, 2: 10, 4: 0})
+        assert board.top() == [(2, 10), (3, 10), (1, 5), (4, 0)]
+        assert board.top(2) == [(2, 10), (3, 10)]
+
+    def test_rank_follows_score_updates(self):
+        board = make_board({1: 0, 2: 0, 3: 0})
+        assert board.rank(3) == 3
+        board.add(3, 10)
+        assert board.rank(3) == 1
+        board.add(1, 20)
+        assert [board.rank(slot) for slot in (1, 2, 3)] == [1, 3, 2]
+
+    def test_refused_score_leaves_the_ranking_as_it_was(self):
+        board = make_board({1: 5, 2: 3})
+        for score in (2.5, "7"):
+            with pytest.raises(TypeError):
+                board.set(1, score)
+        with pytest.raises(TypeError):
+            board.set(3, 1.5)
+        assert board.top() == [(1, 5), (2, 3)]
+        assert (board.rank(1), len(board), 3 in board) == (1, 2, False)
+
+    def test_unknown_participant(self):
+        board = make_board({1: 5})
+        assert board.rank(2) is None
+        assert 2 not in board
+        board.remove(2)
+        assert len(board) == 1
+
+    def test_negative_and_large_scores(self):
+        board = make_board({0: -5, 1: 2 ** 40, 7: 0})
+        assert board.top() == [(1, 2 ** 40), (7, 0), (0, -5)]
+        assert board.score(7) == 0 and board.score(3) is None and 3 not in board
+
+    def test_remove(self):
+        board = make_board({1: 5, 2: 7})
+        board.remove(2)
+        assert board.top() == [(1, 5)]
+        assert board.rank(1) == 1
+
+    def test_matches_full_sort(self):
+        rng   = random.Random(3)
+        board = Leaderboard()
+        for _ in range(2000):
+            board.add(rng.randrange(200), rng.randrange(-5, 20))
+        scores   = {slot: board.score(slot) for slot in range(200) if slot in board}
+        expected = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        assert board.top() == expected
+        assert all(board.rank(slot) == n for n, (slot, _) in enumerate(expected, start=1))
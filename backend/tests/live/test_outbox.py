@@ -0,0 +1,186 @@
+"""
+Tests for live/outbox.py
+"""
+
+import asyncio
+
+import pytest
+
+from app.live.encoding import MSGPACK, encode
+from app.live.outbox import Outbox
+from .conftest import FakeWebSocket
+
+
+def frame(n: int, type="question_start") -> str:
+    return encode({"type": type, "n": n})
+
+
+@pytest.mark.asyncio
+class TestOutbox:
+
+    async def test_sends_in_order(self):
+        ws     = FakeWebSocket()
+        outbox = Outbox(ws)
+        outbox.start()
+        for n in range(5):
+            outbox.put(frame(n))
+        await outbox.join()
+        assert [m["n"] for m in ws.sent] == [0, 1, 2, 3, 4]
+        assert outbox.sent == 5
+        outbox.close()
+
+    async def test_full_queue_drops_only_coalesced_messages(self):
+        ws     = FakeWebSocket()
+        outbox = Outbox(ws, maxsize=3, max_batch=1)
+        outbox.put(frame(0))
+        outbox.put(frame(1, "leaderboard_rank"), coalesce_key="leaderboard_rank", batched=True)
+        outbox.put(frame(2))
+        assert outbox.put(frame(3)) is True
+        assert (outbox.depth, outbox.dropped) == (3, 1)
+
+        outbox.start()
+        await outbox.join()
+        assert [m["n"] for m in ws.sent] == [0, 2, 3]
+        outbox.close()
+
+    async def test_full_queue_that_cannot_drop_fails_the_outbox(self):
+        outbox = Outbox(FakeWebSocket(), maxsize=3)
+        for n in range(3):
+            outbox.put(frame(n))
+        assert outbox.put(frame(3)) is False
+        assert outbox.failed is True
+        assert (outbox.depth, outbox.dropped) == (0, 4)
+
+    async def test_coalesces_by_key(self):
+        ws     = FakeWebSocket()
+        outbox = Outbox(ws)
+        outbox.put(frame(0))
+        outbox.put(frame(1, "leaderboard_update"), coalesce_key="leaderboard_update")
+        outbox.put(frame(2))
+        outbox.put(frame(3, "leaderboard_update"), coalesce_key="leaderboard_update")
+        assert outbox.depth == 3
+        assert outbox.coalesced == 1
+
+        outbox.start()
+        await outbox.join()
+        # the latest leaderboard keeps the position of the first one
+        assert [m["n"] for m in ws.sent] == [0, 3, 2]
+        outbox.close()
+
+    async def test_coalesced_message_can_be_queued_again_after_send(self):
+        ws     = FakeWebSocket()
+        outbox = Outbox(ws)
+        outbox.start()
+        outbox.put(frame(0), coalesce_key="k")
+        await outbox.join()
+        outbox.put(frame(1), coalesce_key="k")
+        await outbox.join()
+        assert [m["n"] for m in ws.sent] == [0, 1]
+        outbox.close()
+
+    async def test_repeated_send_failures_mark_outbox_failed(self):
+        ws     = FakeWebSocket(fail=True)
+        outbox = Outbox(ws, max_failures=3)
+        outbox.start()
+        for n in range(4):
+            outbox.put(frame(n))
+        await outbox.join()
+        assert outbox.failed is True
+        assert outbox.send_failures == 3
+        assert outbox.depth == 0
+        assert outbox.put(frame(4)) is False
+
+    async def test_single_send_failure_is_survived(self):
+        ws     = FakeWebSocket(fail=True)
+        outbox = Outbox(ws, max_failures=2)
+        outbox.start()
+        outbox.put(frame(0))
+        await outbox.join()
+        ws.fail = False
+        outbox.put(frame(1))
+        await outbox.join()
+        assert outbox.failed is False
+        assert [m["n"] for m in ws.sent] == [1]
+        assert (outbox.send_failures, outbox.dropped) == (1, 1)
+        outbox.close()
+
+    async def test_send_timeout_marks_outbox_failed(self):
+        ws     = FakeWebSocket(delay=1.0)
+        outbox = Outbox(ws, send_timeout=0.01, max_failures=1)
+        outbox.start()
+        outbox.put(frame(0))
+        await asyncio.wait_for(outbox.join(), 0.5)
+        assert outbox.failed is True
+
+    async def test_close_discards_queue(self):
+        outbox = Outbox(FakeWebSocket())
+        outbox.put(frame(0))
+        outbox.close()
+        assert outbox.depth == 0
+
+
+@pytest.mark.asyncio
+class TestBatching:
+
+    async def test_burst_is_sent_as_one_array_frame_on_the_tick(self):
+        ws     = FakeWebSocket()
+        outbox = Outbox(ws, tick_interval=0.02)
+        outbox.start()
+        for n in range(10):
+            outbox.put(frame(n, "answer_submitted"), batched=True)
+        await outbox.join()
+        assert [m["n"] for m in ws.sent] == list(range(10))
+        assert ws.frames == 1
+        assert (outbox.sent, outbox.frames) == (10, 1)
+        outbox.close()
+
+    async def test_pending_batch_takes_one_place_in_the_queue(self):
+        ws     = FakeWebSocket()
+        outbox = Outbox(ws, maxsize=3, max_batch=200, tick_interval=0.01)
+        outbox.put(frame(-1))
+        for n in range(300):
+            assert outbox.put(frame(n, "answer_submitted"), batched=True)
+        assert outbox.depth == 301  # the urgent frame and two batches, of 200 and 100
+        outbox.put(frame(300))  # sent along with the second batch
+        assert outbox.failed is False
+
+        outbox.start()
+        await outbox.join()
+        assert [m["n"] for m in ws.sent] == list(range(-1, 301))
+        assert ws.frames == 3
+        outbox.close()
+
+    async def test_urgent_frame_takes_the_batch_along_without_waiting(self):
+        ws     = FakeWebSocket()
+        outbox = Outbox(ws, tick_interval=10)
+        outbox.start()
+        outbox.put(frame(0, "participant_joined"), batched=True)
+        outbox.put(frame(1, "participant_joined"), batched=True)
+        await asyncio.sleep(0.01)
+        assert ws.sent == []  # waiting for the tick
+
+        outbox.put(frame(2))
+        await asyncio.wait_for(outbox.join(), 1)
+        assert [m["n"] for m in ws.sent] == [0, 1, 2]
+        assert ws.frames == 1
+        outbox.close()
+
+    async def test_urgent_frames_are_not_batched_together(self):
+        ws     = FakeWebSocket()
+        outbox = Outbox(ws, tick_interval=10)
+        for n in range(3):
+            outbox.put(frame(n))
+        outbox.start()
+        await asyncio.wait_for(outbox.join(), 1)
+        assert ws.frames == 3
+
+    async def test_msgpack_batch(self):
+        ws     = FakeWebSocket()
+        outbox = Outbox(ws, encoding=MSGPACK, tick_interval=0.01)
+        for n in range(20):
+            outbox.put(encode({"type": "answer_submitted", "n": n}, MSGPACK), batched=True)
+        outbox.start()
+        await outbox.join()
+        assert [m["n"] for m in ws.sent] == list(range(20))
+        assert (ws.frames, ws.binary) == (1, 1)
+        outbox.close()
@@ -0,0 +1,39 @@
+"""
+Tests for live/ratelimit.py
+"""
+
+from app.live.ratelimit import DEFAULT_BURST, RateLimiter, parse_limits
+
+
+class TestRateLimiter:
+
+    def test_burst_then_refill(self):
+        limiter = RateLimiter({"submit_answer": (2.0, 4)})
+        assert [limiter.allow("submit_answer", now=0.0) for _ in range(5)] == [True] * 4 + [False]
+        assert limiter.allow("submit_answer", now=0.25) is False  # half a token
+        assert limiter.allow("submit_answer", now=0.5) is True
+        assert limiter.allow("submit_answer", now=0.5) is False
+
+    def test_refill_is_capped_at_burst(self):
+        limiter = RateLimiter({"submit_answer": (2.0, 4)})
+        limiter.allow("submit_answer", now=0.0)
+        assert sum(limiter.allow("submit_answer", now=100.0) for _ in range(10)) == 4
+
+    def test_types_have_their_own_budget(self):
+        limiter = RateLimiter({"submit_answer": (1.0, 1), "next_question": (1.0, 1)})
+        assert limiter.allow("submit_answer", now=0.0)
+        assert not limiter.allow("submit_answer", now=0.0)
+        assert limiter.allow("next_question", now=0.0)
+
+    def test_other_types_share_one_bucket(self):
+        limiter = RateLimiter({})
+        allowed = sum(limiter.allow(f"made_up_{n}", now=0.0) for n in range(100))
+        assert allowed == DEFAULT_BURST
+        assert list(limiter.buckets) == ["*"]
+        assert not limiter.allow(["unhashable"], now=0.0)
+
+    def test_parse_limits(self):
+        assert parse_limits("submit_answer=2/4, score_answer=20,") == {
+            "submit_answer": (2.0, 4.0),
+            "score_answer": (20.0, 20.0),
+        }
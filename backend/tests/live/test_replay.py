@@ -0,0 +1,67 @@
+"""
+Tests for live/replay.py
+"""
+
+from app.live.encoding import Frames
+from app.live.replay import ReplayBuffer
+
+
+def fill(replay: ReplayBuffer, events: list[tuple[str, str | None]]):
+    for target, participant_id in events:
+        seq = replay.next_seq()
+        replay.append(seq, target, participant_id, "event", Frames({"seq": seq}))
+
+
+def seqs(missed) -> list[int]:
+    return [frames.message["seq"] for _, frames in missed]
+
+
+class TestReplayBuffer:
+
+    def test_sequence_numbers_increase(self):
+        replay = ReplayBuffer()
+        assert [replay.next_seq() for _ in range(3)] == [1, 2, 3]
+
+    def test_replays_only_events_for_the_recipient(self):
+        replay = ReplayBuffer()
+        fill(replay, [("all", None), ("participant", "1"), ("participant", "2"), ("host", None), ("participants", None)])
+        assert seqs(replay.since(0, "1")) == [1, 2, 5]
+        assert seqs(replay.since(2, "1")) == [5]
+        assert seqs(replay.since(0)) == [1, 4]
+
+    def test_up_to_date_client_gets_nothing(self):
+        replay = ReplayBuffer()
+        fill(replay, [("all", None)] * 3)
+        assert replay.since(3, "1") == []
+
+    def test_gap_larger_than_buffer_needs_snapshot(self):
+        replay = ReplayBuffer(size=4)
+        fill(replay, [("all", None)] * 10)
+        assert seqs(replay.since(6, "1")) == [7, 8, 9, 10]
+        assert replay.since(5, "1") is None
+        assert replay.since(5) is None
+
+    def test_unicasts_do_not_push_out_broadcasts(self):
+        replay = ReplayBuffer(size=4, unicast_size=2)
+        fill(replay, [("all", None)] + [("participant", str(pid)) for pid in range(500)] + [("host", None)] * 500)
+        fill(replay, [("participants", None)])
+        assert seqs(replay.since(0, "7")) == [1, 9, 1002]
+        assert seqs(replay.since(1000, "7")) == [1002]
+        assert replay.since(0) is None  # the host got more than fits in its ring
+
+    def test_evicted_unicast_needs_snapshot(self):
+        replay = ReplayBuffer(unicast_size=2)
+        fill(replay, [("participant", "1")] * 3)
+        assert seqs(replay.since(1, "1")) == [2, 3]
+        assert replay.since(0, "1") is None
+        assert replay.since(0, "2") == []  # none of them were for participant 2
+
+    def test_unknown_sequence_number_needs_snapshot(self):
+        replay = ReplayBuffer()
+        fill(replay, [("all", None)] * 2)
+        assert replay.since(7, "1") is None  # e.g. the worker restarted
+
+    def test_remote_events_advance_sequence(self):
+        replay = ReplayBuffer()
+        replay.append(5, "all", None, "event", Frames({"seq": 5}))
+        assert replay.next_seq() == 6
@@ -0,0 +1,74 @@
+"""
+Tests for live/sharding.py
+"""
+
+import pytest
+
+from app.live.sharding import ShardMap, parse_workers, read_workers
+
+
+WORKERS = ["ws://w1:8001", "ws://w2:8002", "ws://w3:8003"]
+CODES   = [f"C{n:04d}" for n in range(600)]
+
+
+class TestShardMap:
+
+    def test_without_workers_everything_is_local(self):
+        shards = ShardMap([], "")
+        assert shards.is_local("ABCDE")
+
+    def test_owner_is_deterministic_across_instances(self):
+        a = ShardMap(WORKERS, WORKERS[0])
+        b = ShardMap(WORKERS, WORKERS[1])
+        assert all(a.owner(code) == b.owner(code) for code in CODES)
+
+    def test_each_session_is_local_on_exactly_one_worker(self):
+        maps = [ShardMap(WORKERS, w) for w in WORKERS]
+        for code in CODES:
+            assert sum(m.is_local(code) for m in maps) == 1
+
+    def test_sessions_spread_over_workers(self):
+        shards = ShardMap(WORKERS, WORKERS[0])
+        counts = {w: 0 for w in WORKERS}
+        for code in CODES:
+            counts[shards.owner(code)] += 1
+        assert all(count > len(CODES) / 6 for count in counts.values())
+
+    def test_self_must_be_a_worker(self):
+        with pytest.raises(ValueError):
+            ShardMap(WORKERS, "ws://elsewhere:9000")
+
+
+class TestRebalance:
+
+    def test_adding_a_worker_only_moves_sessions_to_it(self):
+        shards = ShardMap(WORKERS, WORKERS[0])
+        local  = [c for c in CODES if shards.is_local(c)]
+        moved  = shards.rebalance(WORKERS + ["ws://w4:8004"], local)
+        assert moved
+        assert set(moved.values()) == {"ws://w4:8004"}
+        assert len(moved) < len(local) / 2
+
+    def test_removing_another_worker_moves_nothing_away(self):
+        shards = ShardMap(WORKERS, WORKERS[0])
+        local  = [c for c in CODES if shards.is_local(c)]
+        assert shards.rebalance(WORKERS[:2], local) == {}
+
+    def test_removing_this_worker_moves_everything(self):
+        shards = ShardMap(WORKERS, WORKERS[2])
+        local  = [c for c in CODES if shards.is_local(c)]
+        moved  = shards.rebalance(WORKERS[:2], local)
+        assert set(moved) == set(local)
+        assert set(moved.values()) <= set(WORKERS[:2])
+
+
+class TestWorkers:
+
+    def test_parse_accepts_commas_and_newlines(self):
+        assert parse_workers("ws://w1:8001, ws://w2:8002\nws://w3:8003\n\n") == WORKERS
+        assert parse_workers("") == []
+
+    def test_read_from_file(self, tmp_path):
+        path = tmp_path / "workers"
+        path.write_text("\n".join(WORKERS))
+        assert read_workers(str(path)) == WORKERS
@@ -0,0 +1,311 @@
+"""
+Tests for live/state.py
+"""
+
+import asyncio
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.live import LiveSession, LiveSessionStore
+from app.live.state import LiveQuestion
+
+
+def make_live(participants=(1, 2)) -> LiveSession:
+    live = LiveSession(7, "ABCDE", [LiveQuestion(11, 1, "4", 10, 30), LiveQuestion(12, 2, None, 5, 30)])
+    for pid in participants:
+        live.add_participant(pid, f"P{pid}")
+    return live
+
+
+class TestLiveSession:
+
+    def test_answer_is_graded_and_scored(self):
+        live = make_live()
+        live.next_question()
+        assert live.submit_answer(1, 11, " 4 ") == (True, 10)
+        assert live.submit_answer(2, 11, "5") == (False, 0)
+        assert live.scores == {1: 10, 2: 0}
+        assert live.answer_counts[11] == 2
+
+    def test_duplicate_and_unknown_answers_are_refused(self):
+        live = make_live()
+        live.next_question()
+        live.submit_answer(1, 11, "4")
+        assert live.submit_answer(1, 11, "4") is None
+        assert live.submit_answer(1, 99, "4") is None
+        assert live.submit_answer(3, 11, "4") is None
+        assert live.submit_answer(2, 12, "4") is None  # not opened yet
+        assert live.scores[1] == 10
+
+    def test_no_answers_after_the_end(self):
+        live = make_live()
+        live.next_question()
+        live.ended = True
+        assert live.submit_answer(1, 11, "4") is None
+
+    def test_answers_only_count_for_the_open_question(self):
+        live = make_live()
+        assert live.submit_answer(1, 11, "4") is None  # the session has not started
+        live.next_question()
+        live.next_question()
+        assert live.submit_answer(1, 11, "4") is None  # no longer the current question
+        assert live.submit_answer(1, 12, "x") == (False, 0)  # open ended, scored by the host
+
+    def test_rescore_adds_only_the_difference(self):
+        live = make_live()
+        live.next_question()
+        live.submit_answer(1, 11, "4")
+        assert live.score_answer(1, 11, 3) == -7
+        assert live.scores[1] == 3
+        assert live.score_answer(2, 11, 3) is None
+
+    def test_next_question_starts_at_current_index(self):
+        live = make_live()
+        assert live.current_question is None
+        assert live.next_question() == 0
+        assert live.current_question.id == 11
+        assert live.next_question() == 1
+        assert live.next_question(0) == 0
+
+    def test_upcoming_question(self):
+        live = make_live()
+        assert (live.upcoming_question_index, live.upcoming_question.id) == (0, 11)
+        live.next_question()
+        assert (live.upcoming_question_index, live.upcoming_question.id) == (1, 12)
+        live.next_question()
+        assert live.upcoming_question is None
+
+    def test_time_taken_is_measured_by_the_server(self):
+        live = make_live()
+        with patch("app.live.state.time.monotonic", return_value=100.0):
+            live.next_question()
+        with patch("app.live.state.time.monotonic", return_value=112.5):
+            live.submit_answer(1, 11, "4")
+        assert live.take_changes()["answers"][0]["time_taken"] == 12.5
+        assert live.deadline(11) == 130.0
+
+    def test_late_answer_is_refused(self):
+        live = make_live()
+        with patch("app.live.state.time.monotonic", return_value=100.0):
+            live.next_question()
+        with patch("app.live.state.time.monotonic", return_value=130.4):
+            assert live.submit_answer(1, 11, "4") == (True, 10)  # within the grace period
+        with patch("app.live.state.time.monotonic", return_value=131.0):
+            assert live.submit_answer(2, 11, "4") is None
+        assert live.answer_counts[11] == 1
+
+    def test_leaderboard_is_ordered_by_score(self):
+        live = make_live((1, 2, 3))
+        live.next_question()
+        live.submit_answer(2, 11, "4")
+        assert [row["participant_id"] for row in live.leaderboard()] == [2, 1, 3]
+        assert live.leaderboard(1) == [{"rank": 1, "participant_id": 2, "name": "P2", "total_score": 10}]
+        assert live.rank(3) == 3 and live.rank(9) is None
+
+    def test_rank_changes_only_reports_moved_participants(self):
+        live = make_live((1, 2, 3))
+        live.next_question()
+        assert set(live.rank_changes()) == {1, 2, 3}
+        assert live.rank_changes() == {}
+
+        live.submit_answer(3, 11, "4")
+        assert live.rank_changes() == {
+            3: {"rank": 1, "total_score": 10, "delta": 10},
+            1: {"rank": 2, "total_score": 0, "delta": 0},
+            2: {"rank": 3, "total_score": 0, "delta": 0},
+        }
+
+    def test_take_changes_hands_over_everything_once(self):
+        live = make_live()
+        live.next_question()
+        live.submit_answer(1, 11, "4")
+        live.score_answer(1, 11, 8)
+        live.next_question()
+
+        changes = live.take_changes()
+        assert changes["current_question_index"] == 1
+        assert changes["started_at"] is not None
+        assert [a["score"] for a in changes["answers"]] == [10]
+        assert changes["rescored"] == [{"participant_id": 1, "question_id": 11, "score": 8}]
+        assert changes["score_deltas"] == {1: 8}
+        assert live.take_changes() is None
+        live.next_question()
+        assert live.take_changes()["started_at"] is None  # only the start is recorded
+
+    def test_restored_changes_merge_with_newer_ones(self):
+        live = make_live()
+        live.next_question()
+        live.submit_answer(1, 11, "4")
+        changes = live.take_changes()
+        live.submit_answer(2, 11, "4")
+        live.restore_changes(changes)
+
+        merged = live.take_changes()
+        assert [a["participant_id"] for a in merged["answers"]] == [1, 2]
+        assert merged["score_deltas"] == {1: 10, 2: 10}
+
+
+@pytest.mark.asyncio
+class TestLiveSessionStore:
+
+    def _store(self, **kwargs) -> tuple[LiveSessionStore, list]:
+        written = []
+        store = LiveSessionStore(session_factory=MagicMock, **kwargs)
+        store._write = written.append
+        return store, written
+
+    async def test_each_session_is_written_in_its_own_transaction(self):
+        store, written = self._store()
+        a, b = make_live(), make_live()
+        b.code = "FGHIJ"
+        store.sessions.update({a.code: a, b.code: b})
+        a.next_question()
+        b.next_question()
+        a.submit_answer(1, 11, "4")
+        b.submit_answer(2, 11, "4")
+
+        assert await store.flush()
+        assert [len(changes) for changes in written] == [1, 1]
+        assert store.lag() == 0.0
+        assert store.metrics()["flushes"] == 2
+
+    async def test_failing_session_does_not_block_the_others(self):
+        store, written = self._store(max_attempts=2)
+        bad, good = make_live(), make_live()
+        good.code, good.session_id = "FGHIJ", 8
+        store.sessions.update({bad.code: bad, good.code: good})
+        bad.next_question()
+        good.next_question()
+
+        def write(changes):
+            if changes[0]["session_id"] == bad.session_id:
+                raise ValueError("bad row")
+            written.append(changes)
+        store._write = write
+
+        bad.submit_answer(1, 11, "4")
+        good.submit_answer(1, 11, "4")
+        assert not await store.flush()
+        assert len(written) == 1 and bad.pending_changes  # retried on the next flush
+
+        assert not await store.flush()
+        assert bad.pending_changes == 0  # given up on after the second attempt
+        assert [a["participant_id"] for a in store.dead_letters[0]["answers"]] == [1]
+        metrics = store.metrics()
+        assert (metrics["failed_flushes"], metrics["dead_lettered"]) == (2, 1)
+
+    async def test_background_writer_bounds_the_lag(self):
+        store, written = self._store(interval=0.01)
+        live = make_live()
+        with patch("app.live.state.LiveSession.load", return_value=live):
+            await store.open(MagicMock(), MagicMock(code="ABCDE"))
+        live.next_question()
+        live.submit_answer(1, 11, "4")
+        await asyncio.sleep(0.05)
+        await store.close()
+        assert len(written) == 1
+        assert store.max_lag < 0.05
+
+    async def test_many_changes_flush_early(self):
+        store, written = self._store(interval=10, max_pending=2)
+        live = make_live()
+        with patch("app.live.state.LiveSession.load", return_value=live):
+            await store.open(MagicMock(), MagicMock(code="ABCDE"))
+        live.next_question()
+        live.submit_answer(1, 11, "4")
+        live.submit_answer(2, 11, "4")
+        store.notify(live)
+        await asyncio.sleep(0.01)
+        assert len(written) == 1
+        await store.close()
+
+    async def test_failed_write_is_retried(self):
+        store, written = self._store()
+        live = make_live()
+        store.sessions[live.code] = live
+        live.next_question()
+        live.submit_answer(1, 11, "4")
+
+        store._write = MagicMock(side_effect=ConnectionError)
+        assert not await store.flush()
+        assert store.failed_flushes == 1
+        assert store.lag() > 0
+
+        store._write = written.append
+        assert await store.flush()
+        assert [a["participant_id"] for a in written[0][0]["answers"]] == [1]
+
+    async def test_committed_is_set_by_the_flush_that_writes_the_changes(self):
+        store, written = self._store(max_attempts=2)
+        live = make_live()
+        store.sessions[live.code] = live
+        live.next_question()
+        live.submit_answer(1, 11, "4")
+        first = live.committed()
+        assert live.committed() is first  # shared until the next flush
+
+        store._write = MagicMock(side_effect=ConnectionError)
+        await store.flush()
+        assert not first.done()  # restored, retried with the next flush
+        live.submit_answer(2, 11, "4")
+        second = live.committed()
+        assert second is not first
+
+        store._write = written.append
+        await store.flush()
+        assert first.result() is second.result() is True
+
+    async def test_committed_is_false_for_dead_lettered_changes(self):
+        store, written = self._store(max_attempts=1)
+        store._write = MagicMock(side_effect=ConnectionError)
+        live = make_live()
+        store.sessions[live.code] = live
+        live.next_question()
+        committed = live.committed()
+        with patch("app.live.state.logger"):
+            await store.flush()
+        assert committed.result() is False
+        assert "waiters" not in store.dead_letters[0]
+
+    async def test_end_flushes_and_forgets_the_session(self):
+        store, written = self._store()
+        store._end = MagicMock()
+        live = make_live()
+        store.sessions[live.code] = live
+        live.next_question()
+        live.submit_answer(1, 11, "4")
+
+        assert await store.end("ABCDE") is live
+        assert len(written) == 1
+        store._end.assert_called_once_with(7)
+        assert store.get("ABCDE") is None
+        assert await store.end("ABCDE") is None
+
+    async def test_failed_end_is_retried_by_the_background_writer(self):
+        store, written = self._store()
+        store._end = MagicMock(side_effect=[ConnectionError, None])
+        live = make_live()
+        store.sessions[live.code] = live
+        with patch("app.live.state.logger"):
+            assert await store.end("ABCDE") is live
+        assert live.ended and store.get("ABCDE") is live
+        assert store.metrics()["ending"] == 1
+        await store.evict("ABCDE")
+        assert store.get("ABCDE") is live  # not forgotten before its end is written
+
+        await store._finish_ended()
+        assert store._end.call_count == 2
+        assert store.get("ABCDE") is None and store.metrics()["ending"] == 0
+
+    async def test_evict_writes_the_session_before_forgetting_it(self):
+        store, written = self._store(interval=0)
+        live = make_live()
+        store.sessions[live.code] = live
+        live.next_question()
+
+        store._write = MagicMock(side_effect=[ConnectionError, None])
+        await store.evict("ABCDE")
+        assert store._write.call_count == 2
+        assert store._write.call_args.args[0][0]["started_at"] is not None
+        assert store.get("ABCDE") is None
@@ -0,0 +1,100 @@
+"""
+Tests for live/timers.py
+"""
+
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from app.live import TimingWheel
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    clock = Clock()
+    with patch("app.live.timers.time.monotonic", clock):
+        yield clock
+
+
+@pytest.mark.asyncio
+class TestTimingWheel:
+
+    async def test_timer_fires_on_the_first_tick_after_its_delay(self, clock):
+        wheel, fired = TimingWheel(tick=0.1), []
+        wheel.schedule(0.25, fired.append, "a")
+        clock.now += 0.2
+        wheel.advance()
+        assert fired == []
+        clock.now += 0.1
+        wheel.advance()
+        assert fired == ["a"]
+        assert len(wheel) == 0
+        await wheel.close()
+
+    async def test_timers_fire_in_deadline_order(self, clock):
+        wheel, fired = TimingWheel(tick=1, slots=4, levels=3), []
+        for delay in (30, 3, 17, 5, 64):
+            wheel.schedule(delay, fired.append, delay)
+        for _ in range(70):
+            clock.now += 1
+            wheel.advance()
+        assert fired == [3, 5, 17, 30, 64]
+        await wheel.close()
+
+    async def test_delay_beyond_the_top_wheel_is_placed_again(self, clock):
+        wheel, fired = TimingWheel(tick=1, slots=4, levels=2), []
+        wheel.schedule(40, fired.append, "late")  # the wheels only reach 16 ticks ahead
+        clock.now += 39
+        wheel.advance()
+        assert fired == []
+        clock.now += 1
+        wheel.advance()
+        assert fired == ["late"]
+        await wheel.close()
+
+    async def test_cancelled_timer_does_not_fire(self, clock):
+        wheel, fired = TimingWheel(tick=0.1), []
+        timer = wheel.schedule(1, fired.append, "a")
+        wheel.schedule(1, fired.append, "b")
+        timer.cancel()
+        assert len(wheel) == 1
+        clock.now += 2
+        wheel.advance()
+        assert fired == ["b"]
+        await wheel.close()
+
+    async def test_coroutine_callbacks_run_as_tasks(self, clock):
+        wheel, fired = TimingWheel(tick=0.1), []
+
+        async def callback(value):
+            fired.append(value)
+
+        wheel.schedule(0.1, callback, "a")
+        clock.now += 0.1
+        wheel.advance()
+        await asyncio.sleep(0)
+        assert fired == ["a"]
+        await wheel.close()
+
+    async def test_failing_callback_is_counted(self, clock):
+        wheel = TimingWheel(tick=0.1)
+        wheel.schedule(0.1, lambda: 1 / 0)
+        clock.now += 0.1
+        wheel.advance()
+        assert (wheel.fired, wheel.errors) == (1, 1)
+        await wheel.close()
+
+    async def test_background_ticks(self):
+        wheel, fired = TimingWheel(tick=0.01), asyncio.Event()
+        wheel.schedule(0.02, fired.set)
+        await asyncio.wait_for(fired.wait(), 1)
+        await wheel.close()
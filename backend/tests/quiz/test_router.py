@@ -0,0 +1,59 @@
+"""
+Tests for quiz/router.py  (FastAPI routes via TestClient)
+"""
+
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import db as database
+from app.auth import get_current_user
+
+
+@pytest.fixture
+def test_app():
+    """
+    A minimal app with the quiz router, logged in as user 1, whose crud calls
+    go to AsyncMocks instead of the database. Returns (app, fake_crud).
+    """
+    from app.quiz.router import router
+
+    app = FastAPI()
+    user = MagicMock()
+    user.id = 1
+    app.dependency_overrides[get_current_user] = lambda: user
+    app.dependency_overrides[database.get_async_db] = lambda: MagicMock()
+
+    fake_crud = MagicMock()
+    fake_crud.get_quiz_by_id = AsyncMock(return_value=MagicMock(creator_id=1))
+    fake_crud.get_questions_by_quiz = AsyncMock(return_value=[{"id": 3, "correct_answer": "4"}])
+    with patch.object(database, "async_crud", fake_crud):
+        app.include_router(router, prefix="/quizzes")
+        yield app, fake_crud
+
+
+class TestGetQuestionsRoute:
+
+    def test_creator_gets_the_questions(self, test_app):
+        app, _ = test_app
+        response = TestClient(app).get("/quizzes/7/questions")
+        assert response.status_code == 200
+        assert response.json() == [{"id": 3, "correct_answer": "4"}]
+
+    def test_other_users_cannot_read_the_answers(self, test_app):
+        app, fake_crud = test_app
+        fake_crud.get_quiz_by_id.return_value = MagicMock(creator_id=2)
+        assert TestClient(app).get("/quizzes/7/questions").status_code == 403
+        fake_crud.get_questions_by_quiz.assert_not_called()
+
+    def test_requires_a_login(self, test_app):
+        app, _ = test_app
+        del app.dependency_overrides[get_current_user]
+        assert TestClient(app).get("/quizzes/7/questions").status_code == 401
+
+    def test_unknown_quiz(self, test_app):
+        app, fake_crud = test_app
+        fake_crud.get_quiz_by_id.return_value = None
+        assert TestClient(app).get("/quizzes/7/questions").status_code == 404
@@ -0,0 +1,17 @@
+"""
+Smoke test for benchmarks/load_test.py, so the harness keeps up with the endpoint it drives
+"""
+
+import pytest
+
+from app.live.encoding import JSON
+from benchmarks.load_test import LoadTest
+
+
+@pytest.mark.asyncio
+async def test_load_test_runs_a_small_quiz():
+    run = LoadTest(participants=5, questions=2, think=0, encoding=JSON, timeout=5)
+    result = await run.run()
+    assert len(run.join_latencies) == 5
+    assert len(run.fanout_latencies) == len(run.ack_latencies) == 10
+    assert result["rows"] == 10
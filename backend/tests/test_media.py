@@ -0,0 +1,107 @@
+"""
+Tests for media.py
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.media import CachedStaticFiles, MediaCache, parse_range
+
+
+def make_client(tmp_path, **cache_args) -> tuple[TestClient, CachedStaticFiles]:
+    files = CachedStaticFiles(directory=tmp_path, cache=MediaCache(**cache_args))
+    app = FastAPI()
+    app.mount("/media", files, name="media")
+    return TestClient(app), files
+
+
+class TestParseRange:
+
+    def test_ranges(self):
+        assert parse_range("bytes=0-", 10) == (0, 9)
+        assert parse_range("bytes=2-4", 10) == (2, 4)
+        assert parse_range("bytes=5-100", 10) == (5, 9)
+        assert parse_range("bytes=-3", 10) == (7, 9)
+
+    def test_unsupported(self):
+        assert parse_range("bytes=0-1,4-5", 10) is None
+        assert parse_range("items=0-1", 10) is None
+        assert parse_range("bytes=20-", 10) is None
+
+
+class TestMediaCache:
+
+    def test_evicts_least_recently_used(self, tmp_path):
+        cache = MediaCache(max_bytes=10)
+        paths = []
+        for name in "abc":
+            path = tmp_path / name
+            path.write_bytes(b"x" * 4)
+            paths.append(str(path))
+        cache.load(paths[0])
+        cache.load(paths[1])
+        assert cache.get(paths[0], os.stat(paths[0])) is not None
+        cache.load(paths[2])
+        assert len(cache) == 2 and cache.size == 8 and cache.evictions == 1
+        assert cache.get(paths[1], os.stat(paths[1])) is None
+
+    def test_large_files_are_not_cached(self, tmp_path):
+        path = tmp_path / "big"
+        path.write_bytes(b"x" * 11)
+        assert MediaCache(max_file_bytes=10).load(str(path)) is None
+
+    def test_changed_file_is_a_miss(self, tmp_path):
+        cache, path = MediaCache(), tmp_path / "a"
+        path.write_bytes(b"one")
+        cache.load(str(path))
+        path.write_bytes(b"three")
+        assert cache.get(str(path), os.stat(path)) is None
+
+    def test_threads_keep_the_size_consistent(self, tmp_path):
+        cache, paths = MediaCache(max_bytes=40), []
+        for n in range(20):
+            path = tmp_path / str(n)
+            path.write_bytes(b"x" * (n % 7 + 1))
+            paths.append(str(path))
+
+        def churn(offset):
+            for path in paths[offset:] + paths[:offset]:
+                cache.load(path)
+                cache.get(path, os.stat(path))
+                cache.discard(paths[(offset * 3) % len(paths)])
+
+        with ThreadPoolExecutor(8) as pool:
+            list(pool.map(churn, range(0, 20, 2)))
+        assert cache.size == sum(len(cached.data) for cached in cache._files.values()) <= 40
+
+
+class TestCachedStaticFiles:
+
+    def test_warmed_file_is_served_from_memory(self, tmp_path):
+        (tmp_path / "cat.png").write_bytes(b"meow")
+        client, files = make_client(tmp_path)
+        plain = client.get("/media/cat.png")
+        assert files.warm("http://localhost:8000/media/cat.png")
+        cached = client.get("/media/cat.png")
+        assert cached.content == b"meow" and files.cache.hits == 1
+        for header in ("content-type", "content-length", "etag", "last-modified"):
+            assert cached.headers[header] == plain.headers[header]
+
+    def test_conditional_and_range_requests(self, tmp_path):
+        (tmp_path / "song.mp3").write_bytes(b"0123456789")
+        client, files = make_client(tmp_path)
+        files.warm("/media/song.mp3")
+        etag = client.get("/media/song.mp3").headers["etag"]
+        assert client.get("/media/song.mp3", headers={"if-none-match": etag}).status_code == 304
+        partial = client.get("/media/song.mp3", headers={"range": "bytes=2-4"})
+        assert partial.status_code == 206 and partial.content == b"234"
+        assert partial.headers["content-range"] == "bytes 2-4/10"
+
+    def test_only_local_media_is_warmed(self, tmp_path):
+        _, files = make_client(tmp_path)
+        assert not files.warm("https://www.youtube.com/watch?v=abc")
+        assert not files.warm("/media/missing.png")
+        assert not files.warm("/media/../secret")
@@ -0,0 +1,865 @@
+"""
+Tests for websocket_handler.py  (ConnectionManager)
+"""
+
+import asyncio
+import threading
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import msgpack
+import pytest
+from fastapi import FastAPI, WebSocketDisconnect
+from fastapi.testclient import TestClient
+
+from app import db as database
+from app import websocket_handler
+from app.auth import get_current_user
+from app.live import FanOut, LiveSession, LiveSessionStore, ShardMap, TimingWheel
+from app.live.encoding import Preencoded
+from app.live.records import SessionConnections
+from app.live.state import LiveQuestion
+from app.websocket_handler import ConnectionManager, CLOSE_GONE, CLOSE_NOT_FOUND, CLOSE_REDIRECT
+from .live.conftest import FakeWebSocket
+
+
+def events(ws: FakeWebSocket) -> list[dict]:
+    """Messages sent to ws, without their sequence numbers"""
+    return [{k: v for k, v in m.items() if k != "seq"} for m in ws.sent]
+
+
+async def drain(manager: ConnectionManager):
+    await asyncio.gather(*(outbox.join() for outbox in manager.fanout.outboxes.values()))
+
+
+@pytest.mark.asyncio
+class TestConnectionManager:
+
+    async def test_participant_join_notifies_host(self):
+        manager = ConnectionManager()
+        host    = FakeWebSocket()
+        await manager.connect_host("ABCDE", host)
+        await manager.connect_participant("ABCDE", "1", FakeWebSocket())
+        await drain(manager)
+        assert events(host) == [{"type": "participant_joined", "participant_id": "1"}]
+
+    async def test_join_burst_reaches_host_in_one_frame(self):
+        manager = ConnectionManager()
+        host    = FakeWebSocket()
+        await manager.connect_host("ABCDE", host)
+        for pid in range(20):
+            await manager.connect_participant("ABCDE", str(pid), FakeWebSocket())
+        await drain(manager)
+        assert [m["participant_id"] for m in events(host)] == [str(pid) for pid in range(20)]
+        assert host.frames == 1
+
+    async def test_answer_burst_reaches_host_in_full(self):
+        manager = ConnectionManager()
+        host    = FakeWebSocket()
+        await manager.connect_host("ABCDE", host)
+        await manager.send_to_host("ABCDE", {"type": "question_start"})
+        for pid in range(300):
+            await manager.send_to_host("ABCDE", {"type": "answer_submitted", "participant_id": str(pid)})
+            await manager.send_to_host("ABCDE", {"type": "answer_count", "count": pid + 1})
+        await drain(manager)
+        received = events(host)
+        assert received[0] == {"type": "question_start"}
+        assert len([m for m in received if m["type"] == "answer_submitted"]) == 300
+        assert {"type": "answer_count", "count": 300} in received
+
+    async def test_overflowing_outbox_is_reaped(self):
+        manager = ConnectionManager()
+        manager.fanout.outbox_options["maxsize"] = 2
+        player  = FakeWebSocket(delay=1.0)
+        await manager.connect_participant("ABCDE", "1", player)
+        for n in range(4):
+            await manager.broadcast_to_participants("ABCDE", {"type": "question_start", "n": n})
+        assert player.closed_with == CLOSE_GONE  # resumes from the replay buffer when it reconnects
+        assert manager.reaped["ABCDE"] == 1
+        assert "1" not in manager.sessions["ABCDE"].participants
+
+    async def test_broadcast_to_participants_skips_host(self):
+        manager = ConnectionManager()
+        host, p1, p2 = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+        await manager.connect_host("ABCDE", host)
+        await manager.connect_participant("ABCDE", "1", p1)
+        await manager.connect_participant("ABCDE", "2", p2)
+        await manager.broadcast_to_participants("ABCDE", {"type": "question_start"})
+        await drain(manager)
+        assert events(p1) == events(p2) == [{"type": "question_start"}]
+        assert {"type": "question_start"} not in events(host)
+
+    async def test_broadcast_to_all(self):
+        manager = ConnectionManager()
+        host, p1 = FakeWebSocket(), FakeWebSocket()
+        await manager.connect_host("ABCDE", host)
+        await manager.connect_participant("ABCDE", "1", p1)
+        await manager.broadcast_to_all("ABCDE", {"type": "session_ended"})
+        await drain(manager)
+        assert events(host)[-1] == events(p1)[-1] == {"type": "session_ended"}
+
+    async def test_send_to_unknown_session_is_ignored(self):
+        manager = ConnectionManager()
+        await manager.send_to_host("XXXXX", {"type": "ping"})
+        await manager.broadcast_to_all("XXXXX", {"type": "ping"})
+
+    async def test_host_disconnect_keeps_participants(self):
+        manager = ConnectionManager()
+        host, player = FakeWebSocket(), FakeWebSocket()
+        await manager.connect_host("ABCDE", host)
+        await manager.connect_participant("ABCDE", "1", player)
+        manager.disconnect("ABCDE")
+        assert manager.sessions["ABCDE"].host is None
+        assert manager.sessions["ABCDE"].participants == {"1": player}
+        assert list(manager.fanout.outboxes) == [player]
+
+    async def test_session_metrics(self):
+        manager = ConnectionManager()
+        await manager.connect_host("ABCDE", FakeWebSocket())
+        await manager.connect_participant("ABCDE", "1", FakeWebSocket(delay=1.0))
+        for n in range(3):
+            await manager.broadcast_to_all("ABCDE", {"type": "leaderboard_update", "n": n})
+        await manager.actors.tell("ABCDE", asyncio.sleep, 0)
+        await manager.actors.join("ABCDE")
+        metrics = manager.session_metrics("ABCDE")
+        assert metrics["connections"] == 2
+        assert metrics["coalesced"] >= 2
+        assert metrics["actor"]["processed"] == 1
+        assert manager.session_metrics("XXXXX") == {}
+        manager.disconnect("ABCDE")
+        await manager.actors.close()
+
+
+@pytest.mark.asyncio
+class TestSessionLifetime:
+
+    async def test_end_closes_the_connections_after_what_is_queued(self):
+        manager = ConnectionManager()
+        player  = FakeWebSocket(delay=0.01)
+        await manager.connect_participant("ABCDE", "1", player)
+        manager.allow(player, "submit_answer")
+        await manager.broadcast_to_all("ABCDE", {"type": "session_ended"})
+        await manager.end("ABCDE")
+        assert events(player) == [{"type": "session_ended"}]
+        assert player.closed_with == 1000
+        assert (manager.sessions, manager.replays, manager.connections, manager.limiters) == ({}, {}, {}, {})
+        assert manager.fanout.outboxes == {}
+
+    async def test_abandoned_session_expires(self):
+        written = []
+        store   = live_store(written)
+        manager = ConnectionManager(store=store, session_expiry=0)
+        open_question(store).submit_answer(5, 3, "4")
+        player  = FakeWebSocket()
+        await manager.connect_participant("ABCDE", "5", player)
+        await manager.expire_abandoned()
+        assert store.get("ABCDE") is not None  # still connected
+
+        manager.disconnect("ABCDE", "5", player)
+        await manager.expire_abandoned()
+        assert store.get("ABCDE") is None and len(written) == 1  # written before it is forgotten
+        assert (manager.sessions, manager.replays, manager.empty_since) == ({}, {}, {})
+
+
+@pytest.mark.asyncio
+class TestReaper:
+
+    async def test_silent_connection_is_reaped(self):
+        manager = ConnectionManager(idle_timeout=0.02)
+        host, quiet, chatty = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+        await manager.connect_host("ABCDE", host)
+        await manager.connect_participant("ABCDE", "1", quiet)
+        await manager.connect_participant("ABCDE", "2", chatty)
+        await asyncio.sleep(0.03)
+        manager.touch(host)
+        manager.touch(chatty)
+
+        await manager.heartbeat()
+        await drain(manager)
+        assert quiet.closed_with == CLOSE_GONE
+        assert "1" not in manager.sessions["ABCDE"].participants
+        assert events(chatty)[-1] == {"type": "ping"}
+        metrics = manager.session_metrics("ABCDE")
+        assert (metrics["live"], metrics["reaped"]) == (2, 1)
+
+    async def test_repeatedly_failing_connection_is_reaped(self):
+        manager = ConnectionManager()
+        manager.fanout = FanOut(max_failures=2)
+        broken  = FakeWebSocket(fail=True)
+        await manager.connect_participant("ABCDE", "1", broken)
+        for _ in range(3):
+            await manager.broadcast_to_participants("ABCDE", {"type": "question_start"})
+            await drain(manager)
+        assert manager.sessions["ABCDE"].participants == {}
+        assert broken not in manager.connections
+        assert manager.reaped["ABCDE"] == 1
+
+    async def test_reaped_host_keeps_session_alive(self):
+        manager = ConnectionManager(idle_timeout=0)
+        host, player = FakeWebSocket(), FakeWebSocket()
+        await manager.connect_host("ABCDE", host)
+        await manager.connect_participant("ABCDE", "1", player)
+        await manager.reap(host)
+
+        # the receive loop of the reaped host ends later, after the host reconnected
+        new_host = FakeWebSocket()
+        await manager.connect_host("ABCDE", new_host)
+        manager.disconnect("ABCDE", websocket=host)
+        assert manager.sessions["ABCDE"].host is new_host
+        assert "1" in manager.sessions["ABCDE"].participants
+
+    async def test_heartbeat_runs_after_start(self):
+        manager = ConnectionManager(heartbeat_interval=0.01)
+        player  = FakeWebSocket()
+        await manager.connect_participant("ABCDE", "1", player)
+        await manager.start()
+        await asyncio.sleep(0.05)
+        await manager.close()
+        assert {"type": "ping"} in events(player)
+
+
+@pytest.mark.asyncio
+class TestResume:
+
+    async def test_events_carry_sequence_numbers(self):
+        manager = ConnectionManager()
+        player  = FakeWebSocket()
+        await manager.connect_participant("ABCDE", "1", player)
+        for _ in range(3):
+            await manager.broadcast_to_participants("ABCDE", {"type": "question_start"})
+        await drain(manager)
+        assert [m["seq"] for m in player.sent] == [2, 3, 4]  # 1 was the join notice to the host
+        assert manager.seq("ABCDE") == 4
+
+    async def test_reconnect_gets_only_missed_events(self):
+        manager = ConnectionManager()
+        old, other = FakeWebSocket(), FakeWebSocket()
+        await manager.connect_participant("ABCDE", "1", old)
+        await manager.connect_participant("ABCDE", "2", other)
+        await manager.broadcast_to_participants("ABCDE", {"type": "question_start", "n": 1})
+        manager.disconnect("ABCDE", "1", old)
+
+        await manager.broadcast_to_participants("ABCDE", {"type": "question_start", "n": 2})
+        await manager.send_to_participant("ABCDE", "2", {"type": "answer_received"})
+        await manager.send_to_participant("ABCDE", "1", {"type": "answer_received"})
+
+        new = FakeWebSocket()
+        await manager.connect_participant("ABCDE", "1", new, notify=False)
+        assert await manager.resume("ABCDE", new, last_seq=3, participant_id="1")
+        await drain(manager)
+        assert events(new) == [{"type": "question_start", "n": 2}, {"type": "answer_received"}]
+
+    async def test_replay_is_not_available_after_session_end(self):
+        manager = ConnectionManager()
+        await manager.connect_participant("ABCDE", "1", FakeWebSocket())
+        await manager.end("ABCDE")
+        assert not await manager.resume("ABCDE", FakeWebSocket(), last_seq=0, participant_id="1")
+
+    async def test_snapshot(self):
+        store = live_store([])
+        live  = store.get("ABCDE")
+        live.next_question()
+        live.question = {"id": 3, "content": "2 + 2?"}
+        live.submit_answer(5, 3, "4")
+        with patch.object(websocket_handler, "manager", ConnectionManager()):
+            message = websocket_handler.snapshot(live, "5")
+            host    = websocket_handler.snapshot(live)
+        assert message["question"] == {"id": 3, "content": "2 + 2?"}
+        assert (message["rank"], message["total_score"], message["answered"]) == (1, 10, True)
+        assert host["answer_count"] == 1 and "rank" not in host
+
+
+class TestResumeEndpoint:
+
+    @pytest.fixture
+    def client(self):
+        app = FastAPI()
+        fake_db = MagicMock()
+        fake_db.database.SessionLocal.return_value = fake_db
+        fake_db.get_session_by_code.return_value = MagicMock(id=7, code="RSUME")
+        fake_db.create_participant.return_value = MagicMock(id=42)
+        fake_db.create_participant.return_value.name = "Bob"
+        app.include_router(websocket_handler.router, prefix="/ws")
+        store = MagicMock()
+        store.open = AsyncMock(return_value=LiveSession(7, "RSUME", []))
+        with patch("app.websocket_handler.database", fake_db), \
+                patch.object(websocket_handler, "store", store), \
+                patch.object(websocket_handler, "manager", ConnectionManager()):
+            yield TestClient(app), fake_db
+
+    def test_resume_token_reconnects_the_same_participant(self, client):
+        test_client, fake_db = client
+        with test_client.websocket_connect("/ws/session/RSUME?name=Bob") as ws:
+            welcome = ws.receive_json()
+
+        asyncio.run(websocket_handler.manager.broadcast_to_participants("RSUME", {"type": "question_start"}))
+        url = f"/ws/session/RSUME?resume={welcome['resume_token']}&last_seq={welcome['seq']}"
+        with test_client.websocket_connect(url) as ws:
+            again  = ws.receive_json()
+            missed = ws.receive_json()
+
+        assert fake_db.create_participant.call_count == 1
+        assert again["participant_id"] == "42" and "seq" not in again
+        assert again["resume_token"] != welcome["resume_token"]
+        assert missed == [{"type": "question_start", "seq": welcome["seq"] + 1}]  # replayed as one array frame
+
+    def test_unknown_gap_gets_snapshot(self, client):
+        test_client, fake_db = client
+        with test_client.websocket_connect("/ws/session/RSUME?name=Bob") as ws:
+            welcome = ws.receive_json()
+        with test_client.websocket_connect(f"/ws/session/RSUME?resume={welcome['resume_token']}&last_seq=999") as ws:
+            ws.receive_json()
+            snapshot = ws.receive_json()
+        assert snapshot["type"] == "snapshot"
+        assert snapshot["total_score"] == 0
+
+    def test_invalid_token_registers_a_new_participant(self, client):
+        test_client, fake_db = client
+        with test_client.websocket_connect("/ws/session/RSUME?name=Bob&resume=nope&last_seq=3") as ws:
+            assert "seq" in ws.receive_json()
+        fake_db.create_participant.assert_called_once()
+
+
+@pytest.mark.asyncio
+class TestRateLimit:
+
+    async def test_messages_over_budget_are_dropped_and_counted(self):
+        manager = ConnectionManager()
+        player  = FakeWebSocket()
+        await manager.connect_participant("ABCDE", "1", player)
+        allowed = [manager.allow(player, "submit_answer") for _ in range(10)]
+        assert allowed.count(True) < 10 and allowed[0]
+        manager.allow(player, "made_up")
+        assert manager.session_metrics("ABCDE")["rate_limited"] == {"submit_answer": allowed.count(False)}
+
+    async def test_unknown_connection_is_not_limited(self):
+        manager = ConnectionManager()
+        assert all(manager.allow(FakeWebSocket(), "submit_answer") for _ in range(100))
+        assert manager.limiters == {}
+
+    async def test_limiter_is_dropped_on_disconnect(self):
+        manager = ConnectionManager()
+        player  = FakeWebSocket()
+        await manager.connect_participant("ABCDE", "1", player)
+        assert manager.limiters == {}  # only created with the first message
+        manager.allow(player, "submit_answer")
+        assert player in manager.limiters
+        manager.disconnect("ABCDE", "1", player)
+        assert manager.limiters == {}
+
+
+class TestRateLimitEndpoint:
+
+    def test_spammed_answers_never_reach_the_handler(self):
+        app = FastAPI()
+        fake_db = MagicMock()
+        fake_db.database.SessionLocal.return_value = fake_db
+        fake_db.get_session_by_code.return_value = MagicMock(id=7, code="SPAMS")
+        fake_db.create_participant.return_value = MagicMock(id=42)
+        app.include_router(websocket_handler.router, prefix="/ws")
+        store, handler = MagicMock(), AsyncMock()
+        store.open = AsyncMock(return_value=LiveSession(7, "SPAMS", []))
+        with patch("app.websocket_handler.database", fake_db), \
+                patch.object(websocket_handler, "store", store), \
+                patch.object(websocket_handler, "manager", ConnectionManager()), \
+                patch.object(websocket_handler, "handle_participant_message", handler):
+            with TestClient(app).websocket_connect("/ws/session/SPAMS?name=Bob") as ws:
+                ws.receive_json()
+                for _ in range(50):
+                    ws.send_json({"type": "submit_answer", "question_id": 1, "answer": "4"})
+            dropped = websocket_handler.manager.rate_limited["SPAMS"]["submit_answer"]
+        assert dropped >= 44  # bursts of 4 and 2 more per second
+        assert handler.await_count <= 50 - dropped
+
+
+@pytest.mark.asyncio
+class TestHandoff:
+
+    async def test_rebalance_redirects_moved_sessions(self):
+        workers = ["ws://w1:8001", "ws://w2:8002"]
+        written = []
+        store   = LiveSessionStore(session_factory=MagicMock)
+        store._write = written.append
+        manager = ConnectionManager(shards=ShardMap(workers, workers[0]), store=store)
+        code    = next(c for c in (f"C{n:04d}" for n in range(100)) if manager.shards.is_local(c))
+        live    = store.sessions[code] = LiveSession(7, code, [LiveQuestion(3, 0, "4", 10, 30)])
+        live.next_question()
+        host, player = FakeWebSocket(), FakeWebSocket()
+        await manager.connect_host(code, host)
+        await manager.connect_participant(code, "1", player)
+        await drain(manager)
+
+        await manager.rebalance(workers[1:])
+
+        # the new owner loads the session from the database, with everything written
+        assert written[0][0]["started_at"] is not None and store.get(code) is None
+        assert code not in manager.sessions
+        assert events(player)[-1] == {"type": "redirect", "url": workers[1]}
+        assert player.closed_with == CLOSE_REDIRECT
+        assert host.closed_with == CLOSE_REDIRECT
+
+    async def test_reload_shards_hands_off_sessions_without_connections(self, tmp_path):
+        workers = ["ws://w1:8001", "ws://w2:8002"]
+        written = []
+        store   = LiveSessionStore(session_factory=MagicMock)
+        store._write = written.append
+        manager = ConnectionManager(shards=ShardMap(workers, workers[0]), store=store)
+        code    = next(c for c in (f"C{n:04d}" for n in range(100)) if manager.shards.is_local(c))
+        live    = store.sessions[code] = LiveSession(7, code, [LiveQuestion(3, 0, "4", 10, 30)])
+        live.next_question()
+        path = tmp_path / "workers"
+        path.write_text(workers[1])
+
+        with patch.object(websocket_handler, "manager", manager):
+            await websocket_handler.reload_shards(str(path))
+
+        assert manager.shards.workers == workers[1:]
+        assert store.get(code) is None and written
+
+    async def test_reload_shards_keeps_the_workers_when_the_file_is_unreadable(self, tmp_path):
+        manager = ConnectionManager(shards=ShardMap(["ws://w1:8001"], "ws://w1:8001"))
+        with patch.object(websocket_handler, "manager", manager), patch.object(websocket_handler, "logger"):
+            await websocket_handler.reload_shards(str(tmp_path / "missing"))
+        assert manager.shards.workers == ["ws://w1:8001"]
+
+
+class TestWebsocketEndpoint:
+
+    @pytest.fixture
+    def client(self):
+        app = FastAPI()
+        fake_db = MagicMock()
+        fake_db.database.SessionLocal.return_value = fake_db
+        app.include_router(websocket_handler.router, prefix="/ws")
+        store = MagicMock()
+        store.open = AsyncMock(return_value=LiveSession(7, "ABCDE", []))
+        with patch("app.websocket_handler.database", fake_db), patch.object(websocket_handler, "store", store):
+            yield TestClient(app), fake_db
+
+    def test_redirects_to_owning_worker(self, client):
+        test_client, fake_db = client
+        workers = ["ws://w1:8001", "ws://w2:8002"]
+        shards  = ShardMap(workers, workers[0])
+        code    = next(c for c in (f"C{n:04d}" for n in range(100)) if not shards.is_local(c))
+        with patch.object(websocket_handler.manager, "shards", shards):
+            with test_client.websocket_connect(f"/ws/session/{code}?name=Bob") as ws:
+                assert ws.receive_json() == {"type": "redirect", "url": workers[1]}
+                with pytest.raises(WebSocketDisconnect) as exc:
+                    ws.receive_json()
+        assert exc.value.code == CLOSE_REDIRECT
+        fake_db.get_session_by_code.assert_not_called()
+
+    def test_msgpack_is_negotiated_through_subprotocol(self, client):
+        test_client, fake_db = client
+        workers = ["ws://w1:8001", "ws://w2:8002"]
+        shards  = ShardMap(workers, workers[0])
+        code    = next(c for c in (f"C{n:04d}" for n in range(100)) if not shards.is_local(c))
+        with patch.object(websocket_handler.manager, "shards", shards):
+            with test_client.websocket_connect(f"/ws/session/{code}", subprotocols=["quiz.msgpack"]) as ws:
+                assert ws.accepted_subprotocol == "quiz.msgpack"
+                assert msgpack.unpackb(ws.receive_bytes()) == {"type": "redirect", "url": workers[1]}
+
+    def test_participant_messages_may_be_msgpack(self, client):
+        test_client, fake_db = client
+        fake_db.get_session_by_code.return_value = MagicMock(id=7)
+        fake_db.create_participant.return_value = MagicMock(id=42)
+        with patch.object(websocket_handler, "handle_participant_message", AsyncMock()) as handle:
+            with test_client.websocket_connect("/ws/session/ABCDE?name=Bob&encoding=msgpack") as ws:
+                ws.send_bytes(msgpack.packb({"type": "submit_answer", "answer": "4"}))
+                ws.send_text('{"type": "submit_answer", "answer": "5"}')
+        assert [c.args[2]["answer"] for c in handle.await_args_list] == ["4", "5"]
+
+    def test_malformed_messages_get_an_error(self, client):
+        test_client, fake_db = client
+        fake_db.get_session_by_code.return_value = MagicMock(id=7)
+        fake_db.create_participant.return_value = MagicMock(id=42)
+        with patch.object(websocket_handler, "handle_participant_message", AsyncMock()) as handle:
+            with test_client.websocket_connect("/ws/session/ABCDE?name=Bob") as ws:
+                ws.receive_json()
+                for frame in ("{not json", '["submit_answer"]'):
+                    ws.send_text(frame)
+                    assert ws.receive_json() == {"type": "error", "message": "Invalid message"}
+                ws.send_bytes(b"\xc1")
+                assert ws.receive_json() == {"type": "error", "message": "Invalid message"}
+                ws.send_json({"type": "submit_answer", "answer": "4"})
+        assert [c.args[2]["answer"] for c in handle.await_args_list] == ["4"]
+
+    def test_unknown_session_is_closed(self, client):
+        test_client, fake_db = client
+        fake_db.get_session_by_code.return_value = None
+        with pytest.raises(WebSocketDisconnect) as exc:
+            with test_client.websocket_connect("/ws/session/XXXXX?name=Bob") as ws:
+                ws.receive_json()
+        assert exc.value.code == CLOSE_NOT_FOUND
+
+    def test_participant_is_registered_and_joins(self, client):
+        test_client, fake_db = client
+        fake_db.get_session_by_code.return_value = MagicMock(id=7)
+        fake_db.create_participant.return_value = MagicMock(id=42)
+        fake_db.create_participant.return_value.name = "Bob"
+        with test_client.websocket_connect("/ws/session/ABCDE?name=Bob") as ws:
+            welcome = ws.receive_json()
+            assert "42" in websocket_handler.manager.sessions["ABCDE"].participants
+            fake_db.close.assert_called_once()  # not held while the socket is open
+        fake_db.create_participant.assert_called_once_with(fake_db, session_id=7, name="Bob")
+        assert websocket_handler.store.open.return_value.participants[42].name == "Bob"
+        assert welcome["type"] == "welcome" and welcome["participant_id"] == "42"
+        assert "ABCDE" not in websocket_handler.manager.sessions or \
+            "42" not in websocket_handler.manager.sessions["ABCDE"].participants
+
+    def test_database_is_queried_off_the_event_loop(self, client):
+        test_client, fake_db = client
+        threads = {}
+
+        def on_thread(name, result=None):
+            def call(*args, **kwargs):
+                threads[name] = threading.get_ident()
+                return result
+            return call
+
+        fake_db.get_session_by_code.side_effect = on_thread("query", MagicMock(id=7))
+        fake_db.create_participant.side_effect = on_thread("insert", MagicMock(id=42))
+        fake_db.commit.side_effect = on_thread("commit")
+        store = websocket_handler.store
+        store.open.side_effect = on_thread("loop", store.open.return_value)
+        with test_client.websocket_connect("/ws/session/ABCDE?name=Bob") as ws:
+            ws.receive_json()
+        loop = threads.pop("loop")
+        assert len(threads) == 3 and loop not in threads.values()
+
+
+class TestMetrics:
+
+    @pytest.fixture
+    def client(self):
+        app = FastAPI()
+        user = MagicMock()
+        user.id = 1
+        app.dependency_overrides[get_current_user] = lambda: user
+        app.dependency_overrides[database.get_async_db] = lambda: MagicMock()
+        app.include_router(websocket_handler.router, prefix="/ws")
+        fake_crud = MagicMock()
+        fake_crud.get_session_by_code = AsyncMock(return_value=MagicMock(host_id=1))
+        manager = ConnectionManager()
+        manager.sessions["ABCDE"] = SessionConnections()
+        with patch.object(database, "async_crud", fake_crud), patch.object(websocket_handler, "manager", manager):
+            yield TestClient(app), fake_crud
+
+    def test_host_gets_the_session_metrics(self, client):
+        test_client, _ = client
+        response = test_client.get("/ws/session/ABCDE/metrics")
+        assert response.status_code == 200
+        assert response.json()["live"] == 0 and "actor" in response.json()
+
+    def test_only_the_host_gets_them(self, client):
+        test_client, fake_crud = client
+        fake_crud.get_session_by_code.return_value = MagicMock(host_id=2)
+        assert test_client.get("/ws/session/ABCDE/metrics").status_code == 403
+        fake_crud.get_session_by_code.return_value = None
+        assert test_client.get("/ws/session/ABCDE/metrics").status_code == 404
+
+    def test_worker_metrics_are_logged(self):
+        with patch.object(websocket_handler, "logger") as logger:
+            async def run():
+                task = asyncio.create_task(websocket_handler.log_metrics(0.01))
+                await asyncio.sleep(0.05)
+                task.cancel()
+            asyncio.run(run())
+        metrics = logger.info.call_args.args[1]
+        assert {"sessions", "queue_depth", "store", "timers", "media"} <= set(metrics)
+
+
+def live_store(written: list) -> LiveSessionStore:
+    """A store holding session ABCDE with participant 5 and question 3 (answer "4", 10 points)"""
+    store = LiveSessionStore(session_factory=MagicMock)
+    store._write = written.append
+    store._end = MagicMock()
+    live = LiveSession(7, "ABCDE", [LiveQuestion(3, 0, "4", 10, 30)])
+    live.add_participant(5, "Bob")
+    store.sessions["ABCDE"] = live
+    return store
+
+
+def open_question(store: LiveSessionStore) -> LiveSession:
+    """Start session ABCDE of a live_store at question 3, without its timer"""
+    live = store.get("ABCDE")
+    live.next_question()
+    return live
+
+
+@pytest.mark.asyncio
+class TestHandleParticipantMessage:
+
+    async def _connect(self, manager):
+        host, player = FakeWebSocket(), FakeWebSocket()
+        await manager.connect_host("ABCDE", host)
+        await manager.connect_participant("ABCDE", "5", player)
+        return host, player
+
+    async def test_answer_is_graded_in_memory_and_acknowledged_once_committed(self):
+        manager, written, timers = ConnectionManager(), [], TimingWheel(tick=0.01)
+        store = live_store(written)
+        open_question(store)
+        with patch.object(websocket_handler, "manager", manager), \
+                patch.object(websocket_handler, "store", store), \
+                patch.object(websocket_handler, "timers", timers):
+            host, player = await self._connect(manager)
+            await websocket_handler.handle_participant_message(
+                "ABCDE", "5", {"type": "submit_answer", "question_id": 3, "answer": "4"}
+            )
+            await asyncio.sleep(0.03)
+            await drain(manager)
+            assert events(player) == [] and written == []  # persisted later, by the write-behind loop
+            assert events(host)[-2:] == [
+                {"type": "answer_submitted", "participant_id": "5", "question_id": 3},
+                {"type": "answer_count", "question_id": 3, "count": 1},
+            ]
+
+            await store.flush()
+            await asyncio.sleep(0.01)
+            await drain(manager)
+            await timers.close()
+        assert events(player) == [{"type": "answer_received", "question_id": 3}]
+        assert len(written) == 1
+        assert store.get("ABCDE").scores[5] == 10
+
+    async def test_answer_that_cannot_be_written_is_not_acknowledged(self):
+        manager, written, timers = ConnectionManager(), [], TimingWheel(tick=0.01)
+        store = live_store(written)
+        store.max_attempts = 1
+        store._write = MagicMock(side_effect=ConnectionError)
+        open_question(store)
+        with patch.object(websocket_handler, "manager", manager), \
+                patch.object(websocket_handler, "store", store), \
+                patch.object(websocket_handler, "timers", timers):
+            host, player = await self._connect(manager)
+            await websocket_handler.handle_participant_message(
+                "ABCDE", "5", {"type": "submit_answer", "question_id": 3, "answer": "4"}
+            )
+            with patch("app.live.state.logger"):
+                await store.flush()
+            await asyncio.sleep(0.03)
+            await drain(manager)
+            await timers.close()
+        assert events(player) == [{"type": "error", "message": "Answer could not be saved"}]
+
+    async def test_second_answer_is_rejected(self):
+        manager, written, timers = ConnectionManager(), [], TimingWheel(tick=0.01)
+        store = live_store(written)
+        open_question(store)
+        with patch.object(websocket_handler, "manager", manager), \
+                patch.object(websocket_handler, "store", store), \
+                patch.object(websocket_handler, "timers", timers):
+            host, player = await self._connect(manager)
+            for answer in ("4", "5"):
+                await websocket_handler.handle_participant_message(
+                    "ABCDE", "5", {"type": "submit_answer", "question_id": 3, "answer": answer}
+                )
+            await drain(manager)
+            await timers.close()
+        assert events(player) == [{"type": "answer_rejected", "question_id": 3}]
+        assert store.get("ABCDE").scores[5] == 10
+
+    async def test_failing_handler_rejects_the_answer(self):
+        manager = ConnectionManager()
+        store   = MagicMock()
+        store.get.side_effect = RuntimeError("boom")
+        with patch.object(websocket_handler, "manager", manager), patch.object(websocket_handler, "store", store):
+            host, player = await self._connect(manager)
+            await manager.actors.tell("ABCDE", websocket_handler.handle_participant_message,
+                                      "ABCDE", "5", {"type": "submit_answer", "question_id": 3, "answer": "4"})
+            await manager.actors.join("ABCDE")
+            await drain(manager)
+            assert manager.session_metrics("ABCDE")["actor"]["errors"] == 1
+            await manager.actors.close()
+        assert events(player) == [{"type": "answer_rejected", "question_id": 3}]
+
+    async def test_answer_to_unknown_session_is_rejected(self):
+        manager = ConnectionManager()
+        with patch.object(websocket_handler, "manager", manager), \
+                patch.object(websocket_handler, "store", LiveSessionStore()):
+            host, player = await self._connect(manager)
+            await websocket_handler.handle_participant_message(
+                "ABCDE", "5", {"type": "submit_answer", "question_id": 3, "answer": "4"}
+            )
+            await drain(manager)
+        assert events(player) == [{"type": "answer_rejected", "question_id": 3}]
+        assert len(events(host)) == 1  # only the join notification
+
+
+@pytest.mark.asyncio
+class TestHandleHostMessage:
+
+    async def test_score_answer_broadcasts_leaderboard_from_memory(self):
+        manager, written = ConnectionManager(), []
+        store = live_store(written)
+        open_question(store).submit_answer(5, 3, "wrong")
+        with patch.object(websocket_handler, "manager", manager), patch.object(websocket_handler, "store", store):
+            host = FakeWebSocket()
+            await manager.connect_host("ABCDE", host)
+            await websocket_handler.handle_host_message(
+                "ABCDE", {"type": "score_answer", "participant_id": "5", "question_id": 3, "score": 7}
+            )
+            await drain(manager)
+        assert events(host)[-1] == {
+            "type": "leaderboard_update",
+            "leaderboard": [{"rank": 1, "participant_id": 5, "name": "Bob", "total_score": 7}],
+            "participants": 1
+        }
+
+    async def test_score_answer_rejects_invalid_score(self):
+        manager, written = ConnectionManager(), []
+        store = live_store(written)
+        live  = open_question(store)
+        live.submit_answer(5, 3, "wrong")
+        with patch.object(websocket_handler, "manager", manager), patch.object(websocket_handler, "store", store):
+            host = FakeWebSocket()
+            await manager.connect_host("ABCDE", host)
+            for score in (2.5, "7", True):
+                await websocket_handler.handle_host_message(
+                    "ABCDE", {"type": "score_answer", "participant_id": "5", "question_id": 3, "score": score}
+                )
+            await drain(manager)
+        assert events(host) == [{"type": "error", "message": "Invalid score"}] * 3
+        assert live.answers[(5, 3)] == 0 and live.rank(5) == 1
+
+    async def test_only_participants_whose_rank_changed_get_a_personal_frame(self):
+        manager, written = ConnectionManager(), []
+        store = live_store(written)
+        live  = open_question(store)
+        live.add_participant(6, "Carol")
+        live.add_participant(8, "Dave")
+        with patch.object(websocket_handler, "manager", manager), patch.object(websocket_handler, "store", store):
+            players = {pid: FakeWebSocket() for pid in ("5", "6", "8")}
+            for pid, ws in players.items():
+                await manager.connect_participant("ABCDE", pid, ws)
+            await websocket_handler.broadcast_leaderboard("ABCDE", live)
+            await drain(manager)  # unsent leaderboard frames would be coalesced
+            live.submit_answer(6, 3, "4")
+            await websocket_handler.broadcast_leaderboard("ABCDE", live)
+            await drain(manager)
+
+        personal = {pid: [m for m in events(ws) if m["type"] == "leaderboard_rank"] for pid, ws in players.items()}
+        assert personal["5"] == [
+            {"type": "leaderboard_rank", "rank": 1, "total_score": 0, "delta": 0},
+            {"type": "leaderboard_rank", "rank": 2, "total_score": 0, "delta": 0},
+        ]
+        assert personal["6"][-1] == {"type": "leaderboard_rank", "rank": 1, "total_score": 10, "delta": 10}
+        assert len(personal["8"]) == 1  # still last, nothing new to tell
+        assert all(len([m for m in events(ws) if m["type"] == "leaderboard_update"]) == 2 for ws in players.values())
+
+    async def test_next_question_advances_index(self):
+        manager, written = ConnectionManager(), []
+        store = live_store(written)
+        with patch.object(websocket_handler, "manager", manager), patch.object(websocket_handler, "store", store):
+            player = FakeWebSocket()
+            await manager.connect_participant("ABCDE", "5", player)
+            for _ in range(2):
+                await websocket_handler.handle_host_message("ABCDE", {"type": "next_question"})
+            await drain(manager)
+        assert [m["question_index"] for m in events(player)] == [0, 1]
+
+    async def test_next_question_rejects_invalid_index(self):
+        manager, written = ConnectionManager(), []
+        store = live_store(written)
+        with patch.object(websocket_handler, "manager", manager), patch.object(websocket_handler, "store", store):
+            host, player = FakeWebSocket(), FakeWebSocket()
+            await manager.connect_host("ABCDE", host)
+            await manager.connect_participant("ABCDE", "5", player)
+            for index in (1, -1, "0", True, 0.0):
+                await websocket_handler.handle_host_message("ABCDE", {"type": "next_question", "index": index})
+            await drain(manager)
+        assert events(host)[1:] == [{"type": "error", "message": "Invalid question index"}] * 5
+        assert events(player) == [] and not store.get("ABCDE").started
+
+    async def test_next_question_sends_the_deck(self):
+        manager, written = ConnectionManager(), []
+        store = live_store(written)
+        live  = store.get("ABCDE")
+        view  = {"id": 3, "content": "2+2?"}
+        live.questions[3] = live.questions[3]._replace(
+            view=Preencoded(view), host_view=Preencoded({**view, "correct_answer": "4"})
+        )
+        with patch.object(websocket_handler, "manager", manager), patch.object(websocket_handler, "store", store):
+            host, player = FakeWebSocket(), FakeWebSocket()
+            await manager.connect_host("ABCDE", host)
+            await manager.connect_participant("ABCDE", "5", player)
+            await websocket_handler.handle_host_message("ABCDE", {"type": "next_question", "index": 0})
+            await drain(manager)
+            resumed = websocket_handler.snapshot(live, "5")
+        assert events(player) == [{"type": "question_start", "question_index": 0, "question": view}]
+        assert events(host)[-1]["question"] == {**view, "correct_answer": "4"}
+        assert live.question == view and resumed["question"].value == view
+
+    async def test_media_of_the_next_question_is_prefetched(self):
+        manager, written, timers = ConnectionManager(), [], TimingWheel(tick=0.01)
+        store = live_store(written)
+        live  = store.get("ABCDE")
+        media = {"id": 4, "media_url": "/media/cat.png", "media_type": "image"}
+        live.questions[4] = LiveQuestion(4, 1, "cat", 10, 30, Preencoded(media), Preencoded(media))
+        live.question_order.append(4)
+        with patch.object(websocket_handler, "manager", manager), patch.object(websocket_handler, "store", store), \
+                patch.object(websocket_handler, "timers", timers), \
+                patch.object(websocket_handler.media.files, "warm") as warm:
+            player = FakeWebSocket()
+            await manager.connect_participant("ABCDE", "5", player)
+            await websocket_handler.handle_host_message("ABCDE", {"type": "next_question"})
+            await asyncio.sleep(0.05)
+            await drain(manager)
+            await timers.close()
+        warm.assert_called_once_with("/media/cat.png")
+        assert events(player)[-1] == {
+            "type": "prefetch", "question_index": 1, "media_url": "/media/cat.png", "media_type": "image"
+        }
+
+    async def test_question_ends_when_its_time_is_up(self):
+        manager, written, timers = ConnectionManager(), [], TimingWheel(tick=0.01)
+        store = live_store(written)
+        live  = store.get("ABCDE")
+        live.questions[3] = live.questions[3]._replace(time_limit=0.05)
+        with patch.object(websocket_handler, "manager", manager), patch.object(websocket_handler, "store", store), \
+                patch.object(websocket_handler, "timers", timers):
+            host, player = FakeWebSocket(), FakeWebSocket()
+            await manager.connect_host("ABCDE", host)
+            await manager.connect_participant("ABCDE", "5", player)
+            await websocket_handler.handle_host_message("ABCDE", {"type": "next_question"})
+            await websocket_handler.handle_participant_message("ABCDE", "5", {"type": "submit_answer", "question_id": 3, "answer": "4"})
+            await asyncio.sleep(0.1)
+            await drain(manager)
+            await timers.close()
+
+        end = {"type": "question_end", "question_index": 0, "question_id": 3, "answer_count": 1}
+        assert end in events(host)
+        assert live.question_timer is None
+        # the grading of the question is written when it ends, which acknowledges the answer
+        assert events(player)[-2:] == [end, {"type": "answer_received", "question_id": 3}]
+        assert [[c["score_deltas"] for c in changes] for changes in written] == [[{5: 10}]]
+
+    async def test_question_timer_is_cancelled_when_the_host_moves_on(self):
+        manager, written, timers = ConnectionManager(), [], TimingWheel()
+        store = live_store(written)
+        live  = store.get("ABCDE")
+        with patch.object(websocket_handler, "manager", manager), patch.object(websocket_handler, "store", store), \
+                patch.object(websocket_handler, "timers", timers):
+            await websocket_handler.handle_host_message("ABCDE", {"type": "next_question"})
+            first = live.question_timer
+            await websocket_handler.handle_host_message("ABCDE", {"type": "next_question", "index": 0})
+            assert first.cancelled and len(timers) == 1
+            await websocket_handler.end_question("ABCDE", 1)  # stale, the session is at question 0
+            await websocket_handler.handle_host_message("ABCDE", {"type": "end_session"})
+            assert len(timers) == 0
+            await timers.close()
+
+    async def test_end_session_flushes_before_announcing(self):
+        manager, written = ConnectionManager(), []
+        store = live_store(written)
+        open_question(store).submit_answer(5, 3, "4")
+        with patch.object(websocket_handler, "manager", manager), patch.object(websocket_handler, "store", store):
+            player = FakeWebSocket()
+            await manager.connect_participant("ABCDE", "5", player)
+            await websocket_handler.handle_host_message("ABCDE", {"type": "end_session"})
+            await drain(manager)
+        assert len(written) == 1 and written[0][0]["answers"][0]["score"] == 10
+        store._end.assert_called_once_with(7)
+        assert store.get("ABCDE") is None
+        assert events(player) == [{"type": "session_ended"}]
+        assert player.closed_with == 1000 and manager.sessions == {} and manager.connections == {}
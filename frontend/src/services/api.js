@@ -65,6 +65,15 @@ export const quizApi = {
     })
   },
   
+  // Create a quiz with all its questions in one request
+  createQuizWithQuestions(title, description, questions) {
+    return api.post('/quizzes/bulk', {
+      title,
+      description,
+      questions
+    })
+  },
+  
   // Update a quiz
   updateQuiz(quiz_id, title, description, is_published) {
     return api.put(`/quizzes/${quiz_id}`, {
@@ -74,6 +83,21 @@ export const quizApi = {
     })
   },
   
+  // Save a quiz and replace its questions in one request
+  saveQuiz(quiz_id, title, description, is_published, questions) {
+    return api.put(`/quizzes/${quiz_id}/bulk`, {
+      title,
+      description,
+      is_published,
+      questions
+    })
+  },
+  
+  // Get the questions of a quiz, in order
+  getQuestions(quiz_id) {
+    return api.get(`/quizzes/${quiz_id}/questions`)
+  },
+  
   // Delete a quiz
   deleteQuiz(id) {
     return api.delete(`/quizzes/${id}`)
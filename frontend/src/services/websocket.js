@@ -1,15 +1,23 @@
 // WebSocket service for real-time quiz sessions
+import { encode, decode } from '@msgpack/msgpack'
+
+// Wire encoding offered to the server: 'msgpack' (compact binary frames) or 'json'
+const WS_ENCODING = import.meta.env.VITE_WS_ENCODING || 'json'
+
 class WebSocketService {
   constructor() {
     this.ws = null
-    this.reconnectInterval = 3000
+    this.workerUrl = null  // set when the server redirects us to the worker owning the session
+    this.reconnectInterval = 1000  // base delay, doubled on every attempt
+    this.maxReconnectInterval = 30000
     this.reconnectAttempts = 0
-    this.maxReconnectAttempts = 5
+    this.maxReconnectAttempts = 8
+    this.lastSeq = null  // sequence number of the last session event received
     this.messageHandlers = new Map()
   }
 
   connect(sessionCode, participantName = null, isHost = false) {
-    const WS_URL = import.meta.env.VITE_WS_URL || 'ws://localhost:8000'
+    const WS_URL = this.workerUrl || import.meta.env.VITE_WS_URL || 'ws://localhost:8000'
     const token = localStorage.getItem('authToken')
     
     let wsUrl = `${WS_URL}/ws/session/${sessionCode}`
@@ -18,9 +26,20 @@ class WebSocketService {
       wsUrl += `?token=${token}`
     } else if (participantName) {
       wsUrl += `?name=${encodeURIComponent(participantName)}`
+      // Picks up where we left off as the same participant after a dropped connection
+      const resumeToken = sessionStorage.getItem(`resumeToken:${sessionCode}`)
+      if (resumeToken) {
+        wsUrl += `&resume=${encodeURIComponent(resumeToken)}`
+      }
+    }
+    if (this.lastSeq !== null) {
+      wsUrl += `${wsUrl.includes('?') ? '&' : '?'}last_seq=${this.lastSeq}`
     }
 
-    this.ws = new WebSocket(wsUrl)
+    // JSON stays the fallback when the server does not speak MessagePack
+    const protocols = WS_ENCODING === 'msgpack' ? ['quiz.msgpack', 'quiz.json'] : ['quiz.json']
+    this.ws = new WebSocket(wsUrl, protocols)
+    this.ws.binaryType = 'arraybuffer'
 
     this.ws.onopen = () => {
       console.log('WebSocket connected')
@@ -29,8 +48,46 @@ class WebSocketService {
 
     this.ws.onmessage = (event) => {
       try {
-        const data = JSON.parse(event.data)
-        this.handleMessage(data)
+        const data = typeof event.data === 'string'
+          ? JSON.parse(event.data)
+          : decode(new Uint8Array(event.data))
+        // Bursts of notices arrive batched in one array frame
+        const messages = Array.isArray(data) ? data : [data]
+        for (const message of messages) {
+          if (message.type === 'ping') {
+            // Heartbeat, the server reaps connections that stay silent
+            this.send('pong')
+            continue
+          }
+          if (message.type === 'redirect') {
+            // The session lives on another worker, reconnect there right away
+            this.workerUrl = message.url
+            this.reconnectAttempts = 0
+            this.ws.onclose = () => this.connect(sessionCode, participantName, isHost)
+            return
+          }
+          if (message.type === 'welcome') {
+            if (message.resume_token) {
+              sessionStorage.setItem(`resumeToken:${sessionCode}`, message.resume_token)
+            }
+            // A welcome without seq is a resumed connection, the missed events follow
+            if (message.seq !== undefined) {
+              this.lastSeq = message.seq
+            }
+          } else if (message.type === 'snapshot') {
+            // Replaces everything missed, later events follow on from it
+            this.lastSeq = message.seq
+          } else if (message.seq !== undefined) {
+            if (this.lastSeq !== null && message.seq <= this.lastSeq) {
+              continue  // already seen before the reconnect
+            }
+            this.lastSeq = message.seq
+          }
+          if (message.type === 'prefetch') {
+            this.prefetchMedia(message)
+          }
+          this.handleMessage(message)
+        }
       } catch (error) {
         console.error('Failed to parse WebSocket message:', error)
       }
@@ -46,14 +103,34 @@ class WebSocketService {
     }
   }
 
+  // Fetch the media of the next question while the current one runs, so it shows right away
+  prefetchMedia({ media_url: url, media_type: type }) {
+    if (!url) {
+      return
+    }
+    // Embeds load their own media, only the connection to them can be set up ahead of time
+    const embed = type === 'youtube' || type === 'spotify'
+    const href = embed ? new URL(url, window.location.href).origin : url
+    if (document.querySelector(`link[href="${CSS.escape(href)}"]`)) {
+      return
+    }
+    const link = document.createElement('link')
+    link.rel = embed ? 'preconnect' : 'prefetch'
+    link.href = href
+    document.head.appendChild(link)
+  }
+
   attemptReconnect(sessionCode, participantName, isHost) {
     if (this.reconnectAttempts < this.maxReconnectAttempts) {
       this.reconnectAttempts++
-      console.log(`Attempting to reconnect... (${this.reconnectAttempts}/${this.maxReconnectAttempts})`)
-      
+      // Exponential backoff with full jitter, so a restart does not bring every client back at once
+      const ceiling = Math.min(this.maxReconnectInterval, this.reconnectInterval * 2 ** (this.reconnectAttempts - 1))
+      const delay = Math.random() * ceiling
+      console.log(`Attempting to reconnect in ${Math.round(delay)}ms... (${this.reconnectAttempts}/${this.maxReconnectAttempts})`)
+
       setTimeout(() => {
         this.connect(sessionCode, participantName, isHost)
-      }, this.reconnectInterval)
+      }, delay)
     } else {
       console.error('Max reconnect attempts reached')
       this.handleMessage({ type: 'connection_lost' })
@@ -65,12 +142,15 @@ class WebSocketService {
       this.ws.close()
       this.ws = null
     }
+    this.workerUrl = null
+    this.lastSeq = null
     this.messageHandlers.clear()
   }
 
   send(type, data = {}) {
     if (this.ws && this.ws.readyState === WebSocket.OPEN) {
-      this.ws.send(JSON.stringify({ type, ...data }))
+      const message = { type, ...data }
+      this.ws.send(this.ws.protocol === 'quiz.msgpack' ? encode(message) : JSON.stringify(message))
     } else {
       console.error('WebSocket is not connected')
     }